@@ -1,12 +1,110 @@
 # -*- coding: utf-8 -*-
 import os
+import inspect
 import logging
+import threading
 import google.generativeai as genai
+from google.generativeai.types import generation_types
 
 # --- Variáveis globais ---
 NOME_MODELO_GEMMA = 'gemma-3-27b-it'  # Nova versão Gemma 3 com 27B parâmetros
-PAUSA_ENTRE_CHAMADAS_IA = 5
-PAUSA_ENTRE_ARQUIVOS = 10
+# Orçamento de uso da API (compartilhado por todas as chamadas de IA do processo)
+LIMITE_REQUISICOES_POR_MINUTO = 30
+LIMITE_TOKENS_POR_MINUTO = 15000
+# Clientes do modelo: um GenerativeModel por finalidade, compartilhado entre threads
+TRANSPORTE_IA = 'grpc'  # Um canal gRPC (HTTP/2 multiplexado) reaproveitado por todas as chamadas
+TIMEOUT_CHAMADA_IA_SEGUNDOS = 120  # Tempo máximo de cada chamada (se o SDK instalado suportar)
+# Esquemas das respostas JSON (subconjunto de JSON Schema/OpenAPI): enviados à API como response_schema
+# quando o SDK e o modelo suportam e sempre usados para ajustar a resposta interpretada
+_TEXTO_OPCIONAL = {'type': 'string', 'nullable': True}
+ESQUEMA_DADOS_CV = {
+    'type': 'object',
+    'properties': {
+        'nome_completo': _TEXTO_OPCIONAL,
+        'email': _TEXTO_OPCIONAL,
+        'telefone': _TEXTO_OPCIONAL,
+        'localizacao': _TEXTO_OPCIONAL,
+        'linkedin_url': _TEXTO_OPCIONAL,
+        'anos_experiencia_total': {'type': 'number', 'nullable': True},
+        'cargo_atual_ou_ultimo': _TEXTO_OPCIONAL,
+        'nivel_escolaridade_max': _TEXTO_OPCIONAL,
+        'habilidades_tecnicas': {'type': 'array', 'items': {'type': 'string'}},
+        'idiomas': {'type': 'array', 'items': {'type': 'object', 'properties': {'idioma': {'type': 'string'}, 'nivel': _TEXTO_OPCIONAL}}},
+    },
+}
+ESQUEMA_EXTRACAO_LOTE = {
+    'type': 'array',
+    'items': {'type': 'object', 'properties': {'file_id': {'type': 'integer'}, **ESQUEMA_DADOS_CV['properties']}},
+}
+ESQUEMA_KEYWORDS = {'type': 'array', 'items': {'type': 'string'}}
+ESQUEMA_ANALISE_UNIFICADA = {
+    'type': 'object',
+    'properties': {'dados': ESQUEMA_DADOS_CV, 'relatorio': _TEXTO_OPCIONAL, 'keywords': ESQUEMA_KEYWORDS},
+}
+CONFIGS_GERACAO_IA = {
+    'padrao': {},
+    'extracao': {'temperature': 0.1, 'max_output_tokens': 2048, 'response_mime_type': 'application/json', 'response_schema': ESQUEMA_DADOS_CV},
+    'extracao_lote': {'temperature': 0.1, 'max_output_tokens': 6144, 'response_mime_type': 'application/json', 'response_schema': ESQUEMA_EXTRACAO_LOTE},
+    'analise_unificada': {'temperature': 0.2, 'max_output_tokens': 6144, 'response_mime_type': 'application/json', 'response_schema': ESQUEMA_ANALISE_UNIFICADA},
+    'relatorio': {'temperature': 0.4, 'max_output_tokens': 4096},
+    'palavras_chave': {'temperature': 0.1, 'max_output_tokens': 256, 'response_mime_type': 'application/json', 'response_schema': ESQUEMA_KEYWORDS},
+    'url': {'temperature': 0.0, 'max_output_tokens': 256},
+    'resumo_web': {'temperature': 0.3, 'max_output_tokens': 1024},
+    'chat': {'temperature': 0.4, 'max_output_tokens': 2048},
+}
+# Análise unificada: dados, relatório e keywords da pesquisa web em uma única chamada por CV
+ANALISE_UNIFICADA = False  # Padrão quando o upload não informa 'analise_unificada'
+# Extração agrupada: CVs curtos do lote enviados juntos em uma única chamada de extração
+EXTRACAO_AGRUPADA_ATIVA = True
+MAX_CARACTERES_CV_AGRUPADO = 6000  # CVs maiores que isso são extraídos individualmente
+MAX_CVS_POR_EXTRACAO_AGRUPADA = 5
+ORCAMENTO_TOKENS_EXTRACAO_AGRUPADA = 6000  # Soma estimada dos textos dos CVs de uma chamada
+# Novas tentativas em erros 429 (backoff exponencial com jitter)
+MAX_TENTATIVAS_IA = 5
+BACKOFF_BASE_SEGUNDOS = 2
+BACKOFF_MAX_SEGUNDOS = 60
+# Extração de texto (PDF/DOCX) em pool de processos
+NORMALIZAR_TEXTO_CV = True  # Remove cabeçalhos/rodapés repetidos, números de página, hifenização e espaços extras
+MAX_PROCESSOS_EXTRACAO = 4
+TIMEOUT_EXTRACAO_SEGUNDOS = 60  # Tempo máximo para extrair um arquivo
+LIMITE_MEMORIA_EXTRACAO_MB = 1024  # Limite de memória de cada processo de extração (apenas Unix)
+PAGINAS_POR_TAREFA_PDF = 10  # PDFs maiores que isso são extraídos em intervalos de páginas em paralelo
+# Cache de análises (evita chamar a IA de novo para CVs já analisados)
+VERSAO_PROMPTS = '1'  # Incrementar ao alterar os prompts de extração/relatório/pesquisa
+CACHE_ANALISES_ATIVO = True
+CACHE_MAX_BYTES = 100 * 1024 * 1024
+CACHE_MAX_IDADE_DIAS = 30
+# Leitura de ZIPs: membros lidos direto do arquivo, sem extração para o disco
+EXTRAIR_ZIP_EM_MEMORIA = True
+ZIP_MAX_BYTES_MEMBRO = 20 * 1024 * 1024  # Tamanho máximo descompactado de cada CV dentro do ZIP
+ZIP_MAX_BYTES_TOTAL = 200 * 1024 * 1024  # Tamanho máximo descompactado de todo o ZIP
+ZIP_MAX_TAXA_COMPRESSAO = 100  # Taxa de compressão acima disso é tratada como zip bomb
+# Migrações do banco: preenchimento de dados em lotes, em segundo plano
+TAMANHO_LOTE_BACKFILL = 500
+INTERVALO_BACKFILL_SEGUNDOS = 0.05  # Pausa entre lotes (libera o banco para as requisições)
+# Pool de conexões com o SQLite
+TAMANHO_POOL_CONEXOES = 8
+TIMEOUT_POOL_CONEXOES_SEGUNDOS = 30  # Espera máxima por uma conexão livre
+SQLITE_CACHED_STATEMENTS = 128  # Statements compilados mantidos por conexão
+SQLITE_BUSY_TIMEOUT_MS = 5000  # Quanto uma conexão espera por um lock do SQLite antes de falhar
+# Execução de lotes em segundo plano (independente da conexão SSE)
+MAX_LOTES_SIMULTANEOS = 1
+INTERVALO_VERIFICACAO_FILA_SEGUNDOS = 5
+INTERVALO_HEARTBEAT_LOTE_SEGUNDOS = 15  # Frequência com que o executor confirma que ainda processa os seus lotes
+LIMITE_HEARTBEAT_LOTE_SEGUNDOS = 60  # Lote 'processando' sem confirmação há mais que isso volta para a fila
+SSE_INTERVALO_KEEPALIVE_SEGUNDOS = 15  # Comentário enviado ao cliente SSE quando não há eventos novos
+# Contexto do chat: trechos dos CVs recuperados por relevância (BM25) dentro de um orçamento de tokens
+TAMANHO_TRECHO_CARACTERES = 1200
+SOBREPOSICAO_TRECHO_CARACTERES = 200
+ORCAMENTO_TOKENS_CONTEXTO_CHAT = 6000  # Parte do prompt do chat/instrução inicial reservada aos CVs
+# Orçamento de tokens dos prompts (estimativa local calibrada; sem chamadas extras à API)
+MAX_TOKENS_PROMPT_IA = 12000  # Teto de cada prompt (abaixo de LIMITE_TOKENS_POR_MINUTO, senão a chamada nunca teria orçamento)
+ORCAMENTO_TOKENS_HISTORICO_CHAT = 1500  # Parte do prompt do chat reservada ao histórico da conversa
+ORCAMENTO_TOKENS_RESUMO_WEB = 2000  # Conteúdo da página enviado para sumarização
+# Cache em memória (LRU) dos textos/contexto e do histórico de chat de cada lote
+CACHE_CONTEXTO_CHAT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_CONTEXTO_CHAT_MAX_LOTES = 32
+MAX_ARQUIVOS_PARALELOS = 3  # Quantos CVs são analisados ao mesmo tempo em um lote
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'zip'}
 CV_EXTENSIONS = {'pdf', 'docx'}
 nome_arquivo_html_formulario = "interface.html"
@@ -15,6 +113,13 @@ nome_arquivo_relatorio_saida_base = "relatorio"
 # Variável global para a biblioteca GenAI configurada
 modelo_gemini = None
 
+# Registro de clientes do modelo (finalidade -> GenerativeModel)
+_modelos_ia = {}
+_modelos_ia_lock = threading.Lock()
+# Recursos que dependem da versão instalada do google-generativeai
+_CAMPOS_GENERATION_CONFIG = set(getattr(generation_types.GenerationConfig, '__dataclass_fields__', {}))
+_SUPORTA_REQUEST_OPTIONS = 'request_options' in inspect.signature(genai.GenerativeModel.generate_content).parameters
+
 def configure_app(app):
     """Configuração da aplicação Flask"""
     # Configurações de pasta e limites
@@ -24,8 +129,50 @@ def configure_app(app):
     app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
     app.config['CV_EXTENSIONS'] = CV_EXTENSIONS
     app.config['NOME_MODELO_GEMMA'] = NOME_MODELO_GEMMA
-    app.config['PAUSA_ENTRE_CHAMADAS_IA'] = PAUSA_ENTRE_CHAMADAS_IA
-    app.config['PAUSA_ENTRE_ARQUIVOS'] = PAUSA_ENTRE_ARQUIVOS
+    app.config['LIMITE_REQUISICOES_POR_MINUTO'] = LIMITE_REQUISICOES_POR_MINUTO
+    app.config['LIMITE_TOKENS_POR_MINUTO'] = LIMITE_TOKENS_POR_MINUTO
+    app.config['TRANSPORTE_IA'] = TRANSPORTE_IA
+    app.config['TIMEOUT_CHAMADA_IA_SEGUNDOS'] = TIMEOUT_CHAMADA_IA_SEGUNDOS
+    app.config['CONFIGS_GERACAO_IA'] = CONFIGS_GERACAO_IA
+    app.config['ANALISE_UNIFICADA'] = ANALISE_UNIFICADA
+    app.config['EXTRACAO_AGRUPADA_ATIVA'] = EXTRACAO_AGRUPADA_ATIVA
+    app.config['MAX_CARACTERES_CV_AGRUPADO'] = MAX_CARACTERES_CV_AGRUPADO
+    app.config['MAX_CVS_POR_EXTRACAO_AGRUPADA'] = MAX_CVS_POR_EXTRACAO_AGRUPADA
+    app.config['ORCAMENTO_TOKENS_EXTRACAO_AGRUPADA'] = ORCAMENTO_TOKENS_EXTRACAO_AGRUPADA
+    app.config['MAX_TENTATIVAS_IA'] = MAX_TENTATIVAS_IA
+    app.config['BACKOFF_BASE_SEGUNDOS'] = BACKOFF_BASE_SEGUNDOS
+    app.config['BACKOFF_MAX_SEGUNDOS'] = BACKOFF_MAX_SEGUNDOS
+    app.config['NORMALIZAR_TEXTO_CV'] = NORMALIZAR_TEXTO_CV
+    app.config['MAX_PROCESSOS_EXTRACAO'] = MAX_PROCESSOS_EXTRACAO
+    app.config['TIMEOUT_EXTRACAO_SEGUNDOS'] = TIMEOUT_EXTRACAO_SEGUNDOS
+    app.config['LIMITE_MEMORIA_EXTRACAO_MB'] = LIMITE_MEMORIA_EXTRACAO_MB
+    app.config['PAGINAS_POR_TAREFA_PDF'] = PAGINAS_POR_TAREFA_PDF
+    app.config['VERSAO_PROMPTS'] = VERSAO_PROMPTS
+    app.config['CACHE_ANALISES_ATIVO'] = CACHE_ANALISES_ATIVO
+    app.config['CACHE_MAX_BYTES'] = CACHE_MAX_BYTES
+    app.config['CACHE_MAX_IDADE_DIAS'] = CACHE_MAX_IDADE_DIAS
+    app.config['EXTRAIR_ZIP_EM_MEMORIA'] = EXTRAIR_ZIP_EM_MEMORIA
+    app.config['ZIP_MAX_BYTES_MEMBRO'] = ZIP_MAX_BYTES_MEMBRO
+    app.config['ZIP_MAX_BYTES_TOTAL'] = ZIP_MAX_BYTES_TOTAL
+    app.config['ZIP_MAX_TAXA_COMPRESSAO'] = ZIP_MAX_TAXA_COMPRESSAO
+    app.config['TAMANHO_LOTE_BACKFILL'] = TAMANHO_LOTE_BACKFILL
+    app.config['INTERVALO_BACKFILL_SEGUNDOS'] = INTERVALO_BACKFILL_SEGUNDOS
+    app.config['TAMANHO_POOL_CONEXOES'] = TAMANHO_POOL_CONEXOES
+    app.config['TIMEOUT_POOL_CONEXOES_SEGUNDOS'] = TIMEOUT_POOL_CONEXOES_SEGUNDOS
+    app.config['SQLITE_CACHED_STATEMENTS'] = SQLITE_CACHED_STATEMENTS
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = SQLITE_BUSY_TIMEOUT_MS
+    app.config['MAX_LOTES_SIMULTANEOS'] = MAX_LOTES_SIMULTANEOS
+    app.config['INTERVALO_VERIFICACAO_FILA_SEGUNDOS'] = INTERVALO_VERIFICACAO_FILA_SEGUNDOS
+    app.config['INTERVALO_HEARTBEAT_LOTE_SEGUNDOS'] = INTERVALO_HEARTBEAT_LOTE_SEGUNDOS
+    app.config['LIMITE_HEARTBEAT_LOTE_SEGUNDOS'] = LIMITE_HEARTBEAT_LOTE_SEGUNDOS
+    app.config['SSE_INTERVALO_KEEPALIVE_SEGUNDOS'] = SSE_INTERVALO_KEEPALIVE_SEGUNDOS
+    app.config['ORCAMENTO_TOKENS_CONTEXTO_CHAT'] = ORCAMENTO_TOKENS_CONTEXTO_CHAT
+    app.config['MAX_TOKENS_PROMPT_IA'] = MAX_TOKENS_PROMPT_IA
+    app.config['ORCAMENTO_TOKENS_HISTORICO_CHAT'] = ORCAMENTO_TOKENS_HISTORICO_CHAT
+    app.config['ORCAMENTO_TOKENS_RESUMO_WEB'] = ORCAMENTO_TOKENS_RESUMO_WEB
+    app.config['CACHE_CONTEXTO_CHAT_MAX_BYTES'] = CACHE_CONTEXTO_CHAT_MAX_BYTES
+    app.config['CACHE_CONTEXTO_CHAT_MAX_LOTES'] = CACHE_CONTEXTO_CHAT_MAX_LOTES
+    app.config['MAX_ARQUIVOS_PARALELOS'] = MAX_ARQUIVOS_PARALELOS
     app.config['nome_arquivo_html_formulario'] = nome_arquivo_html_formulario
     app.config['nome_arquivo_relatorio_saida_base'] = nome_arquivo_relatorio_saida_base
     
@@ -44,8 +191,12 @@ def inicializar_modelo_gemini():
         return False
     logging.info("Chave API encontrada (Contexto 2025).")
     try:
-        # Configurar a biblioteca GenAI com a chave de API
-        genai.configure(api_key=api_key)
+        # Configurar a biblioteca GenAI com a chave de API (um único transporte para todo o processo)
+        genai.configure(api_key=api_key, transport=TRANSPORTE_IA)
+        with _modelos_ia_lock:
+            _modelos_ia.clear()  # Clientes criados com a configuração anterior
+        if not _SUPORTA_REQUEST_OPTIONS:
+            logging.warning("SDK google-generativeai instalado não aceita timeout por chamada; TIMEOUT_CHAMADA_IA_SEGUNDOS ignorado.")
         
         # Verificar se podemos acessar modelos (teste de validação)
         models = genai.list_models()
@@ -64,4 +215,37 @@ def inicializar_modelo_gemini():
 def get_modelo_gemini():
     """Retorna a instância global da biblioteca GenAI configurada"""
     global modelo_gemini
-    return modelo_gemini
\ No newline at end of file
+    return modelo_gemini
+
+def _config_geracao(nome_modelo, config):
+    """Filtra a configuração de geração para o que o SDK instalado e o modelo aceitam."""
+    config = {chave: valor for chave, valor in config.items() if chave in _CAMPOS_GENERATION_CONFIG}
+    if 'gemma' in nome_modelo.lower():
+        # Modelos Gemma não têm o modo JSON da API: o esquema vale só para ajustar a resposta interpretada
+        config.pop('response_mime_type', None)
+        config.pop('response_schema', None)
+    return config
+
+def obter_modelo_ia(finalidade='padrao'):
+    """
+    Retorna o cliente do modelo para uma finalidade (extracao, relatorio, chat...), criado uma única vez
+    com a configuração de geração correspondente e compartilhado entre as threads.
+    """
+    modelo = _modelos_ia.get(finalidade)
+    if modelo is None:
+        with _modelos_ia_lock:
+            modelo = _modelos_ia.get(finalidade)
+            if modelo is None:
+                if finalidade not in CONFIGS_GERACAO_IA:
+                    logging.warning(f"Finalidade de IA desconhecida '{finalidade}'; usando a configuração padrão.")
+                config = _config_geracao(NOME_MODELO_GEMMA, CONFIGS_GERACAO_IA.get(finalidade, {}))
+                modelo = genai.GenerativeModel(NOME_MODELO_GEMMA, generation_config=config or None)
+                _modelos_ia[finalidade] = modelo
+                logging.info(f"Cliente do modelo '{NOME_MODELO_GEMMA}' criado para '{finalidade}' ({config or 'configuração padrão'}).")
+    return modelo
+
+def opcoes_chamada_ia():
+    """Argumentos extras de generate_content: timeout por chamada, quando o SDK suporta."""
+    if _SUPORTA_REQUEST_OPTIONS and TIMEOUT_CHAMADA_IA_SEGUNDOS:
+        return {'request_options': {'timeout': TIMEOUT_CHAMADA_IA_SEGUNDOS}}
+    return {}
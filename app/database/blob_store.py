@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Armazenamento de textos grandes (texto dos CVs, resumos da web) fora das tabelas principais.
+Cada texto é gravado uma única vez na tabela `blobs`, comprimido e endereçado pelo seu SHA-256;
+as demais tabelas guardam apenas o hash. Textos iguais (ex.: o mesmo CV em file_texts e results)
+ocupam espaço uma vez só.
+"""
+import zlib
+import hashlib
+
+try:
+    import zstandard  # Opcional: comprime melhor e mais rápido que o zlib
+except ImportError:
+    zstandard = None
+
+NIVEL_ZLIB = 6
+NIVEL_ZSTD = 10
+
+def comprimir_texto(texto):
+    """Retorna (codec, dados comprimidos), usando zstd se estiver instalado e zlib caso contrário."""
+    dados = texto.encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=NIVEL_ZSTD).compress(dados)
+    return 'zlib', zlib.compress(dados, NIVEL_ZLIB)
+
+def descomprimir_texto(codec, dados):
+    if codec == 'zlib':
+        return zlib.decompress(dados).decode('utf-8')
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Blob comprimido com zstd, mas o pacote 'zstandard' não está instalado.")
+        return zstandard.ZstdDecompressor().decompress(dados).decode('utf-8')
+    if codec == 'raw':
+        return dados.decode('utf-8')
+    raise ValueError(f"Codec de blob desconhecido: {codec}")
+
+def calcular_hash_blob(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def gravar_blob(cursor, texto):
+    """
+    Grava o texto (se ainda não existir) e retorna o seu hash; None para texto vazio/ausente.
+    Não faz commit: a gravação entra na mesma transação de quem guarda a referência.
+    """
+    if not texto:
+        return None
+    blob_hash = calcular_hash_blob(texto)
+    cursor.execute("SELECT 1 FROM blobs WHERE blob_hash = ?", (blob_hash,))
+    if cursor.fetchone() is None:
+        codec, dados = comprimir_texto(texto)
+        cursor.execute(
+            'INSERT OR IGNORE INTO blobs (blob_hash, codec, dados, tamanho_original, tamanho_comprimido) VALUES (?, ?, ?, ?, ?)',
+            (blob_hash, codec, dados, len(texto), len(dados))
+        )
+    return blob_hash
+
+def ler_blob(cursor, blob_hash):
+    """Texto de um blob (None se o hash for None ou não existir)."""
+    if not blob_hash:
+        return None
+    cursor.execute("SELECT codec, dados FROM blobs WHERE blob_hash = ?", (blob_hash,))
+    row = cursor.fetchone()
+    return descomprimir_texto(row[0], row[1]) if row else None
+
+def ler_blobs(cursor, hashes):
+    """Lê vários blobs de uma vez. Retorna {hash: texto}."""
+    hashes = list({h for h in hashes if h})
+    textos = {}
+    for i in range(0, len(hashes), 500):  # Limite de parâmetros por consulta do SQLite
+        parte = hashes[i:i + 500]
+        cursor.execute(f"SELECT blob_hash, codec, dados FROM blobs WHERE blob_hash IN ({','.join('?' * len(parte))})", parte)
+        for row in cursor.fetchall():
+            textos[row[0]] = descomprimir_texto(row[1], row[2])
+    return textos
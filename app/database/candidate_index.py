@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Campos estruturados dos CVs (JSON de extrair_dados_com_ia) normalizados em tabelas indexadas:
+candidates (experiência numérica, escolaridade como nível ordenável, localização),
+skills + candidate_skills (muitos-para-muitos) e candidate_languages.
+Permite filtrar candidatos com buscas em índices em vez de ler e interpretar cada data_json.
+"""
+import re
+import json
+from app.database.search_index import remover_acentos
+
+# Nível de escolaridade -> valor ordenável (filtro "no mínimo Mestrado" = nivel >= 6)
+NIVEIS_ESCOLARIDADE = {
+    'fundamental': 1,
+    'medio': 2,
+    'tecnico': 3,
+    'graduacao': 4,
+    'pos-graduacao': 5,
+    'mestrado': 6,
+    'doutorado': 7,
+}
+
+# Trechos (sem acento, minúsculos) reconhecidos em cada nível; testados do mais alto para o mais baixo
+_PADROES_ESCOLARIDADE = (
+    (7, ('doutor', 'phd', 'ph.d', 'pos-doc', 'pos doc')),
+    (6, ('mestrad', 'mestre', 'master', 'msc')),
+    (5, ('pos-grad', 'pos grad', 'posgrad', 'especializ', 'mba', 'lato sensu')),
+    (4, ('graduac', 'superior', 'bacharel', 'licenciatura', 'tecnolog', 'engenhari')),
+    (3, ('tecnic',)),
+    (2, ('medio', 'ensino medio', '2o grau', 'segundo grau')),
+    (1, ('fundamental',)),
+)
+
+NIVEIS_IDIOMA = {
+    'basico': 1,
+    'intermediario': 2,
+    'avancado': 3,
+    'fluente': 4,
+    'nativo': 5,
+}
+
+def normalizar_termo(texto):
+    """Forma canônica para comparação: sem acentos, minúsculas e espaços colapsados (mantém + # . de C++, C#, .NET)."""
+    texto = remover_acentos(str(texto or '')).lower()
+    texto = re.sub(r'[^\w+#.\- ]', ' ', texto)
+    return " ".join(texto.split()).strip('.- ')
+
+def nivel_escolaridade(valor):
+    """Converte o texto da escolaridade (ou o nome/valor de um nível) no nível ordenável; None se não reconhecido."""
+    if valor is None:
+        return None
+    if isinstance(valor, int) or str(valor).isdigit():
+        return int(valor)
+    termo = normalizar_termo(valor)
+    if termo in NIVEIS_ESCOLARIDADE:
+        return NIVEIS_ESCOLARIDADE[termo]
+    for nivel, padroes in _PADROES_ESCOLARIDADE:
+        if any(p in termo for p in padroes):
+            return nivel
+    return None
+
+def nome_escolaridade(nivel):
+    for nome, valor in NIVEIS_ESCOLARIDADE.items():
+        if valor == nivel:
+            return nome
+    return None
+
+def nivel_idioma(valor):
+    """Nível de proficiência ordenável (Básico=1 ... Nativo=5); None se não reconhecido."""
+    if valor is None:
+        return None
+    if isinstance(valor, int) or str(valor).isdigit():
+        return int(valor)
+    termo = normalizar_termo(valor)
+    for nome, nivel in NIVEIS_IDIOMA.items():
+        if nome[:5] in termo:
+            return nivel
+    return None
+
+def _anos_experiencia(valor):
+    try:
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        encontrado = re.search(r'\d+(?:[.,]\d+)?', str(valor))
+        return float(encontrado.group(0).replace(',', '.')) if encontrado else None
+
+def indexar_candidato(cursor, result_id, file_id, batch_id, dados):
+    """Grava os campos estruturados de um resultado. Não faz commit (mesma transação do resultado)."""
+    if isinstance(dados, str):
+        try:
+            dados = json.loads(dados)
+        except ValueError:
+            dados = None
+    dados = dados if isinstance(dados, dict) else {}
+    localizacao = dados.get('localizacao')
+    cursor.execute(
+        "INSERT OR REPLACE INTO candidates (result_id, file_id, batch_id, nome, anos_experiencia, nivel_escolaridade, localizacao, localizacao_normalizada) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (result_id, file_id, batch_id, dados.get('nome_completo'), _anos_experiencia(dados.get('anos_experiencia_total')),
+         nivel_escolaridade(dados.get('nivel_escolaridade_max')), localizacao, normalizar_termo(localizacao) if localizacao else None)
+    )
+    
+    habilidades = dados.get('habilidades_tecnicas') or []
+    for habilidade in (habilidades if isinstance(habilidades, list) else [habilidades]):
+        termo = normalizar_termo(habilidade)
+        if not termo:
+            continue
+        cursor.execute("INSERT OR IGNORE INTO skills (nome, nome_normalizado) VALUES (?, ?)", (str(habilidade).strip(), termo))
+        cursor.execute("SELECT skill_id FROM skills WHERE nome_normalizado = ?", (termo,))
+        cursor.execute("INSERT OR IGNORE INTO candidate_skills (skill_id, result_id) VALUES (?, ?)", (cursor.fetchone()[0], result_id))
+        
+    idiomas = dados.get('idiomas') or []
+    for idioma in (idiomas if isinstance(idiomas, list) else []):
+        if isinstance(idioma, dict) and idioma.get('idioma'):
+            cursor.execute(
+                "INSERT OR REPLACE INTO candidate_languages (idioma, result_id, nivel) VALUES (?, ?, ?)",
+                (normalizar_termo(idioma['idioma']), result_id, nivel_idioma(idioma.get('nivel')))
+            )
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de trechos dos CVs para o contexto do chat.
+Cada texto é dividido em trechos de ~TAMANHO_TRECHO_CARACTERES (com sobreposição, cortados em quebras de
+linha/espaços); cv_chunks guarda apenas a posição do trecho no texto (que já está na tabela de blobs) e
+o índice FTS5 contentless cv_chunks_fts permite escolher os trechos mais relevantes para cada pergunta (bm25).
+"""
+import re
+from app.config import TAMANHO_TRECHO_CARACTERES, SOBREPOSICAO_TRECHO_CARACTERES
+from app.database.search_index import remover_acentos
+
+# Palavras comuns nas perguntas do chat que não ajudam a escolher trechos
+PALAVRAS_IGNORADAS = {
+    'a', 'o', 'as', 'os', 'um', 'uma', 'uns', 'umas', 'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na', 'nos', 'nas',
+    'e', 'ou', 'que', 'qual', 'quais', 'quem', 'como', 'com', 'sem', 'para', 'por', 'pelo', 'pela', 'se', 'ao', 'aos',
+    'me', 'mais', 'menos', 'tem', 'ter', 'possui', 'possuem', 'sao', 'ser', 'esta', 'este', 'isso', 'sobre', 'entre',
+    'candidato', 'candidatos', 'candidata', 'candidatas', 'cv', 'cvs', 'curriculo', 'curriculos', 'lista', 'liste',
+}
+
+def dividir_em_trechos(texto, tamanho=TAMANHO_TRECHO_CARACTERES, sobreposicao=SOBREPOSICAO_TRECHO_CARACTERES):
+    """Retorna as posições (inicio, fim) dos trechos do texto, cortando de preferência em quebras de linha."""
+    trechos = []
+    inicio, total = 0, len(texto or "")
+    while inicio < total:
+        fim = min(inicio + tamanho, total)
+        if fim < total:
+            # Recua até uma quebra de linha (ou espaço) na segunda metade do trecho
+            corte = texto.rfind('\n', inicio + tamanho // 2, fim)
+            if corte == -1:
+                corte = texto.rfind(' ', inicio + tamanho // 2, fim)
+            if corte != -1:
+                fim = corte + 1
+        if texto[inicio:fim].strip():
+            trechos.append((inicio, fim))
+        if fim >= total:
+            break
+        inicio = max(fim - sobreposicao, inicio + 1)
+        # Começa o próximo trecho no início de uma palavra
+        espaco = texto.find(' ', inicio, fim)
+        if espaco != -1:
+            inicio = espaco + 1
+    return trechos
+
+def indexar_trechos(cursor, result_id, batch_id, texto):
+    """Divide o texto de um resultado em trechos e os indexa. Não faz commit (mesma transação do resultado)."""
+    for ordem, (inicio, fim) in enumerate(dividir_em_trechos(texto or "")):
+        cursor.execute(
+            "INSERT INTO cv_chunks (result_id, batch_id, ordem, inicio, fim) VALUES (?, ?, ?, ?, ?)",
+            (result_id, batch_id, ordem, inicio, fim)
+        )
+        cursor.execute("INSERT INTO cv_chunks_fts (rowid, texto) VALUES (?, ?)", (cursor.lastrowid, texto[inicio:fim]))
+    cursor.execute("UPDATE results SET indexado_trechos = 1 WHERE result_id = ?", (result_id,))
+
+def montar_consulta_trechos(pergunta):
+    """
+    Converte uma pergunta em linguagem natural em uma consulta FTS5 com OR entre os termos relevantes
+    (o bm25 favorece os trechos que contêm mais termos e os mais raros). Retorna None se não houver termos.
+    """
+    termos = []
+    for termo in re.findall(r'\w+', remover_acentos(pergunta or "").lower()):
+        if termo not in PALAVRAS_IGNORADAS and len(termo) > 1 and termo not in termos:
+            # Prefixo para palavras longas ("experiencia" encontra "experiencias")
+            termos.append(f'"{termo}"*' if len(termo) >= 4 else f'"{termo}"')
+    return " OR ".join(termos) if termos else None
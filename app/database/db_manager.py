@@ -1,81 +1,215 @@
 # -*- coding: utf-8 -*-
 import os
+import time
+import queue
 import sqlite3
 import logging
+import threading
+from contextlib import contextmanager
 from flask import g, current_app
 
+class PoolConexoes:
+    """
+    Pool de conexões SQLite compartilhado pelas threads do processo.
+    As conexões são criadas sob demanda (até `tamanho`), configuradas uma única vez
+    (pragmas, row_factory) e mantidas abertas, preservando o cache de statements
+    compilados de cada uma. Quem pede uma conexão com o pool esgotado espera até
+    `timeout_segundos`; o tempo de espera é registrado nas métricas.
+    """
+
+    def __init__(self, db_path, tamanho, timeout_segundos, busy_timeout_ms, cached_statements):
+        self.db_path = db_path
+        self.tamanho = max(1, tamanho)
+        self.timeout_segundos = timeout_segundos
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._livres = queue.LifoQueue()  # LIFO: reaproveita as conexões "quentes"
+        self._lock = threading.Lock()
+        self._criadas = 0
+        self._emprestimos = 0
+        self._esperas = 0
+        self._timeouts = 0
+        self._espera_total = 0.0
+        self._espera_maxima = 0.0
+
+    def _criar_conexao(self):
+        logging.debug(f"Pool: abrindo nova conexão com {self.db_path}")
+        db = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=self.cached_statements)
+        db.row_factory = sqlite3.Row
+        # Ajustes de desempenho (o modo WAL é persistente e definido em init_db)
+        db.execute("PRAGMA synchronous = NORMAL")  # Seguro em WAL; evita um fsync a cada commit
+        db.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        return db
+
+    def obter(self):
+        """Empresta uma conexão do pool (criando uma nova se ainda houver vaga)."""
+        inicio = time.monotonic()
+        try:
+            db = self._livres.get_nowait()
+        except queue.Empty:
+            db = None
+            with self._lock:
+                if self._criadas < self.tamanho:
+                    self._criadas += 1
+                    criar = True
+                else:
+                    criar = False
+            if criar:
+                try:
+                    db = self._criar_conexao()
+                except Exception:
+                    with self._lock:
+                        self._criadas -= 1
+                    raise
+            else:
+                try:
+                    db = self._livres.get(timeout=self.timeout_segundos)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise TimeoutError(f"Nenhuma conexão livre no pool após {self.timeout_segundos}s (tamanho {self.tamanho}).")
+        espera = time.monotonic() - inicio
+        with self._lock:
+            self._emprestimos += 1
+            if espera > 0.001:
+                self._esperas += 1
+                self._espera_total += espera
+                self._espera_maxima = max(self._espera_maxima, espera)
+        if espera > 1.0:
+            logging.warning(f"Pool de conexões: espera de {espera:.1f}s por uma conexão livre.")
+        return db
+
+    def devolver(self, db):
+        """Devolve uma conexão ao pool, desfazendo qualquer transação deixada aberta."""
+        try:
+            if db.in_transaction:
+                logging.warning("Pool: conexão devolvida com transação aberta; fazendo rollback.")
+                db.rollback()
+        except sqlite3.Error as e:
+            # Conexão inutilizável: descarta e libera a vaga
+            logging.warning(f"Pool: descartando conexão com erro: {e}")
+            with self._lock:
+                self._criadas -= 1
+            return
+        self._livres.put(db)
+
+    def metricas(self):
+        with self._lock:
+            livres = self._livres.qsize()
+            return {
+                'tamanho': self.tamanho,
+                'conexoes_abertas': self._criadas,
+                'em_uso': self._criadas - livres,
+                'livres': livres,
+                'emprestimos': self._emprestimos,
+                'emprestimos_com_espera': self._esperas,
+                'tempo_espera_total_ms': round(self._espera_total * 1000, 1),
+                'tempo_espera_maximo_ms': round(self._espera_maxima * 1000, 1),
+                'timeouts': self._timeouts,
+            }
+
+# Um pool por arquivo de banco (o processo normalmente usa apenas um)
+_pools = {}
+_pools_lock = threading.Lock()
+
+def obter_pool_conexoes():
+    """Retorna o pool de conexões do banco configurado no app atual, criando-o na primeira chamada."""
+    db_path = current_app.config['DATABASE']
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                config = current_app.config
+                pool = _pools[db_path] = PoolConexoes(
+                    db_path,
+                    config['TAMANHO_POOL_CONEXOES'],
+                    config['TIMEOUT_POOL_CONEXOES_SEGUNDOS'],
+                    config['SQLITE_BUSY_TIMEOUT_MS'],
+                    config['SQLITE_CACHED_STATEMENTS']
+                )
+                logging.info(f"Pool de conexões criado para {db_path} (até {pool.tamanho} conexões).")
+    return pool
+
 def get_db():
-    """Obtém a conexão com o banco de dados para a requisição atual."""
+    """Obtém a conexão com o banco de dados do contexto atual (emprestada do pool na primeira chamada)."""
     db = getattr(g, '_database', None)
     if db is None:
-        db_path = current_app.config['DATABASE']
-        logging.info(f"Conectando ao banco de dados: {db_path}")
-        db = g._database = sqlite3.connect(db_path)
-        db.row_factory = sqlite3.Row
+        db = g._database = obter_pool_conexoes().obter()
     return db
 
+def liberar_conexao():
+    """
+    Devolve ao pool a conexão do contexto atual antes do fim dele. Usado por operações longas
+    (ex.: o SSE de um lote) para segurar uma conexão só durante cada consulta; o próximo get_db()
+    empresta outra.
+    """
+    if getattr(g, '_transacao_nivel', 0):
+        return  # Não interrompe um bloco transacao() em andamento
+    db = g.pop('_database', None)
+    if db is not None:
+        obter_pool_conexoes().devolver(db)
+
+def confirmar(db):
+    """Faz o commit, exceto dentro de um bloco transacao() (o commit fica para o fim do bloco)."""
+    if getattr(g, '_transacao_nivel', 0) == 0:
+        db.commit()
+
+def desfazer(db):
+    """Faz o rollback; dentro de um bloco transacao(), marca o bloco inteiro para ser desfeito."""
+    if getattr(g, '_transacao_nivel', 0) == 0:
+        db.rollback()
+    else:
+        g._transacao_falhou = True
+
+@contextmanager
+def transacao():
+    """
+    Unidade de trabalho: as gravações dos modelos feitas dentro do bloco são confirmadas juntas,
+    em um único commit no final. Se alguma falhar (ou o bloco lançar exceção), nada é gravado.
+    Blocos aninhados fazem parte da transação mais externa.
+    """
+    db = get_db()
+    nivel = getattr(g, '_transacao_nivel', 0)
+    g._transacao_nivel = nivel + 1
+    if nivel == 0:
+        g._transacao_falhou = False
+    try:
+        yield db
+    except Exception:
+        g._transacao_falhou = True
+        raise
+    finally:
+        g._transacao_nivel = nivel
+        if nivel == 0:
+            if g._transacao_falhou:
+                logging.warning("Transação desfeita: nenhuma das gravações do bloco foi salva.")
+                db.rollback()
+            else:
+                db.commit()
+
 def close_connection(exception):
-    """Fecha a conexão com o banco de dados ao final da requisição."""
-    db = getattr(g, '_database', None)
+    """Devolve a conexão com o banco de dados ao pool ao final da requisição."""
+    db = g.pop('_database', None)
     if db is not None:
-        logging.info("Fechando conexão com o banco de dados.")
-        db.close()
+        logging.debug("Devolvendo conexão com o banco de dados ao pool.")
+        obter_pool_conexoes().devolver(db)
 
 def init_db():
-    """Inicializa o banco de dados criando as tabelas se não existirem."""
+    """Inicializa o banco de dados: ativa o WAL e aplica as migrações pendentes do esquema."""
     try:
         logging.info("Inicializando o banco de dados (se necessário)...")
-        db = sqlite3.connect(current_app.config['DATABASE'])
-        cursor = db.cursor()
-        
-        # Criação da tabela batches
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS batches (
-                batch_id TEXT PRIMARY KEY, 
-                status TEXT NOT NULL, 
-                flags_json TEXT,
-                initial_instruction TEXT, 
-                quota_error_occurred INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ) ''')
-        
-        # Criação da tabela files
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                file_id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                batch_id TEXT NOT NULL,
-                original_name TEXT NOT NULL, 
-                saved_path TEXT NOT NULL,
-                is_extracted_from_zip INTEGER DEFAULT 0,
-                FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
-        
-        # Criação da tabela results
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS results (
-                result_id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                file_id INTEGER NOT NULL,
-                batch_id TEXT NOT NULL, 
-                status_final TEXT, 
-                error_message TEXT,
-                steps_json TEXT, 
-                data_json TEXT, 
-                web_summary TEXT, 
-                texto_completo TEXT,
-                FOREIGN KEY (file_id) REFERENCES files (file_id),
-                FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
-        
-        # Criação da tabela chat_history
-        cursor.execute('''
-             CREATE TABLE IF NOT EXISTS chat_history (
-                 chat_id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                 batch_id TEXT NOT NULL,
-                 user_message TEXT, 
-                 model_reply TEXT,
-                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                 FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
-        
-        db.commit()
+        db_path = current_app.config['DATABASE']
+        db = sqlite3.connect(db_path)
+        # WAL: leitores (SSE, chat) não bloqueiam o escritor e vice-versa. A configuração fica gravada no arquivo
+        db.execute("PRAGMA journal_mode = WAL")
         db.close()
+        
+        from app.database.migrations import executar_migracoes, iniciar_backfills
+        executar_migracoes(db_path)
+        # Preenchimentos de dados das migrações rodam em segundo plano, em lotes pequenos
+        iniciar_backfills(db_path, current_app.config['TAMANHO_LOTE_BACKFILL'], current_app.config['INTERVALO_BACKFILL_SEGUNDOS'])
         logging.info("Banco de dados inicializado com sucesso.")
     except Exception as e:
         logging.error(f"Erro ao inicializar o banco de dados: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do esquema do banco.
+
+A versão aplicada fica em `PRAGMA user_version`. Cada migração roda em uma transação
+(BEGIN IMMEDIATE) junto com a atualização da versão: ou é aplicada por inteiro, ou não é.
+Preenchimentos de dados grandes (backfills) não rodam dentro da migração: são executados
+em segundo plano, em lotes pequenos com uma transação curta cada, e retomam de onde
+pararam (só processam as linhas ainda não preenchidas).
+"""
+import time
+import sqlite3
+import logging
+import threading
+from app.utils.helpers import calcular_hash_texto
+from app.database.blob_store import gravar_blob, ler_blob, ler_blobs
+from app.database.search_index import indexar_resultado, PESOS_BM25
+from app.database.candidate_index import indexar_candidato
+from app.database.chunk_index import indexar_trechos
+
+def _colunas(cursor, tabela):
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({tabela})")}
+
+def _adicionar_coluna(cursor, tabela, coluna, definicao):
+    """ALTER TABLE ADD COLUMN idempotente (o SQLite não tem ADD COLUMN IF NOT EXISTS)."""
+    if coluna not in _colunas(cursor, tabela):
+        cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+
+def _migracao_1(cursor):
+    """Esquema base (o que init_db criava antes das migrações). Seguro em bancos já existentes."""
+    # Criação da tabela batches
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS batches (
+            batch_id TEXT PRIMARY KEY, 
+            status TEXT NOT NULL, 
+            flags_json TEXT,
+            initial_instruction TEXT, 
+            quota_error_occurred INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ) ''')
+    
+    # Criação da tabela files
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            file_id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            batch_id TEXT NOT NULL,
+            original_name TEXT NOT NULL, 
+            saved_path TEXT NOT NULL,
+            is_extracted_from_zip INTEGER DEFAULT 0,
+            FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
+    
+    # Criação da tabela results
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS results (
+            result_id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            file_id INTEGER NOT NULL,
+            batch_id TEXT NOT NULL, 
+            status_final TEXT, 
+            error_message TEXT,
+            steps_json TEXT, 
+            data_json TEXT, 
+            web_summary TEXT, 
+            texto_completo TEXT,
+            FOREIGN KEY (file_id) REFERENCES files (file_id),
+            FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
+    
+    # Criação da tabela chat_history
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS chat_history (
+             chat_id INTEGER PRIMARY KEY AUTOINCREMENT, 
+             batch_id TEXT NOT NULL,
+             user_message TEXT, 
+             model_reply TEXT,
+             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+             FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
+    
+    # Criação da tabela file_texts (texto extraído uma única vez, com a posição de cada página/parágrafo)
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS file_texts (
+             file_id INTEGER PRIMARY KEY,
+             texto TEXT NOT NULL,
+             segment_unit TEXT,
+             segments_json TEXT,
+             content_hash TEXT NOT NULL,
+             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+             FOREIGN KEY (file_id) REFERENCES files (file_id) ) ''')
+    
+    # Criação da tabela analysis_cache (resultados de IA reaproveitados entre lotes)
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS analysis_cache (
+             cache_key TEXT PRIMARY KEY,
+             content_hash TEXT NOT NULL,
+             model_name TEXT NOT NULL,
+             prompt_version TEXT NOT NULL,
+             data_json TEXT,
+             report_text TEXT,
+             web_summary TEXT,
+             size_bytes INTEGER DEFAULT 0,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+             last_access TIMESTAMP DEFAULT CURRENT_TIMESTAMP ) ''')
+    
+    # Criação da tabela batch_events (andamento de cada lote, reproduzido para quem acompanha via SSE)
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS batch_events (
+             event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+             batch_id TEXT NOT NULL,
+             payload_json TEXT NOT NULL,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+             FOREIGN KEY (batch_id) REFERENCES batches (batch_id) ) ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_events_batch ON batch_events (batch_id, event_id)')
+    
+    # Índices para as consultas por lote (as de files e results cobrem todas as colunas lidas)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_batch ON files (batch_id, is_extracted_from_zip, file_id, original_name, saved_path)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_batch ON results (batch_id, status_final, file_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_results_file ON results (file_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_batch ON chat_history (batch_id, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_batches_status ON batches (status, created_at)')
+
+def _migracao_2(cursor):
+    """Hash do conteúdo de cada arquivo (CVs repetidos entre lotes) e tempos de processamento por etapa."""
+    _adicionar_coluna(cursor, 'files', 'content_hash', 'TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)')
+    _adicionar_coluna(cursor, 'results', 'tempo_total_ms', 'INTEGER')
+    _adicionar_coluna(cursor, 'results', 'tempos_etapas_json', 'TEXT')
+
+def _backfill_hash_arquivos(db, tamanho_lote):
+    """Preenche files.content_hash a partir do texto já extraído (file_texts). Retorna quantas linhas atualizou."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            "SELECT f.file_id, t.texto, t.texto_hash FROM files f JOIN file_texts t ON t.file_id = f.file_id WHERE f.content_hash IS NULL LIMIT ?",
+            (tamanho_lote,)
+        ).fetchall()
+        cursor = db.cursor()
+        valores = [(calcular_hash_texto(row['texto'] or ler_blob(cursor, row['texto_hash']) or ''), row['file_id']) for row in rows]
+        db.executemany("UPDATE files SET content_hash = ? WHERE file_id = ? AND content_hash IS NULL", valores)
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return len(valores)
+
+def _migracao_3(cursor):
+    """Textos grandes (texto dos CVs, resumos da web) em uma tabela de blobs comprimidos, endereçados por hash."""
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS blobs (
+             blob_hash TEXT PRIMARY KEY,
+             codec TEXT NOT NULL,
+             dados BLOB NOT NULL,
+             tamanho_original INTEGER,
+             tamanho_comprimido INTEGER,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ) ''')
+    _adicionar_coluna(cursor, 'results', 'texto_hash', 'TEXT')
+    _adicionar_coluna(cursor, 'results', 'web_summary_hash', 'TEXT')
+    _adicionar_coluna(cursor, 'file_texts', 'texto_hash', 'TEXT')
+
+def _backfill_blobs_resultados(db, tamanho_lote):
+    """Move results.texto_completo/web_summary para a tabela de blobs, deixando só os hashes."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            "SELECT result_id, texto_completo, web_summary FROM results WHERE texto_completo IS NOT NULL OR web_summary IS NOT NULL LIMIT ?",
+            (tamanho_lote,)
+        ).fetchall()
+        cursor = db.cursor()
+        for row in rows:
+            texto_hash = gravar_blob(cursor, row['texto_completo'])
+            web_summary_hash = gravar_blob(cursor, row['web_summary'])
+            cursor.execute(
+                "UPDATE results SET texto_hash = COALESCE(texto_hash, ?), web_summary_hash = COALESCE(web_summary_hash, ?), texto_completo = NULL, web_summary = NULL WHERE result_id = ?",
+                (texto_hash, web_summary_hash, row['result_id'])
+            )
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def _backfill_blobs_textos(db, tamanho_lote):
+    """Move file_texts.texto para a tabela de blobs (a coluna é NOT NULL: fica com string vazia)."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            "SELECT file_id, texto FROM file_texts WHERE texto_hash IS NULL AND texto != '' LIMIT ?",
+            (tamanho_lote,)
+        ).fetchall()
+        cursor = db.cursor()
+        for row in rows:
+            cursor.execute("UPDATE file_texts SET texto_hash = ?, texto = '' WHERE file_id = ?",
+                           (gravar_blob(cursor, row['texto']), row['file_id']))
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def _migracao_4(cursor):
+    """Índice de busca textual (FTS5) sobre os CVs processados de todos os lotes."""
+    cursor.execute('''
+         CREATE VIRTUAL TABLE IF NOT EXISTS cv_search USING fts5 (
+             original_name, nome, habilidades, dados, texto,
+             content = '',
+             tokenize = 'unicode61 remove_diacritics 2',
+             prefix = '2 3' ) ''')
+    # Ranking padrão (ORDER BY rank): bm25 com pesos por coluna, gravado na configuração do índice
+    cursor.execute(f"INSERT INTO cv_search (cv_search, rank) VALUES ('rank', 'bm25({', '.join(str(p) for p in PESOS_BM25)})')")
+    _adicionar_coluna(cursor, 'results', 'indexado_busca', 'INTEGER DEFAULT 0')
+
+def _backfill_indice_busca(db, tamanho_lote):
+    """
+    Indexa na busca os resultados com sucesso gravados antes do índice existir. As linhas pendentes são lidas
+    dentro da transação de escrita: o índice é contentless, e uma linha indexada duas vezes (ex.: dois processos
+    fazendo o backfill) não poderia mais ser removida.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            "SELECT r.result_id, r.data_json, r.texto_hash, r.texto_completo, f.original_name FROM results r JOIN files f ON f.file_id = r.file_id "
+            "WHERE r.indexado_busca = 0 AND r.status_final LIKE 'Sucesso%' LIMIT ?",
+            (tamanho_lote,)
+        ).fetchall()
+        cursor = db.cursor()
+        textos = ler_blobs(cursor, [row['texto_hash'] for row in rows])
+        for row in rows:
+            indexar_resultado(cursor, row['result_id'], row['original_name'], row['data_json'],
+                              textos.get(row['texto_hash']) or row['texto_completo'])
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def _migracao_5(cursor):
+    """Campos estruturados dos CVs normalizados em tabelas indexadas (filtro de candidatos)."""
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS candidates (
+             result_id INTEGER PRIMARY KEY,
+             file_id INTEGER NOT NULL,
+             batch_id TEXT NOT NULL,
+             nome TEXT,
+             anos_experiencia REAL,
+             nivel_escolaridade INTEGER,
+             localizacao TEXT,
+             localizacao_normalizada TEXT,
+             FOREIGN KEY (result_id) REFERENCES results (result_id) ) ''')
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS skills (
+             skill_id INTEGER PRIMARY KEY AUTOINCREMENT,
+             nome TEXT NOT NULL,
+             nome_normalizado TEXT NOT NULL UNIQUE ) ''')
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS candidate_skills (
+             skill_id INTEGER NOT NULL,
+             result_id INTEGER NOT NULL,
+             PRIMARY KEY (skill_id, result_id) ) WITHOUT ROWID ''')
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS candidate_languages (
+             idioma TEXT NOT NULL,
+             result_id INTEGER NOT NULL,
+             nivel INTEGER,
+             PRIMARY KEY (idioma, result_id) ) WITHOUT ROWID ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidates_experiencia ON candidates (anos_experiencia)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidates_escolaridade ON candidates (nivel_escolaridade, anos_experiencia)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidates_batch ON candidates (batch_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidates_localizacao ON candidates (localizacao_normalizada)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidate_skills_result ON candidate_skills (result_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_candidate_languages_result ON candidate_languages (result_id)')
+
+def _backfill_candidatos(db, tamanho_lote):
+    """Normaliza os campos estruturados dos resultados com sucesso gravados antes das tabelas existirem."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            "SELECT r.result_id, r.file_id, r.batch_id, r.data_json FROM results r LEFT JOIN candidates c ON c.result_id = r.result_id "
+            "WHERE c.result_id IS NULL AND r.status_final LIKE 'Sucesso%' LIMIT ?",
+            (tamanho_lote,)
+        ).fetchall()
+        cursor = db.cursor()
+        for row in rows:
+            indexar_candidato(cursor, row['result_id'], row['file_id'], row['batch_id'], row['data_json'])
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def _migracao_6(cursor):
+    """Trechos dos CVs indexados (FTS5) para montar o contexto do chat por relevância."""
+    cursor.execute('''
+         CREATE TABLE IF NOT EXISTS cv_chunks (
+             chunk_id INTEGER PRIMARY KEY AUTOINCREMENT,
+             result_id INTEGER NOT NULL,
+             batch_id TEXT NOT NULL,
+             ordem INTEGER NOT NULL,
+             inicio INTEGER NOT NULL,
+             fim INTEGER NOT NULL,
+             FOREIGN KEY (result_id) REFERENCES results (result_id) ) ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cv_chunks_result ON cv_chunks (result_id, ordem)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cv_chunks_batch ON cv_chunks (batch_id)')
+    cursor.execute('''
+         CREATE VIRTUAL TABLE IF NOT EXISTS cv_chunks_fts USING fts5 (
+             texto,
+             content = '',
+             tokenize = 'unicode61 remove_diacritics 2',
+             prefix = '2 3' ) ''')
+    _adicionar_coluna(cursor, 'results', 'indexado_trechos', 'INTEGER DEFAULT 0')
+
+def _backfill_trechos(db, tamanho_lote):
+    """Indexa os trechos dos resultados com sucesso gravados antes do índice de trechos existir (ver _backfill_indice_busca)."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            "SELECT result_id, batch_id, texto_hash, texto_completo FROM results "
+            "WHERE indexado_trechos = 0 AND status_final LIKE 'Sucesso%' LIMIT ?",
+            (tamanho_lote,)
+        ).fetchall()
+        cursor = db.cursor()
+        textos = ler_blobs(cursor, [row['texto_hash'] for row in rows])
+        for row in rows:
+            indexar_trechos(cursor, row['result_id'], row['batch_id'], textos.get(row['texto_hash']) or row['texto_completo'])
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def _migracao_7(cursor):
+    """Dono e último sinal de vida do executor que processa cada lote (vários processos no mesmo banco)."""
+    _adicionar_coluna(cursor, 'batches', 'executor_id', 'TEXT')
+    _adicionar_coluna(cursor, 'batches', 'heartbeat_at', 'TIMESTAMP')
+
+# (versão, descrição, função que aplica a mudança de esquema)
+MIGRACOES = [
+    (1, "Esquema base", _migracao_1),
+    (2, "Hash de conteúdo dos arquivos e tempos por etapa", _migracao_2),
+    (3, "Tabela de blobs comprimidos para textos grandes", _migracao_3),
+    (4, "Índice de busca textual dos CVs", _migracao_4),
+    (5, "Tabelas normalizadas de candidatos (habilidades, experiência, escolaridade, idiomas)", _migracao_5),
+    (6, "Trechos dos CVs para o contexto do chat", _migracao_6),
+    (7, "Dono e heartbeat dos lotes em processamento", _migracao_7),
+]
+
+# (versão mínima do esquema, descrição, função de preenchimento em lotes)
+BACKFILLS = [
+    (3, "files.content_hash", _backfill_hash_arquivos),  # Lê file_texts.texto_hash, criada na migração 3
+    (3, "results -> blobs", _backfill_blobs_resultados),
+    (3, "file_texts -> blobs", _backfill_blobs_textos),
+    (4, "índice de busca", _backfill_indice_busca),
+    (5, "candidatos", _backfill_candidatos),
+    (6, "trechos dos CVs", _backfill_trechos),
+]
+
+def _conectar(db_path):
+    # isolation_level=None: as transações são controladas explicitamente (BEGIN IMMEDIATE / COMMIT)
+    db = sqlite3.connect(db_path, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA busy_timeout = 30000")
+    return db
+
+def versao_esquema(db):
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+def executar_migracoes(db_path):
+    """Aplica, em ordem, as migrações com versão maior que a registrada no banco. Retorna a versão final."""
+    db = _conectar(db_path)
+    try:
+        versao_atual = versao_esquema(db)
+        for versao, descricao, aplicar in MIGRACOES:
+            if versao <= versao_atual:
+                continue
+            logging.info(f"Aplicando migração {versao}: {descricao}...")
+            inicio = time.monotonic()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                aplicar(db.cursor())
+                db.execute(f"PRAGMA user_version = {int(versao)}")
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                logging.error(f"Migração {versao} falhou; banco mantido na versão {versao_atual}.", exc_info=True)
+                raise
+            versao_atual = versao
+            logging.info(f"Migração {versao} aplicada em {time.monotonic() - inicio:.2f}s.")
+        return versao_atual
+    finally:
+        db.close()
+
+def executar_backfills(db_path, tamanho_lote, intervalo_segundos):
+    """Executa os preenchimentos pendentes, lote a lote, com uma pausa entre lotes para não monopolizar o banco."""
+    db = _conectar(db_path)
+    try:
+        versao_atual = versao_esquema(db)
+        for versao_minima, descricao, preencher in BACKFILLS:
+            if versao_atual < versao_minima:
+                continue
+            total = 0
+            while True:
+                atualizadas = preencher(db, tamanho_lote)
+                if not atualizadas:
+                    break
+                total += atualizadas
+                time.sleep(intervalo_segundos)
+            if total:
+                logging.info(f"Backfill '{descricao}' concluído: {total} linha(s) preenchida(s).")
+    except Exception as e:
+        logging.error(f"Erro no backfill do banco (será retomado no próximo início): {e}", exc_info=True)
+    finally:
+        db.close()
+
+def iniciar_backfills(db_path, tamanho_lote, intervalo_segundos):
+    """Roda os backfills em uma thread em segundo plano (o app atende requisições enquanto isso)."""
+    thread = threading.Thread(target=executar_backfills, args=(db_path, tamanho_lote, intervalo_segundos),
+                              name='db-backfill', daemon=True)
+    thread.start()
+    return thread
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 import json
+import hashlib
 import logging
-from app.database.db_manager import get_db
+from app.database.db_manager import get_db, confirmar, desfazer
+from app.database.blob_store import gravar_blob, ler_blob, ler_blobs
+from app.database.search_index import indexar_resultado
+from app.database.candidate_index import indexar_candidato, nome_escolaridade, normalizar_termo
+from app.database.chunk_index import indexar_trechos
+from app.utils.helpers import calcular_hash_texto
 
 class BatchModel:
     """Modelo para operações com lotes de processamento (batches)"""
@@ -16,11 +22,11 @@ class BatchModel:
                 'INSERT INTO batches (batch_id, status, flags_json, initial_instruction) VALUES (?, ?, ?, ?)', 
                 (batch_id, status, flags_json, initial_instruction)
             )
-            db.commit()
+            confirmar(db)
             logging.info(f"Batch ID {batch_id} inserido no banco de dados.")
             return True
         except Exception as e:
-            db.rollback()
+            desfazer(db)
             logging.error(f"Erro ao criar batch {batch_id}: {e}", exc_info=True)
             return False
     
@@ -42,14 +48,88 @@ class BatchModel:
                     (status, batch_id)
                 )
                 
-            db.commit()
+            confirmar(db)
             logging.info(f"Status do batch {batch_id} atualizado para '{status}'")
             return True
         except Exception as e:
-            db.rollback()
+            desfazer(db)
             logging.error(f"Erro ao atualizar status do batch {batch_id}: {e}", exc_info=True)
             return False
     
+    @staticmethod
+    def claim_next_queued(executor_id):
+        """
+        Reserva o lote mais antigo da fila ('na_fila' -> 'processando') para o executor, registrando-o como dono
+        com o heartbeat atual. Retorna o batch_id ou None.
+        """
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute("SELECT batch_id FROM batches WHERE status = 'na_fila' ORDER BY created_at, rowid")
+            for row in cursor.fetchall():
+                # O UPDATE condicional garante que só um executor reserve cada lote
+                cursor.execute(
+                    "UPDATE batches SET status = 'processando', executor_id = ?, heartbeat_at = CURRENT_TIMESTAMP "
+                    "WHERE batch_id = ? AND status = 'na_fila'",
+                    (executor_id, row['batch_id'])
+                )
+                confirmar(db)
+                if cursor.rowcount == 1:
+                    logging.info(f"Batch {row['batch_id']} reservado para processamento.")
+                    return row['batch_id']
+            return None
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao reservar próximo batch da fila: {e}", exc_info=True)
+            return None
+
+    @staticmethod
+    def heartbeat(executor_id, batch_ids):
+        """Confirma que o executor ainda processa os lotes (só os que continuam reservados para ele)."""
+        if not batch_ids:
+            return
+        try:
+            db = get_db()
+            marcadores = ",".join("?" * len(batch_ids))
+            db.execute(
+                f"UPDATE batches SET heartbeat_at = CURRENT_TIMESTAMP WHERE executor_id = ? AND status = 'processando' AND batch_id IN ({marcadores})",
+                (executor_id, *batch_ids)
+            )
+            confirmar(db)
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao atualizar heartbeat dos lotes {batch_ids}: {e}", exc_info=True)
+
+    @staticmethod
+    def requeue_interrupted(limite_heartbeat_segundos):
+        """
+        Devolve à fila os lotes 'processando' cujo executor parou de dar sinal de vida (processo encerrado ou reiniciado):
+        sem dono/heartbeat ou com heartbeat mais antigo que o limite. Lotes de executores ativos não são tocados.
+        Retorna os IDs devolvidos.
+        """
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            condicao = ("status = 'processando' AND (executor_id IS NULL OR heartbeat_at IS NULL "
+                        "OR heartbeat_at < datetime('now', ?))")
+            prazo = f"-{int(limite_heartbeat_segundos)} seconds"
+            cursor.execute(f"SELECT batch_id FROM batches WHERE {condicao}", (prazo,))
+            batch_ids = []
+            for row in cursor.fetchall():
+                # A condição é repetida: um lote que recebeu heartbeat depois do SELECT continua com o dono
+                cursor.execute(
+                    f"UPDATE batches SET status = 'na_fila', executor_id = NULL, heartbeat_at = NULL WHERE batch_id = ? AND {condicao}",
+                    (row['batch_id'], prazo)
+                )
+                if cursor.rowcount == 1:
+                    batch_ids.append(row['batch_id'])
+            confirmar(db)
+            return batch_ids
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao devolver lotes interrompidos à fila: {e}", exc_info=True)
+            return []
+
     @staticmethod
     def get_batch_info(batch_id):
         """Obtém informações de um batch específico"""
@@ -61,6 +141,27 @@ class BatchModel:
         except Exception as e:
             logging.error(f"Erro ao obter informações do batch {batch_id}: {e}", exc_info=True)
             return None
+    
+    @staticmethod
+    def get_content_version(batch_id):
+        """
+        Versão do conteúdo de um batch usado no chat: ((último result_id, nº de resultados), último chat_id).
+        Muda sempre que um resultado ou uma mensagem é gravado (consultas só nos índices).
+        """
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                """SELECT (SELECT MAX(result_id) FROM results WHERE batch_id = ?) AS ultimo_resultado,
+                          (SELECT COUNT(*) FROM results WHERE batch_id = ?) AS num_resultados,
+                          (SELECT MAX(chat_id) FROM chat_history WHERE batch_id = ?) AS ultimo_chat""",
+                (batch_id, batch_id, batch_id)
+            )
+            row = cursor.fetchone()
+            return (row['ultimo_resultado'], row['num_resultados']), row['ultimo_chat']
+        except Exception as e:
+            logging.error(f"Erro ao obter versão do conteúdo do batch {batch_id}: {e}", exc_info=True)
+            return None, None
 
 class FileModel:
     """Modelo para operações com arquivos"""
@@ -75,15 +176,28 @@ class FileModel:
                 'INSERT INTO files (batch_id, original_name, saved_path, is_extracted_from_zip) VALUES (?, ?, ?, ?)', 
                 (batch_id, original_name, saved_path, is_extracted_from_zip)
             )
-            db.commit()
+            confirmar(db)
             file_id = cursor.lastrowid
             logging.info(f"Arquivo '{original_name}' inserido no banco (ID: {file_id})")
             return file_id
         except Exception as e:
-            db.rollback()
+            desfazer(db)
             logging.error(f"Erro ao criar registro de arquivo '{original_name}': {e}", exc_info=True)
             return None
     
+    @staticmethod
+    def update_saved_path(file_id, saved_path):
+        """Atualiza o caminho de um arquivo (ex.: membro de ZIP extraído de novo ao retomar um lote)"""
+        try:
+            db = get_db()
+            db.execute('UPDATE files SET saved_path = ? WHERE file_id = ?', (saved_path, file_id))
+            confirmar(db)
+            return True
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao atualizar caminho do arquivo {file_id}: {e}", exc_info=True)
+            return False
+
     @staticmethod
     def get_batch_files(batch_id, only_initial=True):
         """Obtém os arquivos de um batch"""
@@ -107,12 +221,108 @@ class FileModel:
             logging.error(f"Erro ao obter arquivos do batch {batch_id}: {e}", exc_info=True)
             return []
 
+    @staticmethod
+    def get_extracted_files(batch_id):
+        """Obtém os arquivos já extraídos de ZIPs do batch (reaproveitados ao retomar um lote)"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT file_id, original_name, saved_path FROM files WHERE batch_id = ? AND is_extracted_from_zip = 1 ORDER BY file_id",
+                (batch_id,)
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Erro ao obter arquivos extraídos do batch {batch_id}: {e}", exc_info=True)
+            return []
+
+class FileTextModel:
+    """Modelo para o texto extraído de cada arquivo (persistido na ingestão)"""
+
+    @staticmethod
+    def save(file_id, texto, segment_unit, segments):
+        """Grava (ou substitui) o texto extraído de um arquivo e os offsets das suas páginas/parágrafos"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            content_hash = hashlib.sha256(texto.encode('utf-8')).hexdigest()
+            # O texto vai para a tabela de blobs (comprimido); a coluna texto fica vazia
+            cursor.execute(
+                "INSERT OR REPLACE INTO file_texts (file_id, texto, texto_hash, segment_unit, segments_json, content_hash, updated_at) VALUES (?, '', ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (file_id, gravar_blob(cursor, texto), segment_unit, json.dumps(segments), content_hash)
+            )
+            # Hash do texto normalizado: identifica o mesmo CV em lotes diferentes
+            cursor.execute("UPDATE files SET content_hash = ? WHERE file_id = ?", (calcular_hash_texto(texto), file_id))
+            confirmar(db)
+            logging.info(f"Texto extraído salvo para o arquivo ID {file_id} ({len(texto)} caracteres)")
+            return True
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao salvar texto extraído do arquivo ID {file_id}: {e}", exc_info=True)
+            return False
+
+    @staticmethod
+    def get(file_id):
+        """Obtém o texto extraído de um arquivo (ou None se ainda não foi extraído)"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT t.file_id, t.texto, t.texto_hash, t.segment_unit, t.segments_json, t.content_hash, t.updated_at, f.original_name FROM file_texts t JOIN files f ON t.file_id = f.file_id WHERE t.file_id = ?",
+                (file_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            texto_row = dict(row)
+            if texto_row['texto_hash']:
+                texto_row['texto'] = ler_blob(cursor, texto_row['texto_hash']) or ''
+            return texto_row
+        except Exception as e:
+            logging.error(f"Erro ao obter texto extraído do arquivo ID {file_id}: {e}", exc_info=True)
+            return None
+
+class BatchEventModel:
+    """Modelo para os eventos de andamento de um lote (replay do SSE a partir de um cursor)"""
+
+    @staticmethod
+    def create(batch_id, evento):
+        """Grava um evento do lote. Retorna o event_id (usado como cursor pelo SSE)"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                'INSERT INTO batch_events (batch_id, payload_json) VALUES (?, ?)',
+                (batch_id, json.dumps(evento))
+            )
+            confirmar(db)
+            return cursor.lastrowid
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao gravar evento do batch {batch_id}: {e}", exc_info=True)
+            return None
+
+    @staticmethod
+    def get_after(batch_id, after_event_id=0, limit=200):
+        """Obtém os eventos do lote posteriores ao cursor, em ordem"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT event_id, payload_json FROM batch_events WHERE batch_id = ? AND event_id > ? ORDER BY event_id LIMIT ?",
+                (batch_id, after_event_id, limit)
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            logging.error(f"Erro ao obter eventos do batch {batch_id}: {e}", exc_info=True)
+            return []
+
 class ResultModel:
     """Modelo para operações com resultados de processamento"""
     
     @staticmethod
     def create(file_id, batch_id, status_final, error_message=None, steps_json=None, 
-               data_json=None, web_summary=None, texto_completo=None):
+               data_json=None, web_summary=None, texto_completo=None, tempo_total_ms=None, tempos_etapas=None):
         """Cria um novo resultado no banco de dados"""
         try:
             db = get_db()
@@ -120,34 +330,249 @@ class ResultModel:
             
             steps_json_str = json.dumps(steps_json) if steps_json else None
             data_json_str = json.dumps(data_json) if data_json else None
+            tempos_etapas_str = json.dumps(tempos_etapas) if tempos_etapas else None
             
+            # Textos grandes ficam na tabela de blobs; o resultado guarda só as referências
             cursor.execute(
-                'INSERT INTO results (file_id, batch_id, status_final, error_message, steps_json, data_json, web_summary, texto_completo) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', 
-                (file_id, batch_id, status_final, error_message, steps_json_str, data_json_str, web_summary, texto_completo)
+                'INSERT INTO results (file_id, batch_id, status_final, error_message, steps_json, data_json, web_summary_hash, texto_hash, tempo_total_ms, tempos_etapas_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', 
+                (file_id, batch_id, status_final, error_message, steps_json_str, data_json_str, 
+                 gravar_blob(cursor, web_summary), gravar_blob(cursor, texto_completo), tempo_total_ms, tempos_etapas_str)
             )
-            db.commit()
             result_id = cursor.lastrowid
+            
+            # Índice de busca atualizado junto com o resultado (mesmo commit)
+            if status_final and status_final.startswith('Sucesso'):
+                cursor.execute("SELECT original_name FROM files WHERE file_id = ?", (file_id,))
+                file_row = cursor.fetchone()
+                indexar_resultado(cursor, result_id, file_row['original_name'] if file_row else None, data_json, texto_completo)
+                indexar_candidato(cursor, result_id, file_id, batch_id, data_json)
+                indexar_trechos(cursor, result_id, batch_id, texto_completo)
+            confirmar(db)
             logging.info(f"Resultado salvo para o arquivo ID {file_id} (Result ID: {result_id})")
             return result_id
         except Exception as e:
-            db.rollback()
+            desfazer(db)
             logging.error(f"Erro ao criar resultado para arquivo ID {file_id}: {e}", exc_info=True)
             return None
     
     @staticmethod
-    def get_batch_results_with_text(batch_id):
-        """Obtém os resultados de um batch com texto completo para uso no chat"""
+    def get_file_ids_with_results(batch_id):
+        """Obtém os IDs dos arquivos do batch que já têm resultado gravado"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute("SELECT file_id FROM results WHERE batch_id = ?", (batch_id,))
+            return {row['file_id'] for row in cursor.fetchall()}
+        except Exception as e:
+            logging.error(f"Erro ao obter arquivos com resultado do batch {batch_id}: {e}", exc_info=True)
+            return set()
+    
+    @staticmethod
+    def get_batch_cv_overview(batch_id):
+        """
+        Lista os CVs com sucesso de um batch sem carregar os textos: result_id, original_name,
+        dados extraídos e tamanho do texto (em caracteres), na ordem de processamento.
+        """
         try:
             db = get_db()
             cursor = db.cursor()
             cursor.execute(
-                "SELECT r.texto_completo, f.original_name FROM results r JOIN files f ON r.file_id = f.file_id WHERE r.batch_id = ? AND r.status_final LIKE 'Sucesso%' AND r.texto_completo IS NOT NULL", 
+                """SELECT r.result_id, r.data_json, f.original_name, COALESCE(b.tamanho_original, LENGTH(r.texto_completo), 0) AS tamanho_texto
+                   FROM results r
+                   JOIN files f ON r.file_id = f.file_id
+                   LEFT JOIN blobs b ON b.blob_hash = r.texto_hash
+                   WHERE r.batch_id = ? AND r.status_final LIKE 'Sucesso%' AND (r.texto_hash IS NOT NULL OR r.texto_completo IS NOT NULL)
+                   ORDER BY r.result_id""",
                 (batch_id,)
             )
-            return cursor.fetchall()
+            return [{'result_id': row['result_id'], 'original_name': row['original_name'], 'tamanho_texto': row['tamanho_texto'],
+                     'dados': json.loads(row['data_json']) if row['data_json'] else {}}
+                    for row in cursor.fetchall() if row['tamanho_texto']]
         except Exception as e:
-            logging.error(f"Erro ao obter resultados do batch {batch_id}: {e}", exc_info=True)
+            logging.error(f"Erro ao obter CVs do batch {batch_id}: {e}", exc_info=True)
             return []
+    
+    @staticmethod
+    def get_texts(result_ids):
+        """Obtém os textos completos de alguns resultados (dict result_id -> texto)"""
+        if not result_ids:
+            return {}
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            marcadores = ", ".join("?" * len(result_ids))
+            cursor.execute(f"SELECT result_id, texto_hash, texto_completo FROM results WHERE result_id IN ({marcadores})", list(result_ids))
+            rows = cursor.fetchall()
+            textos = ler_blobs(cursor, [row['texto_hash'] for row in rows])
+            # texto_completo direto na linha: resultados antigos ainda não movidos para os blobs
+            return {row['result_id']: textos.get(row['texto_hash']) or row['texto_completo'] or "" for row in rows}
+        except Exception as e:
+            logging.error(f"Erro ao obter textos dos resultados {result_ids}: {e}", exc_info=True)
+            return {}
+
+    @staticmethod
+    def search(consulta_fts, batch_id=None, limit=20, offset=0):
+        """
+        Busca textual nos CVs processados (índice FTS5), ordenada por relevância (bm25).
+        Retorna (total, lista de dicts com file_id, batch_id, original_name, nome, habilidades, score).
+        """
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            filtro_lote = " AND r.batch_id = ?" if batch_id else ""
+            parametros = (consulta_fts, batch_id) if batch_id else (consulta_fts,)
+            cursor.execute(
+                f"SELECT COUNT(*) FROM cv_search JOIN results r ON r.result_id = cv_search.rowid WHERE cv_search MATCH ?{filtro_lote}",
+                parametros
+            )
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f"""SELECT r.result_id, r.file_id, r.batch_id, r.status_final, r.data_json, f.original_name, cv_search.rank AS score
+                    FROM cv_search
+                    JOIN results r ON r.result_id = cv_search.rowid
+                    JOIN files f ON f.file_id = r.file_id
+                    WHERE cv_search MATCH ?{filtro_lote}
+                    ORDER BY cv_search.rank
+                    LIMIT ? OFFSET ?""",
+                parametros + (limit, offset)
+            )
+            resultados = []
+            for row in cursor.fetchall():
+                dados = json.loads(row['data_json']) if row['data_json'] else {}
+                resultados.append({
+                    'file_id': row['file_id'],
+                    'batch_id': row['batch_id'],
+                    'original_name': row['original_name'],
+                    'status_final': row['status_final'],
+                    'nome': dados.get('nome_completo'),
+                    'habilidades': dados.get('habilidades_tecnicas') or [],
+                    'score': round(-row['score'], 4)  # bm25 do SQLite é negativo: maior = mais relevante
+                })
+            return total, resultados
+        except Exception as e:
+            logging.error(f"Erro na busca de CVs ({consulta_fts}): {e}", exc_info=True)
+            return 0, []
+
+class ChunkModel:
+    """Modelo para os trechos dos CVs usados no contexto do chat (tabelas cv_chunks/cv_chunks_fts)"""
+    
+    @staticmethod
+    def search(batch_id, consulta_fts, limit=100):
+        """Trechos do batch mais relevantes para a consulta (bm25), do mais para o menos relevante."""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                """SELECT c.result_id, c.ordem, c.inicio, c.fim
+                   FROM cv_chunks_fts
+                   JOIN cv_chunks c ON c.chunk_id = cv_chunks_fts.rowid
+                   WHERE cv_chunks_fts MATCH ? AND c.batch_id = ?
+                   ORDER BY cv_chunks_fts.rank
+                   LIMIT ?""",
+                (consulta_fts, batch_id, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"Erro na busca de trechos do batch {batch_id} ({consulta_fts}): {e}", exc_info=True)
+            return []
+    
+    @staticmethod
+    def get_opening_chunks(batch_id, max_ordem=1):
+        """Primeiros trechos de cada CV do batch (resumo/cabeçalho), usados quando a pergunta não indica o que buscar."""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                "SELECT result_id, ordem, inicio, fim FROM cv_chunks WHERE batch_id = ? AND ordem < ? ORDER BY ordem, result_id",
+                (batch_id, max_ordem)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"Erro ao obter trechos iniciais do batch {batch_id}: {e}", exc_info=True)
+            return []
+
+class CandidateModel:
+    """Modelo para o filtro de candidatos pelos campos estruturados normalizados (tabelas candidates/skills)"""
+    
+    @staticmethod
+    def filter(habilidades=None, anos_min=None, escolaridade_min=None, idioma=None, nivel_idioma_min=None,
+               localizacao=None, batch_id=None, limit=20, offset=0):
+        """
+        Filtra candidatos combinando os critérios com AND (todas as habilidades são exigidas).
+        escolaridade_min e nivel_idioma_min são níveis numéricos (ver candidate_index).
+        Retorna (total, lista de dicts), ordenada por anos de experiência (maior primeiro).
+        """
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            condicoes, parametros = [], []
+            
+            termos = sorted({normalizar_termo(h) for h in (habilidades or []) if normalizar_termo(h)})
+            if termos:
+                marcadores = ", ".join("?" * len(termos))
+                cursor.execute(f"SELECT skill_id FROM skills WHERE nome_normalizado IN ({marcadores})", termos)
+                skill_ids = [row['skill_id'] for row in cursor.fetchall()]
+                if len(skill_ids) < len(termos):
+                    return 0, []  # Alguma habilidade não aparece em nenhum CV
+                # Interseção das listas de candidatos de cada habilidade (busca na chave primária de candidate_skills)
+                condicoes.append("c.result_id IN (" + " INTERSECT ".join(
+                    ["SELECT result_id FROM candidate_skills WHERE skill_id = ?"] * len(skill_ids)) + ")")
+                parametros.extend(skill_ids)
+            if anos_min is not None:
+                condicoes.append("c.anos_experiencia >= ?")
+                parametros.append(anos_min)
+            if escolaridade_min is not None:
+                condicoes.append("c.nivel_escolaridade >= ?")
+                parametros.append(escolaridade_min)
+            if idioma:
+                condicoes.append("EXISTS (SELECT 1 FROM candidate_languages l WHERE l.idioma = ? AND l.result_id = c.result_id AND l.nivel >= ?)")
+                parametros.extend([normalizar_termo(idioma), nivel_idioma_min or 0])
+            if localizacao:
+                condicoes.append("c.localizacao_normalizada LIKE ?")
+                parametros.append(f"%{normalizar_termo(localizacao)}%")
+            if batch_id:
+                condicoes.append("c.batch_id = ?")
+                parametros.append(batch_id)
+            where = (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
+            
+            cursor.execute(f"SELECT COUNT(*) FROM candidates c{where}", parametros)
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f"""SELECT c.result_id, c.file_id, c.batch_id, c.nome, c.anos_experiencia, c.nivel_escolaridade, c.localizacao, f.original_name
+                    FROM candidates c JOIN files f ON f.file_id = c.file_id{where}
+                    ORDER BY c.anos_experiencia IS NULL, c.anos_experiencia DESC, c.result_id
+                    LIMIT ? OFFSET ?""",
+                parametros + [limit, offset]
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return total, []
+            
+            # Habilidades e idiomas da página, em duas consultas
+            ids = [row['result_id'] for row in rows]
+            marcadores = ", ".join("?" * len(ids))
+            habilidades_por_id, idiomas_por_id = {}, {}
+            cursor.execute(f"SELECT cs.result_id, s.nome FROM candidate_skills cs JOIN skills s ON s.skill_id = cs.skill_id WHERE cs.result_id IN ({marcadores})", ids)
+            for row in cursor.fetchall():
+                habilidades_por_id.setdefault(row['result_id'], []).append(row['nome'])
+            cursor.execute(f"SELECT result_id, idioma, nivel FROM candidate_languages WHERE result_id IN ({marcadores})", ids)
+            for row in cursor.fetchall():
+                idiomas_por_id.setdefault(row['result_id'], []).append({'idioma': row['idioma'], 'nivel': row['nivel']})
+            
+            return total, [{
+                'file_id': row['file_id'],
+                'batch_id': row['batch_id'],
+                'original_name': row['original_name'],
+                'nome': row['nome'],
+                'anos_experiencia': row['anos_experiencia'],
+                'escolaridade': nome_escolaridade(row['nivel_escolaridade']),
+                'localizacao': row['localizacao'],
+                'habilidades': sorted(habilidades_por_id.get(row['result_id'], []), key=str.lower),
+                'idiomas': idiomas_por_id.get(row['result_id'], [])
+            } for row in rows]
+        except Exception as e:
+            logging.error(f"Erro ao filtrar candidatos: {e}", exc_info=True)
+            return 0, []
 
 class ChatModel:
     """Modelo para operações com histórico de chat"""
@@ -162,12 +587,12 @@ class ChatModel:
                 'INSERT INTO chat_history (batch_id, user_message, model_reply) VALUES (?, ?, ?)', 
                 (batch_id, user_message, model_reply)
             )
-            db.commit()
+            confirmar(db)
             chat_id = cursor.lastrowid
             logging.info(f"Mensagem de chat salva para o batch {batch_id} (Chat ID: {chat_id})")
             return chat_id
         except Exception as e:
-            db.rollback()
+            desfazer(db)
             logging.error(f"Erro ao salvar mensagem de chat para batch {batch_id}: {e}", exc_info=True)
             return None
     
@@ -184,4 +609,84 @@ class ChatModel:
             return cursor.fetchall()
         except Exception as e:
             logging.error(f"Erro ao obter histórico de chat do batch {batch_id}: {e}", exc_info=True)
-            return []
\ No newline at end of file
+            return []
+
+class AnalysisCacheModel:
+    """Modelo para o cache de análises de IA (chaveado pelo hash do conteúdo do arquivo)"""
+
+    # Colunas que podem ser preenchidas individualmente, à medida que cada etapa termina
+    CAMPOS = ('data_json', 'report_text', 'web_summary')
+
+    @staticmethod
+    def get(cache_key):
+        """Obtém uma entrada do cache e atualiza o seu último acesso"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute("SELECT * FROM analysis_cache WHERE cache_key = ?", (cache_key,))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("UPDATE analysis_cache SET last_access = CURRENT_TIMESTAMP WHERE cache_key = ?", (cache_key,))
+                confirmar(db)
+            return row
+        except Exception as e:
+            logging.error(f"Erro ao ler cache de análise {cache_key}: {e}", exc_info=True)
+            return None
+
+    @staticmethod
+    def save_field(cache_key, content_hash, model_name, prompt_version, campo, valor):
+        """Grava (ou atualiza) um campo de uma entrada do cache"""
+        if campo not in AnalysisCacheModel.CAMPOS:
+            raise ValueError(f"Campo de cache inválido: {campo}")
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            valor_str = json.dumps(valor) if campo == 'data_json' else valor
+            cursor.execute(
+                f'''INSERT INTO analysis_cache (cache_key, content_hash, model_name, prompt_version, {campo}, size_bytes)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(cache_key) DO UPDATE SET
+                       {campo} = excluded.{campo},
+                       size_bytes = COALESCE(LENGTH(data_json), 0) + COALESCE(LENGTH(report_text), 0) + COALESCE(LENGTH(web_summary), 0)
+                           - COALESCE(LENGTH({campo}), 0) + excluded.size_bytes,
+                       last_access = CURRENT_TIMESTAMP''',
+                (cache_key, content_hash, model_name, prompt_version, valor_str, len(valor_str or ''))
+            )
+            confirmar(db)
+            return True
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao gravar cache de análise {cache_key} ({campo}): {e}", exc_info=True)
+            return False
+
+    @staticmethod
+    def evict(max_bytes, max_age_days):
+        """Remove entradas antigas e, se o cache passar de `max_bytes`, as menos acessadas"""
+        try:
+            db = get_db()
+            cursor = db.cursor()
+            cursor.execute(
+                "DELETE FROM analysis_cache WHERE last_access < datetime('now', ?)",
+                (f'-{int(max_age_days)} days',)
+            )
+            removidas = cursor.rowcount
+            cursor.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM analysis_cache")
+            excesso = cursor.fetchone()[0] - max_bytes
+            if excesso > 0:
+                cursor.execute("SELECT cache_key, size_bytes FROM analysis_cache ORDER BY last_access ASC")
+                chaves = []
+                for row in cursor.fetchall():
+                    if excesso <= 0:
+                        break
+                    chaves.append((row['cache_key'],))
+                    excesso -= row['size_bytes'] or 0
+                cursor.executemany("DELETE FROM analysis_cache WHERE cache_key = ?", chaves)
+                removidas += len(chaves)
+            confirmar(db)
+            if removidas:
+                logging.info(f"Cache de análises: {removidas} entrada(s) removida(s).")
+            return removidas
+        except Exception as e:
+            desfazer(db)
+            logging.error(f"Erro ao limpar cache de análises: {e}", exc_info=True)
+            return 0
\ No newline at end of file
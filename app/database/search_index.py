@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de busca textual (SQLite FTS5) sobre todos os CVs processados.
+O índice é "contentless" (content=''): guarda apenas os termos, sem duplicar o texto que já
+está na tabela de blobs; cada linha usa o result_id como rowid e os dados são lidos de `results`.
+O tokenizador unicode61 com remove_diacritics ignora acentos ("programação" == "programacao").
+Flexões do português são tratadas na consulta: cada termo é reduzido a um radical (remoção leve de sufixos)
+e buscado por prefixo, o que encontra as outras formas indexadas ("gerência" -> "gere"* -> "gerente").
+"""
+import re
+import json
+import unicodedata
+
+# Pesos do bm25 por coluna (original_name, nome, habilidades, dados, texto)
+PESOS_BM25 = (2.0, 5.0, 4.0, 2.0, 1.0)
+
+# Sufixos (sem acento) removidos para chegar ao radical, em ordem de prioridade: o primeiro que deixa
+# um radical com pelo menos TAMANHO_MINIMO_RADICAL letras é removido
+SUFIXOS_PORTUGUES = (
+    'amentos', 'imentos', 'amento', 'imento',
+    'edoras', 'edores', 'adoras', 'adores', 'idoras', 'idores', 'edora', 'adora', 'idora', 'edor', 'ador', 'idor',
+    'oras', 'ores', 'ora', 'or',
+    'acoes', 'icoes', 'acao', 'icao', 'coes', 'cao', 'oes', 'ao',
+    'ncias', 'ncia', 'ntes', 'nte', 'ancas', 'anca',
+    'idades', 'idade', 'istas', 'ista', 'ismos', 'ismo',
+    'eiros', 'eiras', 'eiro', 'eira', 'aveis', 'avel', 'iveis', 'ivel', 'ivos', 'ivas', 'ivo', 'iva',
+    'ais', 'al', 'os', 'as', 'es', 'o', 'a', 'e', 's',
+)
+TAMANHO_MINIMO_RADICAL = 4
+
+def remover_acentos(texto):
+    """Remove acentos/diacríticos de um texto (ex.: "Gestão" -> "Gestao")."""
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+def _texto_dos_valores(valor):
+    """Achata um valor do JSON extraído (dict/lista/escalar) em texto pesquisável."""
+    if valor is None:
+        return ""
+    if isinstance(valor, dict):
+        return " ".join(_texto_dos_valores(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return " ".join(_texto_dos_valores(v) for v in valor)
+    return str(valor)
+
+def indexar_resultado(cursor, result_id, original_name, dados, texto):
+    """Adiciona um resultado ao índice de busca. Não faz commit (mesma transação de quem grava o resultado)."""
+    if isinstance(dados, str):
+        try:
+            dados = json.loads(dados)
+        except ValueError:
+            dados = None
+    dados = dados if isinstance(dados, dict) else {}
+    outros = {k: v for k, v in dados.items() if k not in ('nome_completo', 'habilidades_tecnicas')}
+    cursor.execute(
+        "INSERT INTO cv_search (rowid, original_name, nome, habilidades, dados, texto) VALUES (?, ?, ?, ?, ?, ?)",
+        (result_id, original_name or "", _texto_dos_valores(dados.get('nome_completo')),
+         _texto_dos_valores(dados.get('habilidades_tecnicas')), _texto_dos_valores(outros), texto or "")
+    )
+    cursor.execute("UPDATE results SET indexado_busca = 1 WHERE result_id = ?", (result_id,))
+
+def radical(termo):
+    """
+    Radical aproximado de um termo em português, sem acentos e em minúsculas (ex.: "desenvolvedora" -> "desenvolv",
+    "gerencia" -> "gere"). Termos sem sufixo conhecido, ou curtos demais, são mantidos.
+    """
+    for sufixo in SUFIXOS_PORTUGUES:
+        if termo.endswith(sufixo) and len(termo) - len(sufixo) >= TAMANHO_MINIMO_RADICAL:
+            return termo[:-len(sufixo)]
+    return termo
+
+def montar_consulta_fts(consulta):
+    """
+    Converte o texto digitado pelo usuário em uma consulta FTS5 segura: cada palavra é reduzida ao radical
+    e vira um termo entre aspas com busca por prefixo ("pyth" encontra "python", "desenvolvedor" encontra
+    "desenvolvedora"), todos obrigatórios. Retorna None se não houver termos.
+    """
+    termos = re.findall(r'\w+', remover_acentos(consulta or "").lower())
+    if not termos:
+        return None
+    return " ".join(f'"{radical(termo)}"*' for termo in termos)
@@ -7,8 +7,9 @@ import logging
 import shutil
 from flask import Blueprint, render_template, request, jsonify, g, current_app
 from werkzeug.utils import secure_filename
-from app.database.db_manager import get_db, close_connection
+from app.database.db_manager import get_db, close_connection, transacao
 from app.database.models import BatchModel, FileModel
+from app.services.job_runner import obter_job_runner
 from app.utils.helpers import allowed_file
 
 # Corrigindo a declaração do blueprint
@@ -19,6 +20,11 @@ main_bp = Blueprint('main', __name__)  # Removi os asteriscos de __name__
 def close_db_connection(exception):
     close_connection(exception)
 
+@main_bp.before_app_request
+def iniciar_executor_de_lotes():
+    """Garante que o executor de lotes em segundo plano esteja rodando (retoma lotes interrompidos)."""
+    obter_job_runner().iniciar()
+
 @main_bp.route('/')
 def index():
     """Rota principal que exibe a interface do usuário"""
@@ -43,11 +49,12 @@ def upload_files():
     try:
         gerar_relatorio_flag = request.form.get('gerar_relatorio') == 'true'
         pesquisar_web_flag = request.form.get('pesquisar_web') == 'true'
+        analise_unificada_flag = request.form.get('analise_unificada', str(current_app.config['ANALISE_UNIFICADA']).lower()) == 'true'
         initial_instruction = request.form.get('initial_instruction')
-        flags = {'gerar_relatorio': gerar_relatorio_flag, 'pesquisar_web': pesquisar_web_flag}
+        flags = {'gerar_relatorio': gerar_relatorio_flag, 'pesquisar_web': pesquisar_web_flag, 'analise_unificada': analise_unificada_flag}
         flags_json = json.dumps(flags)
         
-        logging.info(f"Upload Batch {batch_id}: Opções -> Rel: {gerar_relatorio_flag}, Pesq: {pesquisar_web_flag}, Instr: {'Sim' if initial_instruction else 'Não'}")
+        logging.info(f"Upload Batch {batch_id}: Opções -> Rel: {gerar_relatorio_flag}, Pesq: {pesquisar_web_flag}, Unificada: {analise_unificada_flag}, Instr: {'Sim' if initial_instruction else 'Não'}")
         uploaded_files = request.files.getlist('arquivo_cv')
         
         if not uploaded_files or all(f.filename == '' for f in uploaded_files):
@@ -79,20 +86,23 @@ def upload_files():
             shutil.rmtree(batch_folder)
             raise ValueError("Nenhum arquivo válido foi salvo.")
             
-        # Criar o batch no banco de dados
-        if not BatchModel.create(batch_id, 'pendente', flags_json, initial_instruction):
-            raise ValueError("Erro ao criar registro do lote no banco de dados.")
-        
-        # Registrar arquivos no banco
-        for record in saved_file_records:
-            FileModel.create(
-                batch_id, 
-                record['original_name'], 
-                record['saved_path'], 
-                record['is_extracted']
-            )
+        # Criar o batch e registrar os arquivos em uma única transação:
+        # o lote só fica visível na fila com todos os seus arquivos
+        with transacao():
+            if not BatchModel.create(batch_id, 'na_fila', flags_json, initial_instruction):
+                raise ValueError("Erro ao criar registro do lote no banco de dados.")
+            
+            for record in saved_file_records:
+                if not FileModel.create(
+                    batch_id, 
+                    record['original_name'], 
+                    record['saved_path'], 
+                    record['is_extracted']
+                ):
+                    raise ValueError("Erro ao registrar arquivos do lote no banco de dados.")
                           
         logging.info(f"Upload Batch {batch_id}: Lote e arquivos salvos no DB.")
+        obter_job_runner().notificar()
         return jsonify({'batch_id': batch_id, 'files_received': files_processed_info})
     except Exception as e:
         logging.error(f"Erro upload (Batch {batch_id}): {e}", exc_info=True)
@@ -5,10 +5,25 @@ import time # Import time não utilizado no código visível, mas pode ser usado
 import logging
 from werkzeug.utils import secure_filename
 from flask import current_app
-from app.config import get_modelo_gemini, NOME_MODELO_GEMMA # Assume que essas importações existem e funcionam
-import google.generativeai as genai
+from app.config import get_modelo_gemini, ORCAMENTO_TOKENS_CONTEXTO_CHAT, ORCAMENTO_TOKENS_HISTORICO_CHAT, ESQUEMA_DADOS_CV, ESQUEMA_EXTRACAO_LOTE, ESQUEMA_ANALISE_UNIFICADA # Assume que essas importações existem e funcionam
+from app.services.context_service import montar_contexto_cvs
+from app.services.ia_client import gerar_conteudo, gerar_conteudo_stream, texto_da_resposta
+from app.services.token_budget import OrcamentoPrompt, MARCADOR_TEXTO, compactar_texto, encaixar_no_prompt
+from app.utils.json_parser import extrair_json, ajustar_ao_esquema
 from google.api_core import exceptions as api_exceptions
 
+# Campos extraídos de cada CV (compartilhados pelos prompts de extração)
+CAMPOS_EXTRACAO = """ - nome_completo: Nome completo do candidato.
+ - email: Endereço de e-mail principal.
+ - telefone: Número de telefone principal.
+ - localizacao: Cidade e Estado (ou País) de residência atual. Extrair apenas se mencionado explicitamente. (string ou null)
+ - linkedin_url: URL completa do perfil LinkedIn, se disponível. (string ou null)
+ - anos_experiencia_total: Calcule o número total aproximado de anos de experiência profissional com base nas datas fornecidas. Retorne um número ou null se não for possível calcular. (number ou null)
+ - cargo_atual_ou_ultimo: O cargo mais recente mencionado. (string ou null)
+ - nivel_escolaridade_max: O nível de educação mais alto concluído (Ex: Médio, Técnico, Graduação, Pós-graduação, Mestrado, Doutorado). (string ou null)
+ - habilidades_tecnicas: Uma lista [array] das 5-10 principais habilidades técnicas (ferramentas, softwares, linguagens) mencionadas. (array de strings ou [])
+ - idiomas: Uma lista [array] de objetos, cada um com "idioma" e "nivel" (Ex: Básico, Intermediário, Avançado, Fluente, Nativo), se mencionados. (array de objetos ou [])"""
+
 # --- Função Modificada para Extrair Mais Dados ---
 def extrair_dados_com_ia(texto_cv):
     """
@@ -20,22 +35,12 @@ def extrair_dados_com_ia(texto_cv):
         return None, "Cliente GenAI não configurado", False
 
     quota_error = False
-    response = None # Inicializa response
+    raw_text = "" # Inicializa para o bloco except
 
     try:
         # Prompt atualizado para solicitar mais campos no JSON
         prompt = f"""Analise o currículo abaixo e extraia as seguintes informações em formato JSON:
- - nome_completo: Nome completo do candidato.
- - email: Endereço de e-mail principal.
- - telefone: Número de telefone principal.
- - localizacao: Cidade e Estado (ou País) de residência atual. Extrair apenas se mencionado explicitamente. (string ou null)
- - linkedin_url: URL completa do perfil LinkedIn, se disponível. (string ou null)
- - anos_experiencia_total: Calcule o número total aproximado de anos de experiência profissional com base nas datas fornecidas. Retorne um número ou null se não for possível calcular. (number ou null)
- - cargo_atual_ou_ultimo: O cargo mais recente mencionado. (string ou null)
- - nivel_escolaridade_max: O nível de educação mais alto concluído (Ex: Médio, Técnico, Graduação, Pós-graduação, Mestrado, Doutorado). (string ou null)
- - habilidades_tecnicas: Uma lista [array] das 5-10 principais habilidades técnicas (ferramentas, softwares, linguagens) mencionadas. (array de strings ou [])
- - idiomas: Uma lista [array] de objetos, cada um com "idioma" e "nivel" (Ex: Básico, Intermediário, Avançado, Fluente, Nativo), se mencionados. (array de objetos ou [])
-
+{CAMPOS_EXTRACAO}
 INSTRUÇÕES DETALHADAS DE FORMATAÇÃO E EXTRAÇÃO:
  - Retorne APENAS o JSON válido, sem nenhum texto antes ou depois, e sem usar blocos de código markdown (```json ... ```).
  - Se uma informação não for encontrada ou não aplicável, use o valor JSON null (para strings/numeros) ou uma lista vazia [] (para arrays).
@@ -44,27 +49,22 @@ INSTRUÇÕES DETALHADAS DE FORMATAÇÃO E EXTRAÇÃO:
  - Para 'idiomas', extraia apenas se o nível de proficiência também for mencionado.
  - Formate o texto de forma simples, sem usar marcadores Markdown desnecessários dentro dos valores do JSON.
 --- CV ---
-{texto_cv}
+{MARCADOR_TEXTO}
 --- FIM CV ---"""
+        # CV compactado (e cortado, se preciso) para o prompt caber no orçamento de tokens
+        prompt = encaixar_no_prompt(prompt, texto_cv, descricao="CV (extração)")
 
         logging.info("Enviando solicitação IA (extração de dados aprimorada)...")
-        # Usar GenerativeModel em vez de generate_content diretamente
-        model = genai.GenerativeModel(NOME_MODELO_GEMMA)
-        response = model.generate_content(prompt)
+        # Chamada passa pelo rate limiter global
+        response = gerar_conteudo(prompt, 'extracao')
 
         # Adiciona log da resposta bruta para depuração
-        raw_text = getattr(response, 'text', '')
+        raw_text = texto_da_resposta(response)
         logging.debug(f"Resposta bruta da IA (extração): {raw_text[:500]}...") # Loga os primeiros 500 chars
 
-        # Limpeza da resposta - tentar remover markdown e espaços
-        resposta_limpa = raw_text.strip().lstrip('```json').lstrip('```').rstrip('```').strip()
-
-        # Tenta carregar o JSON
-        dados_extraidos = json.loads(resposta_limpa)
+        # Interpretação tolerante (markdown, texto extra, resposta cortada) e ajuste ao esquema declarado
+        dados_extraidos = ajustar_ao_esquema(extrair_json(raw_text, dict), ESQUEMA_DADOS_CV)
 
-        # Validação básica (opcional, mas útil)
-        if not isinstance(dados_extraidos, dict):
-             raise ValueError("Resposta da IA não é um dicionário JSON.")
         if dados_extraidos.get("nome_completo") is None:
             logging.warning("IA não extraiu 'nome_completo', mas processamento continua.")
         else:
@@ -79,11 +79,9 @@ INSTRUÇÕES DETALHADAS DE FORMATAÇÃO E EXTRAÇÃO:
         return None, msg_erro, quota_error
 
     except (json.JSONDecodeError, ValueError) as e_json: # Captura ValueError também
-        logging.error(f"Erro ao decodificar ou validar JSON: {e_json}. Resposta limpa: '{resposta_limpa[:200]}...'", exc_info=True)
-        # Verifica se a resposta original parecia JSON
-        resp_text = getattr(response, 'text', '') # Acesso seguro ao atributo text
-        if resp_text and not resp_text.strip().startswith('{'):
-            logging.warning(f"Resposta bruta da IA não parecia JSON válido: {resp_text[:200]}...")
+        logging.error(f"Erro ao decodificar ou validar JSON: {e_json}. Resposta: '{raw_text[:200]}...'", exc_info=True)
+        # Verifica se a resposta original continha algum JSON
+        if raw_text and '{' not in raw_text:
             msg_erro = "Erro: Resposta da IA (extração) não estava em formato JSON."
         else:
              msg_erro = f"Erro no formato da resposta JSON: {e_json}"
@@ -93,22 +91,93 @@ INSTRUÇÕES DETALHADAS DE FORMATAÇÃO E EXTRAÇÃO:
         logging.error(f"Erro geral na extração: {e_geral}", exc_info=True)
         return None, f"Erro geral inesperado na extração: {e_geral}", quota_error
 
+def extrair_dados_em_lote(itens):
+    """
+    Extração agrupada: vários CVs curtos em uma única chamada, que devolve um array JSON
+    com um objeto por CV identificado pelo file_id. itens = [(file_id, texto_cv), ...].
+    Retorna (dict file_id -> dados, status, quota_error); CVs ausentes ou inválidos na resposta
+    ficam de fora do dict (o chamador usa a extração individual para eles).
+    """
+    if not get_modelo_gemini():
+        return {}, "Cliente GenAI não configurado", False
+
+    blocos_cv = "\n".join(f"--- CV file_id={file_id} ---\n{compactar_texto(texto)}\n--- FIM CV file_id={file_id} ---" for file_id, texto in itens)
+    prompt = f"""Analise os {len(itens)} currículos abaixo e extraia de CADA UM as seguintes informações:
+{CAMPOS_EXTRACAO}
+
+INSTRUÇÕES DE FORMATAÇÃO:
+ - Retorne APENAS um array JSON, sem nenhum texto antes ou depois e sem blocos de código markdown.
+ - O array deve ter um objeto por currículo, com a chave "file_id" (o número indicado no cabeçalho do currículo) e os campos acima.
+ - Não misture informações de currículos diferentes.
+ - Se uma informação não for encontrada, use null (para strings/números) ou [] (para arrays).
+
+{blocos_cv}"""
+
+    resposta = ""
+    try:
+        logging.info(f"Enviando solicitação IA (extração agrupada de {len(itens)} CVs)...")
+        response = gerar_conteudo(prompt, 'extracao_lote')
+        resposta = texto_da_resposta(response)
+        # Em uma resposta cortada, o último CV (incompleto) fica para a extração individual
+        resultado = ajustar_ao_esquema(extrair_json(resposta, list, descartar_item_cortado=True), ESQUEMA_EXTRACAO_LOTE)
+    except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e:
+        logging.error(f"Erro na API GenAI (extração agrupada): {e}", exc_info=True)
+        quota_error = "quota" in str(e).lower() or "rate limit" in str(e).lower()
+        return {}, ("Erro de Cota da API (extração agrupada)" if quota_error else f"Erro na API (extração agrupada): {e}"), quota_error
+    except (json.JSONDecodeError, ValueError) as e_json:
+        logging.error(f"Erro ao interpretar JSON da extração agrupada: {e_json}. Resposta: '{resposta[:200]}...'")
+        return {}, f"Erro no formato da resposta JSON (extração agrupada): {e_json}", False
+    except Exception as e_geral:
+        logging.error(f"Erro geral na extração agrupada: {e_geral}", exc_info=True)
+        return {}, f"Erro geral inesperado na extração agrupada: {e_geral}", False
+
+    # Valida cada entrada: objeto com um file_id do grupo, sem repetição
+    esperados = {file_id for file_id, _ in itens}
+    dados_por_arquivo = {}
+    for entrada in resultado:
+        if not isinstance(entrada, dict):
+            continue
+        try:
+            file_id = int(entrada.pop('file_id'))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if file_id in esperados and file_id not in dados_por_arquivo:
+            dados_por_arquivo[file_id] = entrada
+    if len(dados_por_arquivo) < len(itens):
+        logging.warning(f"Extração agrupada devolveu {len(dados_por_arquivo)}/{len(itens)} CV(s) válidos; os demais serão extraídos individualmente.")
+    return dados_por_arquivo, f"Dados extraídos com sucesso (extração agrupada, {len(itens)} CVs na chamada).", False
+
+def salvar_relatorio_txt(texto_relatorio, nome_arquivo_original, batch_folder):
+    """Salva o texto do relatório na pasta do lote e retorna o nome do arquivo gerado."""
+    # Define o nome e caminho do arquivo de relatório
+    base_name = os.path.splitext(secure_filename(nome_arquivo_original))[0]
+    # Garante que a config tem a chave, senão usa um padrão
+    nome_base_relatorio = current_app.config.get('nome_arquivo_relatorio_saida_base', 'Relatorio_CV')
+    nome_arquivo_relatorio = f"{nome_base_relatorio}_{base_name}.txt"
+    caminho_relatorio = os.path.join(batch_folder, nome_arquivo_relatorio)
+
+    logging.info(f"Salvando relatório em '{caminho_relatorio}'...")
+    with open(caminho_relatorio, 'w', encoding='utf-8') as f:
+        f.write(texto_relatorio)
+    return nome_arquivo_relatorio
+
 # --- Função Modificada para Gerar Relatório Usando Mais Dados ---
 def gerar_e_salvar_relatorio(dados_json, texto_cv_completo, nome_arquivo_original, batch_folder):
     """
     Gera um relatório resumido em TXT baseado no CV, utilizando os dados
     estruturados extraídos (incluindo os campos adicionais) e salva em arquivo.
+    Retorna (sucesso, status, quota_error, texto_relatorio).
     """
     client = get_modelo_gemini()
     if not client:
-        return False, "Cliente GenAI não configurado (relatório)", False
+        return False, "Cliente GenAI não configurado (relatório)", False, None
     if not texto_cv_completo:
         # Pode ser interessante tentar gerar relatório apenas com dados_json se existirem
         logging.warning("Texto CV completo não disponível para gerar relatório.")
         # return False, "Texto CV não disponível (relatório)", False # Comentado para permitir gerar com dados_json
     if not dados_json:
         logging.error("Dados JSON não disponíveis para gerar relatório.")
-        return False, "Dados JSON não disponíveis (relatório)", False
+        return False, "Dados JSON não disponíveis (relatório)", False, None
 
     logging.info(f"Gerando relatório aprimorado para: {nome_arquivo_original}")
     quota_error = False
@@ -147,7 +216,7 @@ DADOS EXTRAÍDOS DO CV:
 - Idiomas: {idiomas_str}
 
 --- CV COMPLETO (Use como referência principal para o conteúdo do relatório) ---
-{texto_cv_completo if texto_cv_completo else "CV completo não fornecido, baseie-se nos dados extraídos."}
+{MARCADOR_TEXTO if texto_cv_completo else "CV completo não fornecido, baseie-se nos dados extraídos."}
 --- FIM CV COMPLETO ---
 
 Instruções para o Relatório de Saída (FORMATO TXT):
@@ -160,87 +229,139 @@ Instruções para o Relatório de Saída (FORMATO TXT):
 - Use apenas "- " no início de cada item de lista, se precisar criar listas.
 - Mantenha o texto limpo, profissional e fácil de ler em um arquivo .txt simples.
 """
+        prompt = encaixar_no_prompt(prompt, texto_cv_completo, descricao="CV (relatório)")
 
         logging.info("Enviando solicitação IA (relatório aprimorado)...")
-        # Usar GenerativeModel
-        model = genai.GenerativeModel(NOME_MODELO_GEMMA)
-        resp = model.generate_content(prompt)
-        texto_relatorio = resp.text.strip() # Limpa espaços extras da resposta
-
-        # Define o nome e caminho do arquivo de relatório
-        base_name = os.path.splitext(secure_filename(nome_arquivo_original))[0]
-        # Garante que a config tem a chave, senão usa um padrão
-        nome_base_relatorio = current_app.config.get('nome_arquivo_relatorio_saida_base', 'Relatorio_CV')
-        nome_arquivo_relatorio = f"{nome_base_relatorio}_{base_name}.txt"
-        caminho_relatorio = os.path.join(batch_folder, nome_arquivo_relatorio)
-
-        logging.info(f"Salvando relatório em '{caminho_relatorio}'...")
-        with open(caminho_relatorio, 'w', encoding='utf-8') as f:
-            f.write(texto_relatorio)
+        resp = gerar_conteudo(prompt, 'relatorio')
+        texto_relatorio = texto_da_resposta(resp).strip() # Limpa espaços extras da resposta
+        if not texto_relatorio:
+            raise ValueError("IA retornou resposta vazia para o relatório.")
 
+        nome_arquivo_relatorio = salvar_relatorio_txt(texto_relatorio, nome_arquivo_original, batch_folder)
         logging.info("Relatório aprimorado salvo.")
-        return True, f"Relatório salvo como {nome_arquivo_relatorio}", quota_error
+        return True, f"Relatório salvo como {nome_arquivo_relatorio}", quota_error, texto_relatorio
 
     except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e:
         logging.error(f"Erro na API GenAI (relatório): {e}", exc_info=True)
         quota_error = "quota" in str(e).lower() or "rate limit" in str(e).lower()
         msg_erro = "Erro de Cota da API (relatório)" if quota_error else f"Erro na API (relatório): {e}"
-        return False, msg_erro, quota_error
+        return False, msg_erro, quota_error, None
 
     except Exception as e:
         logging.error(f"Erro ao gerar/salvar relatório aprimorado: {e}", exc_info=True)
         # Tenta obter texto da resposta para depuração, mesmo em erro
-        resp_text = getattr(resp, 'text', '') # Acesso seguro
+        resp_text = texto_da_resposta(resp) # Acesso seguro
         if not resp_text:
              msg_erro = "Erro ao processar resposta da IA (relatório - resposta vazia ou erro antes da resposta)"
         else:
             # Pode logar parte da resposta aqui se ajudar
             logging.debug(f"Texto parcial da IA (relatório) antes do erro geral: {resp_text[:200]}...")
             msg_erro = f"Erro geral ao gerar/salvar relatório: {e}"
-        return False, msg_erro, quota_error
+        return False, msg_erro, quota_error, None
 
 
+def analisar_cv_unificado(texto_cv, gerar_relatorio, extrair_keywords):
+    """
+    Modo de análise unificada: uma única chamada devolve os dados estruturados, o texto do relatório
+    e as palavras-chave para a pesquisa web (o CV é enviado uma vez, em vez de uma vez por etapa).
+    Retorna (dados, texto_relatorio, keywords, status, quota_error); relatório e keywords são None
+    quando não solicitados ou ausentes na resposta (as etapas então usam as chamadas separadas).
+    """
+    if not get_modelo_gemini():
+        return None, None, None, "Cliente GenAI não configurado", False
+
+    chaves = ['"dados": objeto com os campos abaixo']
+    if gerar_relatorio:
+        chaves.append('"relatorio": texto do relatório (string)')
+    if extrair_keywords:
+        chaves.append('"keywords": array JSON de strings')
+    instrucoes_relatorio = """
+RELATÓRIO ("relatorio"): um RELATÓRIO RESUMIDO E OBJETIVO em texto simples para um recrutador avaliar rapidamente o candidato:
+ - Um resumo de 3-5 linhas destacando os pontos fortes e a adequação geral (se possível inferir).
+ - As principais experiências profissionais de forma concisa (Cargo, Empresa, Breve Descrição).
+ - A formação principal, as habilidades técnicas mais relevantes e os idiomas.
+ - NÃO USE NENHUM TIPO DE MARKDOWN (sem negrito, itálico, *, #, etc.); use apenas "- " no início de itens de lista.
+ - Use "\\n" para as quebras de linha dentro da string.
+""" if gerar_relatorio else ""
+    instrucoes_keywords = """
+PALAVRAS-CHAVE ("keywords"): as 5 a 7 palavras-chave ou entidades mais relevantes do CV (tecnologias específicas, nomes de empresas importantes, conceitos de projetos, metodologias), com preferência por termos técnicos ou específicos da área.
+""" if extrair_keywords else ""
+
+    prompt = f"""Analise o currículo abaixo e retorne UM ÚNICO objeto JSON com as chaves: {"; ".join(chaves)}.
+
+DADOS ("dados"):
+{CAMPOS_EXTRACAO}
+{instrucoes_relatorio}{instrucoes_keywords}
+INSTRUÇÕES DE FORMATAÇÃO:
+ - Retorne APENAS o JSON válido, sem nenhum texto antes ou depois, e sem usar blocos de código markdown.
+ - Se uma informação não for encontrada, use null (para strings/números) ou [] (para arrays).
+--- CV ---
+{MARCADOR_TEXTO}
+--- FIM CV ---"""
+    prompt = encaixar_no_prompt(prompt, texto_cv, descricao="CV (análise unificada)")
+
+    resposta = ""
+    try:
+        logging.info("Enviando solicitação IA (análise unificada: dados + relatório + keywords)...")
+        response = gerar_conteudo(prompt, 'analise_unificada')
+        resposta = texto_da_resposta(response)
+        resultado = ajustar_ao_esquema(extrair_json(resposta, dict), ESQUEMA_ANALISE_UNIFICADA)
+        if not isinstance(resultado.get('dados'), dict):
+            raise ValueError("Resposta da IA não contém o objeto 'dados'.")
+    except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e:
+        logging.error(f"Erro na API GenAI (análise unificada): {e}", exc_info=True)
+        quota_error = "quota" in str(e).lower() or "rate limit" in str(e).lower()
+        return None, None, None, ("Erro de Cota da API (análise unificada)" if quota_error else f"Erro na API (análise unificada): {e}"), quota_error
+    except (json.JSONDecodeError, ValueError) as e_json:
+        logging.error(f"Erro ao interpretar JSON da análise unificada: {e_json}. Resposta: '{resposta[:200]}...'")
+        return None, None, None, f"Erro no formato da resposta JSON (análise unificada): {e_json}", False
+    except Exception as e_geral:
+        logging.error(f"Erro geral na análise unificada: {e_geral}", exc_info=True)
+        return None, None, None, f"Erro geral inesperado na análise unificada: {e_geral}", False
+
+    texto_relatorio = resultado.get('relatorio') if gerar_relatorio else None
+    texto_relatorio = texto_relatorio.strip() if isinstance(texto_relatorio, str) and texto_relatorio.strip() else None
+    keywords = resultado.get('keywords') if extrair_keywords else None
+    keywords = [str(k) for k in keywords if str(k).strip()] if isinstance(keywords, list) else None
+    logging.info("JSON da análise unificada interpretado com sucesso!")
+    return resultado['dados'], texto_relatorio, keywords or None, "Dados extraídos com sucesso (análise unificada).", False
+
 # --- Funções de Chat (Permanecem Iguais ao Original) ---
 
-def processar_instrucao_inicial(batch_id, initial_instruction, resultados_dict):
-    """Processa uma instrução inicial após o processamento do lote usando Gemma 3"""
+def processar_instrucao_inicial(batch_id, initial_instruction):
+    """Processa uma instrução inicial após o processamento do lote usando Gemma 3 (textos lidos do banco)"""
     client = get_modelo_gemini()
     if not client:
         return "Cliente GenAI não configurado para instrução inicial", False
 
-    contexto_cvs = ""
-    valid_cv_count = 0
-
-    # Assume que resultados_dict tem a estrutura esperada
-    for res_data in resultados_dict.values():
-        if res_data.get('status_final','').startswith('Sucesso') and res_data.get('texto_completo'):
-            valid_cv_count += 1
-            contexto_cvs += f"\n--- CURRÍCULO {valid_cv_count} ({res_data.get('filename','?')}) ---\n{res_data['texto_completo'][:15000]}\n--- FIM CURRÍCULO {valid_cv_count} ---\n"
-
-    if valid_cv_count == 0:
-        return "Instrução inicial não processada: Nenhum CV válido no lote.", False
-
     prompt_chat = f"""Você é um assistente de RH...
 INSTRUÇÕES DE FORMATAÇÃO:
 - Use texto simples sem marcadores Markdown desnecessários
 - Para listas, use apenas "- " no início de cada item (sem asteriscos adicionais)
 - Não use formatos especiais para negrito ou itálico
 - Mantenha o texto limpo e fácil de ler
+- Os currículos podem trazer apenas um resumo e os trechos mais relevantes; não invente o que não estiver no texto
 
 CURRÍCULOS:
-{contexto_cvs}
+{MARCADOR_TEXTO}
 
 PERGUNTA INICIAL:
 {initial_instruction}
 
 RESPOSTA:""" # Prompt original mantido
 
+    # Apenas os trechos dos CVs relevantes para a instrução, no que sobra do orçamento do prompt
+    orcamento_cvs = min(OrcamentoPrompt().reservar(prompt_chat.replace(MARCADOR_TEXTO, "")).restante, _orcamento_contexto_cvs())
+    contexto_cvs, valid_cv_count = montar_contexto_cvs(batch_id, initial_instruction, orcamento_cvs)
+
+    if valid_cv_count == 0:
+        return "Instrução inicial não processada: Nenhum CV válido no lote.", False
+    prompt_chat = prompt_chat.replace(MARCADOR_TEXTO, contexto_cvs)
+
     try:
         logging.info(f"Chamando IA Instrução Inicial Batch {batch_id}...")
-        # Usar GenerativeModel em vez de generate_content diretamente
-        model = genai.GenerativeModel(NOME_MODELO_GEMMA)
-        response = model.generate_content(prompt_chat)
-        ai_reply = response.text.strip()
+        response = gerar_conteudo(prompt_chat, 'chat')
+        ai_reply = texto_da_resposta(response).strip()
         logging.info("Resposta Instrução Inicial IA recebida.")
         return ai_reply, False # Retorna (resposta, quota_error=False)
     except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e:
@@ -252,27 +373,29 @@ RESPOSTA:""" # Prompt original mantido
         logging.error(f"Erro IA instrução inicial: {e_initial_chat}", exc_info=True)
         return "Erro ao processar instrução inicial.", False # Retorna (mensagem_erro, quota_error=False)
 
-def processar_mensagem_chat(batch_id, user_message, resultados_texto_cv, historico_chat):
-    """Processa uma mensagem de chat do usuário usando Gemma 3"""
-    client = get_modelo_gemini()
-    if not client:
-        # Retorna (None como resposta, Mensagem de erro, quota_error=False)
-        return None, "Cliente GenAI não configurado para chat", False
+def _orcamento_contexto_cvs():
+    return current_app.config.get('ORCAMENTO_TOKENS_CONTEXTO_CHAT', ORCAMENTO_TOKENS_CONTEXTO_CHAT)
 
-    contexto_cvs = ""
-    # Assume que resultados_texto_cv é uma lista de dicts
-    for i, cv_info in enumerate(resultados_texto_cv):
-        # Verifica se cv_info é um dicionário e tem as chaves esperadas
-        if isinstance(cv_info, dict) and 'original_name' in cv_info and 'texto_completo' in cv_info:
-             contexto_cvs += f"\n--- CURRÍCULO {i+1} ({cv_info['original_name']}) ---\n{cv_info['texto_completo'][:15000]}\n--- FIM CURRÍCULO {i+1} ---\n"
-        else:
-             logging.warning(f"Item inválido encontrado em resultados_texto_cv no índice {i}")
+def _formatar_troca_chat(h):
+    return f"Usuário: {h['user_message']}\nAssistente: {h['model_reply']}"
 
+def dividir_orcamento_chat(user_message, historico_chat):
+    """
+    Divide o orçamento do prompt do chat: depois das instruções e da pergunta, as trocas mais recentes do
+    histórico (até ORCAMENTO_TOKENS_HISTORICO_CHAT) e o restante para os CVs (até ORCAMENTO_TOKENS_CONTEXTO_CHAT).
+    Retorna (historico que coube, orçamento de tokens dos CVs).
+    """
+    orcamento = OrcamentoPrompt().reservar(montar_prompt_chat(user_message, "", []))
+    max_historico = current_app.config.get('ORCAMENTO_TOKENS_HISTORICO_CHAT', ORCAMENTO_TOKENS_HISTORICO_CHAT)
+    historico = orcamento.selecionar_recentes(historico_chat, _formatar_troca_chat, max_historico)
+    return historico, min(orcamento.restante, _orcamento_contexto_cvs())
 
+def montar_prompt_chat(user_message, contexto_cvs, historico_chat):
+    """Monta o prompt do chat (histórico recente + CVs em contexto + pergunta)"""
     # Formatar histórico (assume que historico_chat é lista de dicts com chaves corretas)
     prompt_history = ""
     try:
-        prompt_history = "\n".join([f"Usuário: {h['user_message']}\nAssistente: {h['model_reply']}" for h in reversed(historico_chat)])
+        prompt_history = "\n".join([_formatar_troca_chat(h) for h in reversed(historico_chat)])
     except (TypeError, KeyError) as e_hist:
          logging.warning(f"Erro ao formatar histórico do chat: {e_hist}. Histórico pode estar incompleto no prompt.")
          # Continua sem o histórico ou com parte dele
@@ -284,6 +407,7 @@ INSTRUÇÕES DE FORMATAÇÃO:
 - Para listas, use apenas "- " no início do item (sem asteriscos adicionais)
 - Não use formatos especiais para negrito ou itálico
 - Mantenha respostas limpas e fáceis de ler
+- Os currículos podem trazer apenas um resumo e os trechos mais relevantes; não invente o que não estiver no texto
 
 HISTÓRICO DA CONVERSA RECENTE (se houver):
 {prompt_history}
@@ -295,13 +419,21 @@ PERGUNTA ATUAL DO USUÁRIO:
 {user_message}
 
 RESPOSTA DO ASSISTENTE:""" # Prompt original mantido
+    return prompt_chat
+
+def processar_mensagem_chat(batch_id, user_message, contexto_cvs, historico_chat):
+    """Processa uma mensagem de chat do usuário usando Gemma 3 (contexto_cvs vem de montar_contexto_cvs)"""
+    client = get_modelo_gemini()
+    if not client:
+        # Retorna (None como resposta, Mensagem de erro, quota_error=False)
+        return None, "Cliente GenAI não configurado para chat", False
+
+    prompt_chat = montar_prompt_chat(user_message, contexto_cvs, historico_chat)
 
     try:
         logging.info(f"Chamando IA Chat Batch {batch_id}...")
-        # Usar GenerativeModel
-        model = genai.GenerativeModel(NOME_MODELO_GEMMA)
-        response = model.generate_content(prompt_chat)
-        ai_reply = response.text.strip()
+        response = gerar_conteudo(prompt_chat, 'chat')
+        ai_reply = texto_da_resposta(response).strip()
 
         if not ai_reply:
             logging.warning("IA retornou resposta vazia para o chat.")
@@ -319,4 +451,44 @@ RESPOSTA DO ASSISTENTE:""" # Prompt original mantido
     except Exception as e_chat_ia:
         logging.error(f"Erro IA Chat Batch {batch_id}: {e_chat_ia}", exc_info=True)
         # Retorna (None como resposta, Mensagem de erro, quota_error=False)
-        return None, "Ocorreu um erro inesperado ao comunicar com a IA.", False
\ No newline at end of file
+        return None, "Ocorreu um erro inesperado ao comunicar com a IA.", False
+
+def processar_mensagem_chat_stream(batch_id, user_message, contexto_cvs, historico_chat):
+    """
+    Versão em streaming de processar_mensagem_chat. Gera eventos (dicts):
+    {'type': 'delta', 'text'} a cada pedaço da resposta e, ao final, {'type': 'done', 'reply'}
+    ou {'type': 'error', 'error', 'quota_error'}.
+    """
+    if not get_modelo_gemini():
+        yield {'type': 'error', 'error': "Cliente GenAI não configurado para chat", 'quota_error': False}
+        return
+
+    prompt_chat = montar_prompt_chat(user_message, contexto_cvs, historico_chat)
+    partes = []
+    try:
+        logging.info(f"Chamando IA Chat (streaming) Batch {batch_id}...")
+        for texto in gerar_conteudo_stream(prompt_chat):
+            # Espaços no início da resposta são descartados (mesmo efeito do strip() da versão sem streaming)
+            if not partes:
+                texto = texto.lstrip()
+                if not texto:
+                    continue
+            partes.append(texto)
+            yield {'type': 'delta', 'text': texto}
+    except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e:
+        logging.error(f"Erro IA Chat (streaming) Batch {batch_id}: {e}", exc_info=True)
+        is_quota_error = "quota" in str(e).lower() or "rate limit" in str(e).lower()
+        msg = "Limite de uso da IA atingido. Tente novamente mais tarde." if is_quota_error else f"Erro na API do chat: {e}"
+        yield {'type': 'error', 'error': msg, 'quota_error': is_quota_error}
+        return
+    except Exception as e_chat_ia:
+        logging.error(f"Erro IA Chat (streaming) Batch {batch_id}: {e_chat_ia}", exc_info=True)
+        yield {'type': 'error', 'error': "Ocorreu um erro inesperado ao comunicar com a IA.", 'quota_error': False}
+        return
+
+    ai_reply = "".join(partes).strip()
+    if not ai_reply:
+        logging.warning("IA retornou resposta vazia para o chat.")
+        yield {'type': 'error', 'error': "A IA não forneceu uma resposta desta vez.", 'quota_error': False}
+        return
+    yield {'type': 'done', 'reply': ai_reply}
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Montagem do contexto de CVs para o chat e a instrução inicial.
+Se todos os textos do lote cabem no orçamento de tokens, vão inteiros; senão cada CV entra com uma
+linha de resumo (dados extraídos) e apenas os trechos mais relevantes para a pergunta (índice de trechos, bm25),
+até o orçamento. O tamanho do prompt deixa de crescer com o número de CVs do lote.
+Os dados de cada lote (lista de CVs, textos já lidos dos blobs, contexto completo e histórico do chat)
+ficam em um cache LRU em memória, validado pela versão do conteúdo do lote a cada mensagem.
+"""
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from app.config import ORCAMENTO_TOKENS_CONTEXTO_CHAT, CACHE_CONTEXTO_CHAT_MAX_BYTES, CACHE_CONTEXTO_CHAT_MAX_LOTES
+from app.database.models import BatchModel, ResultModel, ChunkModel, ChatModel
+from app.database.chunk_index import montar_consulta_trechos
+from app.services.rate_limiter import estimar_tokens, tokens_por_caracteres
+from app.services.token_budget import compactar_texto
+
+# Fração do orçamento que pode ser usada pelas linhas de resumo dos CVs
+FRACAO_RESUMOS = 0.4
+MAX_HABILIDADES_RESUMO = 8
+
+class CacheContextoChat:
+    """
+    Cache LRU por lote, limitado em número de lotes e em bytes (tamanho aproximado dos textos guardados).
+    Cada entrada é um dict com 'versao_resultados', 'cvs', 'textos' (result_id -> texto), 'contexto_completo',
+    'versao_chat' e 'historico'; quem a altera chama guardar() para recalcular o tamanho e aplicar os limites,
+    ou atualizar() quando a alteração depende do conteúdo atual da entrada (leitura e escrita sob o lock).
+    """
+
+    def __init__(self, max_bytes, max_lotes):
+        self.max_bytes = max_bytes
+        self.max_lotes = max_lotes
+        self._entradas = OrderedDict()  # batch_id -> (entrada, tamanho em bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def _tamanho(entrada):
+        tamanho = sum(len(texto) for texto in entrada.get('textos', {}).values())
+        tamanho += len(entrada.get('contexto_completo') or '')
+        tamanho += sum(len(h['user_message'] or '') + len(h['model_reply'] or '') for h in entrada.get('historico') or [])
+        tamanho += sys.getsizeof(entrada.get('cvs')) + 200 * len(entrada.get('cvs') or [])  # Dados extraídos (estimativa)
+        return tamanho
+
+    def obter(self, batch_id):
+        with self._lock:
+            item = self._entradas.get(batch_id)
+            if item is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(batch_id)
+            self.acertos += 1
+            return item[0]
+
+    def _guardar_com_lock(self, batch_id, entrada, tamanho):
+        anterior = self._entradas.pop(batch_id, None)
+        if anterior is not None:
+            self._bytes -= anterior[1]
+        if tamanho > self.max_bytes:
+            return  # Lote grande demais para o cache: é relido do banco a cada mensagem
+        self._entradas[batch_id] = (entrada, tamanho)
+        self._bytes += tamanho
+        # Descarta os lotes usados há mais tempo até respeitar os limites
+        while self._entradas and (self._bytes > self.max_bytes or len(self._entradas) > self.max_lotes):
+            removido, (_, tamanho_removido) = self._entradas.popitem(last=False)
+            self._bytes -= tamanho_removido
+            logging.debug(f"Cache de contexto do chat: batch {removido} descartado (LRU).")
+
+    def guardar(self, batch_id, entrada):
+        tamanho = self._tamanho(entrada)
+        with self._lock:
+            self._guardar_com_lock(batch_id, entrada, tamanho)
+
+    def atualizar(self, batch_id, funcao):
+        """Aplica funcao(entrada) à entrada do lote, se estiver no cache, sem que outra thread a altere no meio."""
+        with self._lock:
+            item = self._entradas.get(batch_id)
+            if item is None:
+                return
+            entrada = item[0]
+            funcao(entrada)
+            self._guardar_com_lock(batch_id, entrada, self._tamanho(entrada))
+
+    def invalidar(self, batch_id):
+        with self._lock:
+            item = self._entradas.pop(batch_id, None)
+            if item is not None:
+                self._bytes -= item[1]
+
+    def estatisticas(self):
+        with self._lock:
+            return {'lotes': len(self._entradas), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'acertos': self.acertos, 'falhas': self.falhas}
+
+# Instância única do processo
+_cache_contexto = None
+_cache_contexto_lock = threading.Lock()
+
+def obter_cache_contexto():
+    """Retorna o cache de contexto do chat global, criando-o na primeira chamada."""
+    global _cache_contexto
+    if _cache_contexto is None:
+        with _cache_contexto_lock:
+            if _cache_contexto is None:
+                config = current_app.config if has_app_context() else {}
+                _cache_contexto = CacheContextoChat(
+                    config.get('CACHE_CONTEXTO_CHAT_MAX_BYTES', CACHE_CONTEXTO_CHAT_MAX_BYTES),
+                    config.get('CACHE_CONTEXTO_CHAT_MAX_LOTES', CACHE_CONTEXTO_CHAT_MAX_LOTES)
+                )
+    return _cache_contexto
+
+def _entrada_do_lote(batch_id):
+    """
+    Entrada do cache do lote, validada pela versão atual do conteúdo (resultados e histórico).
+    Resultados novos descartam os dados dos CVs; mensagens novas de outro processo descartam só o histórico.
+    """
+    cache = obter_cache_contexto()
+    versao_resultados, versao_chat = BatchModel.get_content_version(batch_id)
+    entrada = cache.obter(batch_id)
+    if entrada is None or entrada['versao_resultados'] != versao_resultados:
+        entrada = {'versao_resultados': versao_resultados, 'cvs': ResultModel.get_batch_cv_overview(batch_id),
+                   'textos': {}, 'contexto_completo': None, 'versao_chat': None, 'historico': None}
+    if entrada['versao_chat'] != versao_chat:
+        entrada['historico'] = None
+        entrada['versao_chat'] = versao_chat
+    return entrada
+
+def _carregar_textos(entrada, result_ids):
+    """Textos dos resultados, lendo do banco (blobs) apenas os que ainda não estão no cache."""
+    faltando = [result_id for result_id in result_ids if result_id not in entrada['textos']]
+    if faltando:
+        entrada['textos'].update(ResultModel.get_texts(faltando))
+    return entrada['textos']
+
+def _orcamento_padrao():
+    return current_app.config.get('ORCAMENTO_TOKENS_CONTEXTO_CHAT', ORCAMENTO_TOKENS_CONTEXTO_CHAT) if has_app_context() else ORCAMENTO_TOKENS_CONTEXTO_CHAT
+
+def _linha_resumo(dados):
+    """Resumo de uma linha a partir dos dados estruturados do CV (vazio se não houver dados)."""
+    partes = []
+    for rotulo, chave in (('Nome', 'nome_completo'), ('Cargo', 'cargo_atual_ou_ultimo'),
+                          ('Experiência (anos)', 'anos_experiencia_total'), ('Escolaridade', 'nivel_escolaridade_max'),
+                          ('Localização', 'localizacao')):
+        valor = dados.get(chave)
+        if valor not in (None, '', []):
+            partes.append(f"{rotulo}: {valor}")
+    habilidades = dados.get('habilidades_tecnicas')
+    if isinstance(habilidades, list) and habilidades:
+        partes.append("Habilidades: " + ", ".join(str(h) for h in habilidades[:MAX_HABILIDADES_RESUMO]))
+    return "RESUMO: " + " | ".join(partes) if partes else ""
+
+def _juntar_intervalos(intervalos):
+    """Une trechos sobrepostos/adjacentes de um mesmo CV, em ordem de posição."""
+    unidos = []
+    for inicio, fim in sorted(intervalos):
+        if unidos and inicio <= unidos[-1][1]:
+            unidos[-1][1] = max(unidos[-1][1], fim)
+        else:
+            unidos.append([inicio, fim])
+    return unidos
+
+def montar_contexto_cvs(batch_id, pergunta, orcamento_tokens=None):
+    """
+    Monta o texto dos CVs do lote para o prompt, dentro do orçamento de tokens.
+    Retorna (contexto, número de CVs válidos no lote).
+    """
+    orcamento = orcamento_tokens if orcamento_tokens is not None else _orcamento_padrao()
+    entrada = _entrada_do_lote(batch_id)
+    cvs = entrada['cvs']
+    if not cvs:
+        return "", 0
+
+    # Lote pequeno: os textos completos cabem no orçamento (contexto igual para qualquer pergunta)
+    if sum(tokens_por_caracteres(cv['tamanho_texto']) for cv in cvs) <= orcamento:
+        if entrada['contexto_completo'] is None:
+            textos = ResultModel.get_texts([cv['result_id'] for cv in cvs])
+            entrada['contexto_completo'] = "".join(
+                f"\n--- CURRÍCULO {i} ({cv['original_name']}) ---\n{compactar_texto(textos.get(cv['result_id'], ''))}\n--- FIM CURRÍCULO {i} ---\n"
+                for i, cv in enumerate(cvs, 1)
+            )
+            obter_cache_contexto().guardar(batch_id, entrada)
+        return entrada['contexto_completo'], len(cvs)
+
+    # Resumos de uma linha (dados extraídos), até a fração reservada do orçamento
+    resumos, usado = {}, 0
+    for cv in cvs:
+        resumo = _linha_resumo(cv['dados'])
+        custo = estimar_tokens(resumo) + estimar_tokens(cv['original_name']) + 10  # + delimitadores do bloco
+        if usado + custo > orcamento * FRACAO_RESUMOS:
+            break
+        resumos[cv['result_id']] = resumo
+        usado += custo
+
+    # Trechos relevantes para a pergunta; em seguida o início de cada CV, enquanto houver orçamento
+    consulta = montar_consulta_trechos(pergunta)
+    candidatos = (ChunkModel.search(batch_id, consulta) if consulta else []) + ChunkModel.get_opening_chunks(batch_id)
+    dados_por_id = {cv['result_id']: cv['dados'] for cv in cvs}
+    selecionados, vistos = {}, set()
+    for trecho in candidatos:
+        chave = (trecho['result_id'], trecho['ordem'])
+        if chave in vistos:
+            continue
+        vistos.add(chave)
+        custo = tokens_por_caracteres(trecho['fim'] - trecho['inicio'])
+        if trecho['result_id'] not in resumos:
+            custo += 20  # O bloco do CV ainda não foi contado (cabeçalho e delimitadores)
+        if usado + custo > orcamento:
+            continue  # Um trecho menor ainda pode caber
+        selecionados.setdefault(trecho['result_id'], []).append((trecho['inicio'], trecho['fim']))
+        if trecho['result_id'] not in resumos:
+            resumos[trecho['result_id']] = _linha_resumo(dados_por_id.get(trecho['result_id'], {}))
+        usado += custo
+
+    textos = _carregar_textos(entrada, list(selecionados))
+    obter_cache_contexto().guardar(batch_id, entrada)
+    blocos, numero = [], 0
+    for cv in cvs:
+        if cv['result_id'] not in resumos:
+            continue
+        numero += 1
+        partes = [resumos[cv['result_id']]] if resumos[cv['result_id']] else []
+        texto = textos.get(cv['result_id'], '')
+        partes.extend(compactar_texto(texto[inicio:fim]) for inicio, fim in _juntar_intervalos(selecionados.get(cv['result_id'], [])))
+        conteudo = "\n[...]\n".join(p for p in partes if p) or "(nenhum trecho relevante para a pergunta)"
+        blocos.append(f"\n--- CURRÍCULO {numero} ({cv['original_name']}) ---\n{conteudo}\n--- FIM CURRÍCULO {numero} ---\n")
+
+    if numero < len(cvs):
+        blocos.append(f"\n(Outros {len(cvs) - numero} currículo(s) do lote não couberam no contexto desta pergunta.)\n")
+    logging.info(f"Contexto do chat do batch {batch_id}: {numero}/{len(cvs)} CV(s), {sum(len(v) for v in selecionados.values())} trecho(s), ~{usado} tokens.")
+    return "".join(blocos), len(cvs)
+
+def obter_historico_chat(batch_id, limit=10):
+    """Histórico recente do chat do lote (mais recente primeiro), mantido no cache entre as mensagens."""
+    entrada = _entrada_do_lote(batch_id)
+    if entrada['historico'] is None:
+        entrada['historico'] = [{'user_message': row['user_message'], 'model_reply': row['model_reply']}
+                                for row in ChatModel.get_history(batch_id, limit=limit)]
+        obter_cache_contexto().guardar(batch_id, entrada)
+    return entrada['historico']
+
+def registrar_mensagem_chat(batch_id, user_message, model_reply, limit=10):
+    """
+    Grava a conversa no histórico e atualiza só o delta no cache (sem reler o histórico do banco).
+    Se a mensagem não for a seguinte à última do histórico em cache (ex.: duas mensagens gravadas ao mesmo tempo,
+    ou de outros lotes no meio), o histórico é descartado e relido do banco na próxima mensagem.
+    """
+    chat_id = ChatModel.create(batch_id, user_message, model_reply)
+    if chat_id is None:
+        return chat_id
+
+    def _acrescentar(entrada):
+        if entrada['historico'] is None:
+            return
+        if entrada['versao_chat'] is None or chat_id != entrada['versao_chat'] + 1:
+            entrada['historico'] = None
+            return
+        # Mesmo limite de ChatModel.get_history (limit * 2 linhas)
+        entrada['historico'] = ([{'user_message': user_message, 'model_reply': model_reply}] + entrada['historico'])[:limit * 2]
+        entrada['versao_chat'] = chat_id
+
+    obter_cache_contexto().atualizar(batch_id, _acrescentar)
+    return chat_id
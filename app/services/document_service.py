@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import io
 import os
 import logging
 import zipfile
@@ -17,80 +18,146 @@ def allowed_cv_file(filename):
     """Verifica se o arquivo tem uma extensão válida para CV"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['CV_EXTENSIONS']
 
-def ler_texto_pdf(caminho_arquivo):
-    """Extrai texto de um arquivo PDF"""
-    texto_completo = ""
-    logging.info(f"Iniciando leitura PDF: '{caminho_arquivo}'")
+# Arquivos extraídos de um ZIP em memória são registrados como "<caminho do zip>::<membro>"
+SEPARADOR_MEMBRO_ZIP = '::'
+
+def _abrir_origem(origem):
+    """Abre a origem de um documento para leitura binária: caminho em disco ou conteúdo em memória (bytes)."""
+    if isinstance(origem, (bytes, bytearray)):
+        return io.BytesIO(origem)
+    return open(origem, 'rb')
+
+def _descrever_origem(origem):
+    """Descrição curta da origem para os logs (não despeja bytes no log)."""
+    if isinstance(origem, (bytes, bytearray)):
+        return f"<memória: {len(origem)} bytes>"
+    return origem
+
+def _abrir_leitor_pdf(arquivo):
+    """Abre um PdfReader, tentando descriptografar com senha vazia. Retorna None se não for possível."""
+    leitor_pdf = PdfReader(arquivo)
+    num_paginas_inicial = len(leitor_pdf.pages)
+    logging.info(f"PDF aberto. Páginas: {num_paginas_inicial}")
+    
+    if leitor_pdf.is_encrypted:
+        logging.warning("PDF está criptografado!")
+        try:
+            decrypt_result = leitor_pdf.decrypt('')
+            logging.info(f"Tentativa de decrypt retornou: {decrypt_result}")
+            if decrypt_result == 0:
+                logging.error("Falha ao descriptografar PDF com senha vazia.")
+                return None
+        except Exception as e_decrypt:
+            logging.error(f"Erro ao tentar descriptografar PDF: {e_decrypt}", exc_info=True)
+            return None
+            
+    num_paginas = len(leitor_pdf.pages)
+    if num_paginas == 0 and num_paginas_inicial > 0:
+        logging.warning("PDF ficou com 0 páginas após tentativa de descriptografar.")
+        return None
+    elif num_paginas == 0:
+        logging.warning("PDF com 0 páginas.")
+    return leitor_pdf
+
+def contar_paginas_pdf(caminho_arquivo):
+    """Retorna o número de páginas de um PDF (caminho ou bytes), ou None se não for possível abri-lo."""
     try:
-        with open(caminho_arquivo, 'rb') as arquivo:
-            leitor_pdf = PdfReader(arquivo)
-            num_paginas_inicial = len(leitor_pdf.pages)
-            logging.info(f"PDF aberto. Páginas: {num_paginas_inicial}")
+        with _abrir_origem(caminho_arquivo) as arquivo:
+            leitor_pdf = _abrir_leitor_pdf(arquivo)
+            return None if leitor_pdf is None else len(leitor_pdf.pages)
+    except Exception as e:
+        logging.error(f"Erro ao contar páginas do PDF '{_descrever_origem(caminho_arquivo)}': {e}", exc_info=True)
+        return None
+
+# Leitura em streaming: os geradores abaixo extraem uma página/parágrafo por vez, e quem só precisa do início
+# do texto pode parar de consumi-los. As funções ler_* montam a lista completa usada pelo pool de extração.
+def iterar_paginas_pdf(caminho_arquivo, inicio=0, fim=None):
+    """
+    Gerador: produz o texto de cada página de um PDF (opcionalmente só do intervalo [inicio, fim)),
+    extraindo uma página por vez. Páginas sem texto produzem "".
+    `caminho_arquivo` pode ser um caminho em disco ou o conteúdo do arquivo em bytes.
+    Lança ValueError se o PDF não puder ser aberto/descriptografado.
+    """
+    logging.info(f"Iniciando leitura PDF: '{_descrever_origem(caminho_arquivo)}'")
+    with _abrir_origem(caminho_arquivo) as arquivo:
+        leitor_pdf = _abrir_leitor_pdf(arquivo)
+        if leitor_pdf is None:
+            raise ValueError(f"Não foi possível abrir o PDF '{_descrever_origem(caminho_arquivo)}'.")
             
-            if leitor_pdf.is_encrypted:
-                logging.warning("PDF está criptografado!")
-                try:
-                    decrypt_result = leitor_pdf.decrypt('')
-                    logging.info(f"Tentativa de decrypt retornou: {decrypt_result}")
-                    if decrypt_result == 0:
-                        logging.error("Falha ao descriptografar PDF com senha vazia.")
-                        return None
-                except Exception as e_decrypt:
-                    logging.error(f"Erro ao tentar descriptografar PDF: {e_decrypt}", exc_info=True)
-                    return None
-                    
-            num_paginas = len(leitor_pdf.pages)
-            if num_paginas == 0 and num_paginas_inicial > 0:
-                logging.warning("PDF ficou com 0 páginas após tentativa de descriptografar.")
-                return None
-            elif num_paginas == 0:
-                logging.warning("PDF com 0 páginas.")
-                
-            for i, pagina in enumerate(leitor_pdf.pages):
-                try:
-                    texto_pagina = pagina.extract_text()
-                    if texto_pagina:
-                        texto_completo += texto_pagina + "\n"
-                    else:
-                        logging.warning(f"Página {i+1} do PDF sem texto extraível.")
-                except Exception as e_pagina:
-                    logging.warning(f"Erro ao extrair texto da página {i+1} do PDF: {e_pagina}")
-                    
-            logging.info(f"Leitura PDF concluída. Caracteres extraídos: {len(texto_completo)}")
-            if not texto_completo.strip() and num_paginas > 0:
-                logging.warning("Nenhum texto foi extraído (PDF pode ser apenas imagem).")
-            return texto_completo
+        num_paginas = len(leitor_pdf.pages)
+        fim = num_paginas if fim is None else min(fim, num_paginas)
+        for i in range(inicio, fim):
+            texto_pagina = ""
+            try:
+                texto_pagina = leitor_pdf.pages[i].extract_text() or ""
+                if not texto_pagina:
+                    logging.warning(f"Página {i+1} do PDF sem texto extraível.")
+            except Exception as e_pagina:
+                logging.warning(f"Erro ao extrair texto da página {i+1} do PDF: {e_pagina}")
+            yield texto_pagina
+
+def iterar_paragrafos_docx(caminho_arquivo):
+    """Gerador: produz o texto de cada parágrafo de um DOCX (caminho ou bytes), um por vez."""
+    logging.info(f"Iniciando leitura DOCX: '{_descrever_origem(caminho_arquivo)}'")
+    with _abrir_origem(caminho_arquivo) as arquivo:
+        documento = Document(arquivo)
+    paragrafos = documento.paragraphs
+    logging.info(f"DOCX aberto. Parágrafos: {len(paragrafos)}")
+    
+    if not paragrafos:
+        logging.warning("DOCX não contém parágrafos.")
+        
+    for paragrafo in paragrafos:
+        yield paragrafo.text
+
+def ler_paginas_pdf(caminho_arquivo, inicio=0, fim=None):
+    """
+    Extrai o texto de cada página de um PDF (opcionalmente só do intervalo [inicio, fim)).
+    Retorna uma lista (uma string por página) ou None em erro.
+    """
+    try:
+        paginas = list(iterar_paginas_pdf(caminho_arquivo, inicio, fim))
+        logging.info(f"Leitura PDF concluída. Caracteres extraídos: {sum(len(p) for p in paginas)}")
+        if paginas and not any(p.strip() for p in paginas):
+            logging.warning("Nenhum texto foi extraído (PDF pode ser apenas imagem).")
+        return paginas
     except Exception as e:
-        logging.error(f"Erro fatal ao ler PDF '{caminho_arquivo}': {e}", exc_info=True)
+        logging.error(f"Erro fatal ao ler PDF '{_descrever_origem(caminho_arquivo)}': {e}", exc_info=True)
         return None
 
-def ler_texto_docx(caminho_arquivo):
-    """Extrai texto de um arquivo DOCX"""
-    texto_completo = ""
-    logging.info(f"Iniciando leitura DOCX: '{caminho_arquivo}'")
+def ler_paragrafos_docx(caminho_arquivo):
+    """Extrai o texto de cada parágrafo de um DOCX. Retorna uma lista de strings ou None em erro."""
     try:
-        documento = Document(caminho_arquivo)
-        paragrafos = documento.paragraphs
-        logging.info(f"DOCX aberto. Parágrafos: {len(paragrafos)}")
-        
-        if not paragrafos:
-            logging.warning("DOCX não contém parágrafos.")
-            
-        for i, paragrafo in enumerate(paragrafos):
-            paragrafo_texto = paragrafo.text
-            if paragrafo_texto:
-                texto_completo += paragrafo_texto + "\n"
-                
-        logging.info(f"Leitura DOCX concluída. Caracteres extraídos: {len(texto_completo)}")
-        return texto_completo
+        textos = list(iterar_paragrafos_docx(caminho_arquivo))
+        logging.info(f"Leitura DOCX concluída. Caracteres extraídos: {sum(len(t) for t in textos)}")
+        return textos
     except Exception as e:
-        logging.error(f"Erro ao ler DOCX '{caminho_arquivo}': {e}", exc_info=True)
+        logging.error(f"Erro ao ler DOCX '{_descrever_origem(caminho_arquivo)}': {e}", exc_info=True)
         return None
 
+def montar_texto_com_segmentos(partes):
+    """
+    Junta as partes (páginas/parágrafos) em um único texto, uma por linha, ignorando as vazias.
+    Retorna (texto, segmentos), onde segmentos[i] = [inicio, fim] da parte i dentro do texto.
+    """
+    pedacos = []
+    segmentos = []
+    posicao = 0
+    for parte in partes:
+        if parte:
+            pedacos.append(parte)
+            pedacos.append("\n")
+            segmentos.append([posicao, posicao + len(parte)])
+            posicao += len(parte) + 1
+        else:
+            segmentos.append([posicao, posicao])
+    return "".join(pedacos), segmentos
+
 def extrair_arquivos_zip(zip_path, extract_folder, batch_id, file_records_callback):
     """Extrai arquivos de um ZIP e chama um callback para cada arquivo válido extraído"""
     logging.info(f"Extraindo ZIP: {zip_path} para {extract_folder}")
     extracted_count = 0
+    max_bytes_membro, _, max_taxa = _limites_zip()
     
     try:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
@@ -99,7 +166,10 @@ def extrair_arquivos_zip(zip_path, extract_folder, batch_id, file_records_callba
                     continue
                     
                 member_filename = os.path.basename(member_info.filename)
-                if member_filename and allowed_cv_file(member_filename):
+                motivo = _verificar_membro_zip(member_info, max_bytes_membro, max_taxa)
+                if member_filename and allowed_cv_file(member_filename) and motivo:
+                    yield {'type': 'warning', 'filename': os.path.basename(zip_path), 'message': f'Ignorando item ZIP {member_info.filename}: {motivo}'}
+                elif member_filename and allowed_cv_file(member_filename):
                     try:
                         target_path = os.path.join(extract_folder, member_info.filename)
                         os.makedirs(os.path.dirname(target_path), exist_ok=True)
@@ -123,4 +193,126 @@ def extrair_arquivos_zip(zip_path, extract_folder, batch_id, file_records_callba
         yield {'type':'error', 'filename': os.path.basename(zip_path), 'message': 'Arquivo ZIP corrompido.'}
     except Exception as e_zip:
         logging.error(f"Erro geral extrair ZIP {os.path.basename(zip_path)}: {e_zip}", exc_info=True)
-        yield {'type':'error', 'filename': os.path.basename(zip_path), 'message': f'Erro geral ao extrair ZIP.'}
\ No newline at end of file
+        yield {'type':'error', 'filename': os.path.basename(zip_path), 'message': f'Erro geral ao extrair ZIP.'}
+
+def montar_caminho_membro_zip(zip_path, nome_membro):
+    """Caminho "virtual" de um arquivo lido de dentro de um ZIP (sem extração para o disco)."""
+    return f"{zip_path}{SEPARADOR_MEMBRO_ZIP}{nome_membro}"
+
+def separar_caminho_membro_zip(saved_path):
+    """Retorna (caminho_do_zip, nome_membro) para um caminho virtual, ou (saved_path, None) para um arquivo comum."""
+    if SEPARADOR_MEMBRO_ZIP in saved_path:
+        zip_path, nome_membro = saved_path.split(SEPARADOR_MEMBRO_ZIP, 1)
+        return zip_path, nome_membro
+    return saved_path, None
+
+def _limites_zip():
+    config = current_app.config
+    return config['ZIP_MAX_BYTES_MEMBRO'], config['ZIP_MAX_BYTES_TOTAL'], config['ZIP_MAX_TAXA_COMPRESSAO']
+
+def _verificar_membro_zip(member_info, max_bytes_membro, max_taxa):
+    """Retorna o motivo para recusar um membro do ZIP (tamanho/taxa de compressão suspeita), ou None se estiver OK."""
+    if member_info.file_size > max_bytes_membro:
+        return f"excede o tamanho máximo ({member_info.file_size} bytes)"
+    if member_info.compress_size > 0 and member_info.file_size / member_info.compress_size > max_taxa:
+        return f"taxa de compressão suspeita ({member_info.file_size // member_info.compress_size}:1)"
+    if member_info.compress_size == 0 and member_info.file_size > 0:
+        return "tamanho comprimido inválido"
+    return None
+
+def _ler_membro_limitado(zip_ref, member_info, max_bytes):
+    """Lê um membro do ZIP em blocos, sem confiar no tamanho declarado no cabeçalho (proteção contra zip bomb)."""
+    limite = min(max_bytes, member_info.file_size)
+    blocos = []
+    lidos = 0
+    with zip_ref.open(member_info) as membro:
+        while True:
+            bloco = membro.read(64 * 1024)
+            if not bloco:
+                break
+            lidos += len(bloco)
+            if lidos > limite:
+                raise ValueError(f"Membro '{member_info.filename}' maior que o declarado/permitido.")
+            blocos.append(bloco)
+    return b"".join(blocos)
+
+def ler_membro_zip(saved_path):
+    """Lê (em memória) o conteúdo de um arquivo registrado como membro de ZIP. Retorna bytes ou None."""
+    zip_path, nome_membro = separar_caminho_membro_zip(saved_path)
+    if nome_membro is None or not os.path.exists(zip_path):
+        return None
+    try:
+        max_bytes_membro, _, max_taxa = _limites_zip()
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            member_info = zip_ref.getinfo(nome_membro)
+            motivo = _verificar_membro_zip(member_info, max_bytes_membro, max_taxa)
+            if motivo:
+                logging.warning(f"Membro '{nome_membro}' de '{zip_path}' recusado: {motivo}")
+                return None
+            return _ler_membro_limitado(zip_ref, member_info, max_bytes_membro)
+    except Exception as e:
+        logging.error(f"Erro ao ler membro '{nome_membro}' do ZIP '{zip_path}': {e}", exc_info=True)
+        return None
+
+def carregar_origem_arquivo(saved_path):
+    """
+    Origem legível de um arquivo registrado no banco: o próprio caminho, se existir em disco,
+    ou o conteúdo em bytes, se for um membro de ZIP. Retorna None se o arquivo não existir.
+    """
+    zip_path, nome_membro = separar_caminho_membro_zip(saved_path)
+    if nome_membro is not None:
+        return ler_membro_zip(saved_path)
+    return saved_path if os.path.exists(saved_path) else None
+
+def ler_arquivos_zip_em_memoria(zip_path, batch_id, file_records_callback):
+    """
+    Lê os CVs de um ZIP diretamente do arquivo, sem extraí-los para o disco.
+    Cada membro válido é lido em memória (com limites de tamanho e de taxa de compressão) e
+    entregue ao callback assim que é lido, com o caminho virtual "<zip>::<membro>" e o conteúdo em bytes.
+    """
+    logging.info(f"Lendo ZIP em memória: {zip_path}")
+    nome_zip = os.path.basename(zip_path)
+    max_bytes_membro, max_bytes_total, max_taxa = _limites_zip()
+    extracted_count = 0
+    total_lido = 0
+    
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for member_info in zip_ref.infolist():
+                if member_info.is_dir() or '..' in member_info.filename or member_info.filename.startswith('/'):
+                    continue
+                    
+                member_filename = os.path.basename(member_info.filename)
+                if not (member_filename and allowed_cv_file(member_filename)):
+                    yield {'type': 'warning', 'filename': nome_zip, 'message': f'Ignorando item ZIP: {member_info.filename}'}
+                    continue
+                    
+                motivo = _verificar_membro_zip(member_info, max_bytes_membro, max_taxa)
+                if motivo:
+                    logging.warning(f"Item ZIP '{member_info.filename}' recusado: {motivo}")
+                    yield {'type': 'warning', 'filename': nome_zip, 'message': f'Ignorando item ZIP {member_info.filename}: {motivo}'}
+                    continue
+                    
+                if total_lido + member_info.file_size > max_bytes_total:
+                    logging.error(f"ZIP '{nome_zip}' excede o limite total descompactado ({max_bytes_total} bytes).")
+                    yield {'type': 'error', 'filename': nome_zip, 'message': 'ZIP excede o tamanho total permitido; itens restantes ignorados.'}
+                    break
+                    
+                try:
+                    conteudo = _ler_membro_limitado(zip_ref, member_info, max_bytes_membro)
+                    total_lido += len(conteudo)
+                    caminho_virtual = montar_caminho_membro_zip(zip_path, member_info.filename)
+                    file_id = file_records_callback(batch_id, member_filename, caminho_virtual, is_extracted=1, conteudo=conteudo)
+                    if file_id:
+                        extracted_count += 1
+                except Exception as e_extract_item:
+                    logging.error(f"Erro ler item {member_info.filename}: {e_extract_item}", exc_info=True)
+                    yield {'type':'error', 'filename': nome_zip, 'message': f'Erro extrair item {member_info.filename}'}
+                    
+        yield {'type':'status', 'filename': nome_zip, 'message': f'ZIP lido. {extracted_count} CVs válidos encontrados.'}
+    except zipfile.BadZipFile:
+        logging.error(f"Erro: ZIP corrompido - {nome_zip}", exc_info=True)
+        yield {'type':'error', 'filename': nome_zip, 'message': 'Arquivo ZIP corrompido.'}
+    except Exception as e_zip:
+        logging.error(f"Erro geral ler ZIP {nome_zip}: {e_zip}", exc_info=True)
+        yield {'type':'error', 'filename': nome_zip, 'message': f'Erro geral ao extrair ZIP.'}
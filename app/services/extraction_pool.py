@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+import time
+import queue
+import atexit
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, CancelledError, wait, FIRST_EXCEPTION
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, has_app_context
+from app.config import MAX_PROCESSOS_EXTRACAO, TIMEOUT_EXTRACAO_SEGUNDOS, LIMITE_MEMORIA_EXTRACAO_MB, PAGINAS_POR_TAREFA_PDF, NORMALIZAR_TEXTO_CV
+from app.services.document_service import contar_paginas_pdf, ler_paginas_pdf, ler_paragrafos_docx, montar_texto_com_segmentos
+from app.services.text_normalizer import normalizar_partes
+
+try:
+    import resource  # Disponível apenas em sistemas Unix
+except ImportError:
+    resource = None
+
+INTERVALO_VERIFICACAO_SEGUNDOS = 0.5  # Frequência com que as tarefas em execução são comparadas ao tempo máximo
+
+# --- Funções executadas dentro dos processos de extração (precisam ser de nível de módulo) ---
+
+_fila_inicios = None  # Fila pela qual o processo avisa o início de cada tarefa
+
+def _inicializar_processo(limite_memoria_mb, fila_inicios=None):
+    """Aplica o limite de memória (espaço de endereçamento) ao processo de extração."""
+    global _fila_inicios
+    _fila_inicios = fila_inicios
+    if resource and limite_memoria_mb:
+        limite = int(limite_memoria_mb) * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+        except (ValueError, OSError) as e:
+            logging.warning(f"Não foi possível limitar a memória do processo de extração: {e}")
+
+def _executar_tarefa(id_tarefa, funcao, *args):
+    """Avisa o processo principal que a tarefa começou (o tempo máximo conta a partir daqui) e a executa."""
+    if _fila_inicios is not None:
+        _fila_inicios.put(id_tarefa)
+    return funcao(*args)
+
+def _tarefa_pdf(caminho_arquivo, paginas_por_tarefa):
+    """Lê um PDF pequeno inteiro ou, se for grande, só informa o número de páginas para dividir o trabalho."""
+    num_paginas = contar_paginas_pdf(caminho_arquivo)
+    if num_paginas is None:
+        return None
+    if num_paginas > paginas_por_tarefa:
+        return ('dividir', num_paginas)
+    return ('paginas', ler_paginas_pdf(caminho_arquivo))
+
+def _tarefa_intervalo_pdf(caminho_arquivo, inicio, fim):
+    return ler_paginas_pdf(caminho_arquivo, inicio, fim)
+
+def _tarefa_docx(caminho_arquivo):
+    return ler_paragrafos_docx(caminho_arquivo)
+
+class ExtractionPool:
+    """
+    Estágio de extração de texto (PDF/DOCX) em um pool de processos, fora da thread da requisição.
+    Cada tarefa tem um tempo máximo de extração, contado a partir do momento em que um processo a inicia
+    (o tempo na fila do pool não conta), e cada processo um limite de memória;
+    PDFs grandes são divididos em intervalos de páginas extraídos em paralelo.
+    A origem de um arquivo pode ser um caminho em disco ou o seu conteúdo em bytes (ex.: membro de ZIP).
+    O texto extraído é normalizado (ver normalizar_partes) antes de ser devolvido.
+    """
+
+    def __init__(self, max_processos, timeout_segundos, limite_memoria_mb, paginas_por_tarefa, normalizar=True):
+        self.max_processos = max_processos
+        self.timeout_segundos = timeout_segundos
+        self.limite_memoria_mb = limite_memoria_mb
+        self.paginas_por_tarefa = paginas_por_tarefa
+        self.normalizar = normalizar
+        self._executor = None
+        self._parar_escuta = None  # Encerra a thread que recebe os inícios de tarefa do pool atual
+        self._despachante = None  # Threads que aguardam extrações enviadas com submeter()
+        self._lock = threading.Lock()
+        self._ids_tarefas = itertools.count()
+        self._inicios = {}  # id da tarefa -> momento em que começou a rodar (None enquanto está na fila)
+        self._prazos = {}  # id da tarefa -> prazo máximo contado do envio (vale mesmo sem o aviso de início)
+
+    def _obter_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn' evita herdar, via fork, locks e threads do servidor Flask
+                contexto = multiprocessing.get_context('spawn')
+                # Uma fila por pool: um processo encerrado à força pode deixá-la inutilizável
+                fila_inicios = contexto.Queue()
+                self._parar_escuta = threading.Event()
+                threading.Thread(target=self._escutar_inicios, args=(fila_inicios, self._parar_escuta),
+                                 name='extracao-inicios', daemon=True).start()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_processos,
+                    mp_context=contexto,
+                    initializer=_inicializar_processo,
+                    initargs=(self.limite_memoria_mb, fila_inicios)
+                )
+            return self._executor
+
+    def _descartar_executor(self, executor=None):
+        """Esquece o pool atual (ou só `executor`, se ainda for o atual). Chamar com self._lock. Retorna se descartou."""
+        if self._executor is None or (executor is not None and self._executor is not executor):
+            return False
+        self._executor = None
+        self._parar_escuta.set()
+        return True
+
+    def _escutar_inicios(self, fila_inicios, parar):
+        """Thread: registra o momento em que cada tarefa começa a rodar em um processo do pool."""
+        while not parar.is_set():
+            try:
+                id_tarefa = fila_inicios.get(timeout=INTERVALO_VERIFICACAO_SEGUNDOS)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError) as e:
+                # Sem os avisos de início, só o prazo máximo protege as tarefas deste pool: as próximas vão para um novo
+                logging.error(f"Fila de inícios do pool de extração falhou ({e}); o pool será recriado.")
+                # O pool antigo não é encerrado: as tarefas já enviadas terminam normalmente (ou pelo prazo máximo)
+                with self._lock:
+                    if self._parar_escuta is parar:
+                        self._descartar_executor()
+                break
+            with self._lock:
+                if id_tarefa in self._inicios:
+                    self._inicios[id_tarefa] = time.monotonic()
+
+    def _submeter_tarefa(self, executor, funcao, *args):
+        """
+        Envia uma tarefa ao pool. Retorna (id da tarefa, Future).
+        Além do tempo máximo a partir do início, a tarefa tem um prazo contado do envio, que cobre a espera
+        pelas tarefas à frente na fila (uma rodada de timeout_segundos a cada max_processos tarefas) e uma rodada de folga.
+        """
+        with self._lock:
+            id_tarefa = next(self._ids_tarefas)
+            a_frente = len(self._inicios)
+            self._inicios[id_tarefa] = None
+            self._prazos[id_tarefa] = time.monotonic() + self.timeout_segundos * (2 + a_frente // self.max_processos)
+        return id_tarefa, executor.submit(_executar_tarefa, id_tarefa, funcao, *args)
+
+    def _aguardar(self, tarefas):
+        """
+        Aguarda as tarefas [(id, Future)] e retorna os seus resultados, na mesma ordem.
+        Lança FuturesTimeoutError se alguma rodar por mais de timeout_segundos (o tempo na fila não conta)
+        ou passar do prazo máximo contado do envio (ex.: o aviso de início se perdeu).
+        """
+        ids = [id_tarefa for id_tarefa, _ in tarefas]
+        futures = [future for _, future in tarefas]
+        try:
+            while True:
+                concluidos, pendentes = wait(futures, timeout=INTERVALO_VERIFICACAO_SEGUNDOS, return_when=FIRST_EXCEPTION)
+                if not pendentes or any(not f.cancelled() and f.exception() is not None for f in concluidos):
+                    break  # Tudo pronto, ou uma falha que result() repassa abaixo
+                agora = time.monotonic()
+                with self._lock:
+                    situacao = [(self._inicios.get(id_tarefa), self._prazos.get(id_tarefa, agora))
+                                for id_tarefa, future in tarefas if future in pendentes]
+                if any((inicio is not None and agora - inicio > self.timeout_segundos) or agora > prazo
+                       for inicio, prazo in situacao):
+                    raise FuturesTimeoutError()
+            return [future.result() for future in futures]
+        finally:
+            with self._lock:
+                for id_tarefa in ids:
+                    self._inicios.pop(id_tarefa, None)
+                    self._prazos.pop(id_tarefa, None)
+
+    def _reiniciar(self, executor):
+        """Descarta um pool travado (ex.: PDF patológico), encerrando os seus processos."""
+        with self._lock:
+            self._descartar_executor(executor)  # Se ainda for o atual (o pool pode já ter sido trocado)
+        # ProcessPoolExecutor não permite cancelar uma tarefa em execução: encerra os processos diretamente
+        processos = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for processo in processos:
+            try:
+                processo.terminate()
+            except Exception as e_term:
+                logging.warning(f"Erro ao encerrar processo de extração: {e_term}")
+
+    def _executar(self, caminho_arquivo, nome):
+        """Extrai as partes (páginas/parágrafos) do arquivo. Pode lançar TimeoutError/BrokenProcessPool."""
+        executor = self._obter_executor()
+        try:
+            if nome.endswith('.docx'):
+                return self._aguardar([self._submeter_tarefa(executor, _tarefa_docx, caminho_arquivo)])[0]
+
+            resultado = self._aguardar([self._submeter_tarefa(executor, _tarefa_pdf, caminho_arquivo, self.paginas_por_tarefa)])[0]
+            if resultado is None:
+                return None
+            tipo, valor = resultado
+            if tipo == 'paginas':
+                return valor
+
+            # PDF grande: um intervalo de páginas por tarefa, extraídos em paralelo
+            num_paginas = valor
+            logging.info(f"PDF '{nome}' com {num_paginas} páginas: extraindo em intervalos de {self.paginas_por_tarefa}.")
+            tarefas = [self._submeter_tarefa(executor, _tarefa_intervalo_pdf, caminho_arquivo, inicio, min(inicio + self.paginas_por_tarefa, num_paginas))
+                       for inicio in range(0, num_paginas, self.paginas_por_tarefa)]
+            paginas = []
+            for parte in self._aguardar(tarefas):
+                if parte is None:
+                    return None
+                paginas.extend(parte)
+            return paginas
+        except FuturesTimeoutError:
+            self._reiniciar(executor)
+            raise
+
+    def extrair(self, caminho_arquivo, nome_original):
+        """
+        Extrai o texto de um CV (PDF/DOCX; caminho ou bytes) no pool de processos.
+        Retorna (texto, unidade, segmentos, caracteres_originais): o texto (uma página/parágrafo por linha),
+        a unidade ('pagina' ou 'paragrafo'), a posição de cada parte no texto (ver montar_texto_com_segmentos)
+        e o tamanho do texto antes da normalização; texto é None em caso de erro, tempo esgotado ou limite de memória.
+        """
+        nome = nome_original.lower()
+        if nome.endswith('.pdf'):
+            unidade = 'pagina'
+        elif nome.endswith('.docx'):
+            unidade = 'paragrafo'
+        else:
+            return None, None, [], 0
+
+        for tentativa in range(2):
+            try:
+                partes = self._executar(caminho_arquivo, nome)
+                break
+            except FuturesTimeoutError:
+                logging.error(f"Extração de '{nome_original}' excedeu {self.timeout_segundos}s; arquivo ignorado.")
+                return None, unidade, [], 0
+            except (BrokenProcessPool, CancelledError):
+                # O pool caiu (limite de memória ou reinício causado por outro arquivo): tenta uma vez em um pool novo
+                logging.warning(f"Pool de extração interrompido durante '{nome_original}' (tentativa {tentativa + 1}).")
+                with self._lock:
+                    if self._executor is not None and getattr(self._executor, '_broken', False):
+                        self._descartar_executor()
+                partes = None
+            except MemoryError:
+                logging.error(f"Extração de '{nome_original}' excedeu o limite de memória.")
+                return None, unidade, [], 0
+
+        if partes is None:
+            return None, unidade, [], 0
+        caracteres_originais = sum(len(parte) + 1 for parte in partes if parte)  # Como em montar_texto_com_segmentos
+        if self.normalizar:
+            partes = normalizar_partes(partes, paginado=(unidade == 'pagina'))
+        texto, segmentos = montar_texto_com_segmentos(partes)
+        return texto, unidade, segmentos, caracteres_originais
+
+    def submeter(self, caminho_arquivo, nome_original):
+        """
+        Inicia a extração sem bloquear o chamador (ex.: assim que um membro de ZIP é lido).
+        Retorna um Future cujo resultado é o mesmo de extrair().
+        """
+        with self._lock:
+            if self._despachante is None:
+                self._despachante = ThreadPoolExecutor(max_workers=self.max_processos, thread_name_prefix='extracao')
+            despachante = self._despachante
+        return despachante.submit(self.extrair, caminho_arquivo, nome_original)
+
+    def encerrar(self):
+        with self._lock:
+            executor = self._executor
+            self._descartar_executor()
+            despachante, self._despachante = self._despachante, None
+        if despachante is not None:
+            despachante.shutdown(wait=False, cancel_futures=True)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+# Instância única do processo
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def obter_extraction_pool():
+    """Retorna o pool de extração global, criando-o na primeira chamada."""
+    global _extraction_pool
+    if _extraction_pool is None:
+        with _extraction_pool_lock:
+            if _extraction_pool is None:
+                config = current_app.config if has_app_context() else {}
+                _extraction_pool = ExtractionPool(
+                    config.get('MAX_PROCESSOS_EXTRACAO', MAX_PROCESSOS_EXTRACAO),
+                    config.get('TIMEOUT_EXTRACAO_SEGUNDOS', TIMEOUT_EXTRACAO_SEGUNDOS),
+                    config.get('LIMITE_MEMORIA_EXTRACAO_MB', LIMITE_MEMORIA_EXTRACAO_MB),
+                    config.get('PAGINAS_POR_TAREFA_PDF', PAGINAS_POR_TAREFA_PDF),
+                    config.get('NORMALIZAR_TEXTO_CV', NORMALIZAR_TEXTO_CV)
+                )
+                atexit.register(_extraction_pool.encerrar)
+    return _extraction_pool
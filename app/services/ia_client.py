@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import re
+import time
+import random
+import logging
+from flask import current_app, has_app_context
+from google.api_core import exceptions as api_exceptions
+from app.config import obter_modelo_ia, opcoes_chamada_ia, MAX_TENTATIVAS_IA, BACKOFF_BASE_SEGUNDOS, BACKOFF_MAX_SEGUNDOS
+from app.services.rate_limiter import obter_rate_limiter, estimar_tokens, calibrar_estimativa_tokens
+
+def _config(chave, padrao):
+    """Lê uma configuração do app Flask, se houver contexto, senão usa o valor do módulo config."""
+    return current_app.config.get(chave, padrao) if has_app_context() else padrao
+
+def extrair_retry_after(erro):
+    """Extrai (em segundos) a dica de espera enviada pela API em um erro 429, se houver."""
+    # 1. Cabeçalho HTTP Retry-After (transporte REST)
+    resposta = getattr(erro, 'response', None)
+    headers = getattr(resposta, 'headers', None)
+    if headers:
+        valor = headers.get('Retry-After')
+        if valor:
+            try:
+                return float(valor)
+            except ValueError:
+                pass
+    # 2. RetryInfo nos detalhes do erro (transporte gRPC)
+    for detalhe in getattr(erro, 'details', None) or []:
+        retry_delay = getattr(detalhe, 'retry_delay', None)
+        if retry_delay is not None:
+            return getattr(retry_delay, 'seconds', 0) + getattr(retry_delay, 'nanos', 0) / 1e9
+    # 3. Texto da mensagem ("Please retry in 17.5s" / "retry_delay { seconds: 17 }")
+    mensagem = str(erro)
+    match = re.search(r'retry in ([\d.]+)\s*s', mensagem, re.IGNORECASE) or \
+        re.search(r'retry_delay\s*\{\s*seconds:\s*(\d+)', mensagem)
+    if match:
+        return float(match.group(1))
+    return None
+
+def calcular_backoff(tentativa, retry_after=None):
+    """Backoff exponencial com jitter; nunca menor que a dica de espera da API."""
+    base = _config('BACKOFF_BASE_SEGUNDOS', BACKOFF_BASE_SEGUNDOS)
+    teto = min(_config('BACKOFF_MAX_SEGUNDOS', BACKOFF_MAX_SEGUNDOS), base * (2 ** tentativa))
+    espera = random.uniform(teto / 2, teto)
+    if retry_after:
+        espera = max(espera, retry_after)
+    return espera
+
+def _calibrar_estimativa(prompt, response):
+    """Usa a contagem de tokens do prompt devolvida pela API (se o SDK a expuser) para calibrar a estimativa local."""
+    uso = getattr(response, 'usage_metadata', None)
+    tokens_reais = getattr(uso, 'prompt_token_count', None) if uso is not None else None
+    if isinstance(prompt, str) and isinstance(tokens_reais, int):
+        calibrar_estimativa_tokens(len(prompt), tokens_reais)
+
+def tokens_consumidos(resposta):
+    """Total de tokens (prompt + resposta) medido pela API, se o SDK o expuser; senão None."""
+    uso = getattr(resposta, 'usage_metadata', None)
+    total = getattr(uso, 'total_token_count', None) if uso is not None else None
+    return total if isinstance(total, int) else None
+
+def texto_da_resposta(resposta):
+    """
+    Texto de uma resposta (ou de um pedaço de resposta em streaming) do modelo, ou "" se não houver.
+    O SDK lança ValueError ao ler .text quando não há partes (ex.: bloqueio de segurança, pedaço só com o motivo de término).
+    """
+    try:
+        return getattr(resposta, 'text', '') or ''
+    except ValueError as e:
+        logging.warning(f"Resposta da IA sem texto: {e}")
+        return ''
+
+def gerar_conteudo(prompt, finalidade='padrao'):
+    """
+    Ponto único de chamada ao modelo: aguarda orçamento no rate limiter global
+    e então executa `generate_content` no cliente compartilhado da finalidade (ver obter_modelo_ia).
+    Erros 429 (ResourceExhausted) são repetidos com backoff exponencial e reduzem o ritmo
+    global do limitador; se as tentativas se esgotarem, a última exceção é propagada ao chamador.
+    Antes da chamada só a estimativa do prompt é reservada; depois dela o total medido é cobrado do orçamento.
+    """
+    limitador = obter_rate_limiter()
+    max_tentativas = _config('MAX_TENTATIVAS_IA', MAX_TENTATIVAS_IA)
+    tokens = estimar_tokens(prompt)
+
+    for tentativa in range(max_tentativas):
+        limitador.adquirir(tokens)
+        try:
+            response = obter_modelo_ia(finalidade).generate_content(prompt, **opcoes_chamada_ia())
+            limitador.registrar_sucesso()
+            limitador.registrar_tokens_reais(tokens, tokens_consumidos(response))
+            _calibrar_estimativa(prompt, response)
+            return response
+        except api_exceptions.TooManyRequests as e:
+            retry_after = extrair_retry_after(e)
+            limitador.registrar_limite_atingido(retry_after)
+            if tentativa + 1 >= max_tentativas:
+                logging.error(f"Limite da API atingido; desistindo após {max_tentativas} tentativa(s).")
+                raise
+            espera = calcular_backoff(tentativa, retry_after)
+            logging.warning(f"Limite da API atingido (tentativa {tentativa + 1}/{max_tentativas}). Nova tentativa em {espera:.1f}s...")
+            time.sleep(espera)
+
+def gerar_conteudo_stream(prompt, finalidade='chat'):
+    """
+    Versão em streaming de gerar_conteudo: gera os pedaços de texto da resposta à medida que o modelo
+    os produz (`generate_content(stream=True)`). Erros 429 só são repetidos antes do primeiro pedaço;
+    depois disso a exceção é propagada, pois parte da resposta já foi entregue ao chamador.
+    """
+    limitador = obter_rate_limiter()
+    max_tentativas = _config('MAX_TENTATIVAS_IA', MAX_TENTATIVAS_IA)
+    tokens = estimar_tokens(prompt)
+
+    for tentativa in range(max_tentativas):
+        limitador.adquirir(tokens)
+        recebeu_texto = False
+        total_tokens = None
+        try:
+            for pedaco in obter_modelo_ia(finalidade).generate_content(prompt, stream=True, **opcoes_chamada_ia()):
+                # A contagem de uso vem acumulada nos pedaços (completa no último)
+                total_tokens = tokens_consumidos(pedaco) or total_tokens
+                texto = texto_da_resposta(pedaco)
+                if texto:
+                    recebeu_texto = True
+                    yield texto
+            limitador.registrar_sucesso()
+            limitador.registrar_tokens_reais(tokens, total_tokens)
+            return
+        except api_exceptions.TooManyRequests as e:
+            retry_after = extrair_retry_after(e)
+            limitador.registrar_limite_atingido(retry_after)
+            if recebeu_texto or tentativa + 1 >= max_tentativas:
+                logging.error(f"Limite da API atingido durante o streaming (tentativa {tentativa + 1}/{max_tentativas}).")
+                raise
+            espera = calcular_backoff(tentativa, retry_after)
+            logging.warning(f"Limite da API atingido (tentativa {tentativa + 1}/{max_tentativas}). Nova tentativa em {espera:.1f}s...")
+            time.sleep(espera)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.config import MAX_LOTES_SIMULTANEOS, INTERVALO_VERIFICACAO_FILA_SEGUNDOS, INTERVALO_HEARTBEAT_LOTE_SEGUNDOS, LIMITE_HEARTBEAT_LOTE_SEGUNDOS
+from app.database.db_manager import close_connection, liberar_conexao, transacao
+from app.database.models import BatchModel, BatchEventModel
+from app.services.processing_service import processar_lote
+
+class JobRunner:
+    """
+    Executor de lotes em segundo plano, independente das conexões SSE.
+    A fila é a própria tabela `batches` (status 'na_fila'); o andamento de cada lote é gravado
+    em `batch_events`, de onde qualquer número de clientes SSE o reproduz a partir de um cursor.
+    Cada lote reservado fica registrado com o executor dono e um heartbeat renovado periodicamente; lotes cujo
+    dono parou de renovar (processo encerrado ou reiniciado) voltam para a fila. Lotes de outros processos ativos
+    no mesmo banco não são tocados.
+    """
+
+    def __init__(self, app, max_lotes_simultaneos, intervalo_verificacao,
+                 intervalo_heartbeat=INTERVALO_HEARTBEAT_LOTE_SEGUNDOS, limite_heartbeat=LIMITE_HEARTBEAT_LOTE_SEGUNDOS):
+        self.app = app
+        self.max_lotes_simultaneos = max(1, max_lotes_simultaneos)
+        self.intervalo_verificacao = intervalo_verificacao
+        self.intervalo_heartbeat = intervalo_heartbeat
+        self.limite_heartbeat = limite_heartbeat
+        self.executor_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._ultimo_heartbeat = 0.0
+        self._iniciado = False
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._novos_eventos = threading.Condition()
+        self._em_execucao = set()
+        self._executor = None
+
+    def iniciar(self):
+        """Inicia a thread que consome a fila (chamadas seguintes não fazem nada)."""
+        if self._iniciado:
+            return
+        with self._lock:
+            if self._iniciado:
+                return
+            self._iniciado = True
+            with self.app.app_context():
+                try:
+                    self._recuperar_lotes_interrompidos()
+                finally:
+                    close_connection(None)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_lotes_simultaneos, thread_name_prefix='batch-job')
+            threading.Thread(target=self._loop, name='job-runner', daemon=True).start()
+            logging.info(f"Executor de lotes iniciado (até {self.max_lotes_simultaneos} lote(s) ao mesmo tempo).")
+
+    def _recuperar_lotes_interrompidos(self):
+        """Devolve à fila os lotes 'processando' cujo executor parou de dar sinal de vida."""
+        with transacao():
+            for batch_id in BatchModel.requeue_interrupted(self.limite_heartbeat):
+                logging.warning(f"Batch {batch_id} estava em processamento em um executor que parou; voltando para a fila.")
+                BatchEventModel.create(batch_id, {'type': 'status', 'message': 'Processamento retomado após reinício do servidor.'})
+
+    def _renovar_heartbeat(self):
+        """A cada intervalo_heartbeat: confirma os lotes deste executor e recupera os de executores parados."""
+        agora = time.monotonic()
+        if agora - self._ultimo_heartbeat < self.intervalo_heartbeat:
+            return
+        self._ultimo_heartbeat = agora
+        BatchModel.heartbeat(self.executor_id, list(self._em_execucao))
+        self._recuperar_lotes_interrompidos()
+
+    def notificar(self):
+        """Avisa que há um novo lote na fila (evita esperar o intervalo de verificação)."""
+        self._acordar.set()
+
+    def _loop(self):
+        while True:
+            self._acordar.wait(self.intervalo_verificacao)
+            self._acordar.clear()
+            try:
+                with self.app.app_context():
+                    try:
+                        self._renovar_heartbeat()
+                        while len(self._em_execucao) < self.max_lotes_simultaneos:
+                            batch_id = BatchModel.claim_next_queued(self.executor_id)
+                            if not batch_id:
+                                break
+                            self._em_execucao.add(batch_id)
+                            self._executor.submit(self._executar_lote, batch_id)
+                    finally:
+                        close_connection(None)
+            except Exception as e_loop:
+                logging.error(f"Erro no executor de lotes: {e_loop}", exc_info=True)
+
+    def _executar_lote(self, batch_id):
+        with self.app.app_context():
+            try:
+                for evento in processar_lote(batch_id):
+                    self._gravar_evento(batch_id, evento)
+                    # Um lote pode levar horas: a conexão volta ao pool entre um evento e outro
+                    liberar_conexao()
+            except Exception as e_job:
+                logging.error(f"Erro inesperado ao executar Batch {batch_id}: {e_job}", exc_info=True)
+            finally:
+                close_connection(None)
+                self._em_execucao.discard(batch_id)
+                self._acordar.set()  # Vaga livre: verifica a fila de novo
+
+    def _gravar_evento(self, batch_id, evento):
+        event_id = BatchEventModel.create(batch_id, evento)
+        with self._novos_eventos:
+            self._novos_eventos.notify_all()
+        return event_id
+
+    def aguardar_eventos(self, timeout):
+        """Bloqueia até algum lote gravar um novo evento (ou até o timeout)."""
+        with self._novos_eventos:
+            self._novos_eventos.wait(timeout)
+
+# Instância única do processo
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def obter_job_runner():
+    """Retorna o executor de lotes global, criando-o na primeira chamada (requer contexto de app)."""
+    global _job_runner
+    if _job_runner is None:
+        with _job_runner_lock:
+            if _job_runner is None:
+                config = current_app.config
+                _job_runner = JobRunner(
+                    current_app._get_current_object(),
+                    config.get('MAX_LOTES_SIMULTANEOS', MAX_LOTES_SIMULTANEOS),
+                    config.get('INTERVALO_VERIFICACAO_FILA_SEGUNDOS', INTERVALO_VERIFICACAO_FILA_SEGUNDOS),
+                    config.get('INTERVALO_HEARTBEAT_LOTE_SEGUNDOS', INTERVALO_HEARTBEAT_LOTE_SEGUNDOS),
+                    config.get('LIMITE_HEARTBEAT_LOTE_SEGUNDOS', LIMITE_HEARTBEAT_LOTE_SEGUNDOS)
+                )
+    return _job_runner
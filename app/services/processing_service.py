@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import queue
+import shutil
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app.config import NOME_MODELO_GEMMA
+from app.database.db_manager import close_connection
+from app.database.models import AnalysisCacheModel, BatchModel, ChatModel, FileModel, FileTextModel, ResultModel
+from app.services.document_service import allowed_cv_file, carregar_origem_arquivo, extrair_arquivos_zip, ler_arquivos_zip_em_memoria, separar_caminho_membro_zip
+from app.services.extraction_pool import obter_extraction_pool
+from app.services.ai_service import extrair_dados_com_ia, extrair_dados_em_lote, gerar_e_salvar_relatorio, salvar_relatorio_txt, processar_instrucao_inicial, analisar_cv_unificado
+from app.services.web_service import pesquisar_e_sumarizar_web
+from app.services.rate_limiter import estimar_tokens, tokens_por_caracteres
+from app.utils.helpers import calcular_hash_texto
+
+# Marcador enviado pela thread de trabalho quando termina um arquivo
+_FIM_ARQUIVO = object()
+
+class _EntradaCache:
+    """Acesso ao cache de análises de um único CV (chave = hash do texto normalizado + modelo + versão dos prompts)."""
+
+    def __init__(self, content_hash):
+        self.content_hash = content_hash
+        self.versao = current_app.config['VERSAO_PROMPTS']
+        self.chave = hashlib.sha256(f"{content_hash}|{NOME_MODELO_GEMMA}|{self.versao}".encode('utf-8')).hexdigest()
+        self.row = AnalysisCacheModel.get(self.chave)
+
+    def obter(self, campo):
+        if not self.row or self.row[campo] is None:
+            return None
+        return json.loads(self.row[campo]) if campo == 'data_json' else self.row[campo]
+
+    def salvar(self, campo, valor):
+        if valor:
+            AnalysisCacheModel.save_field(self.chave, self.content_hash, NOME_MODELO_GEMMA, self.versao, campo, valor)
+
+def _abrir_cache(texto_cv):
+    """Retorna a entrada de cache do CV, ou None se o cache estiver desativado/indisponível."""
+    if not current_app.config.get('CACHE_ANALISES_ATIVO'):
+        return None
+    try:
+        return _EntradaCache(calcular_hash_texto(texto_cv))
+    except Exception as e_cache:
+        logging.warning(f"Cache de análises indisponível: {e_cache}")
+        return None
+
+def processar_arquivo_cv(file_info, index, total, flags, emitir):
+    """
+    Executa o pipeline completo de um CV (leitura -> extração IA -> relatório -> pesquisa web).
+    Cada atualização é entregue ao callback `emitir` como um dict no formato do SSE.
+    Retorna (resultados_cv, file_quota_error).
+    """
+    file_id = file_info['file_id']
+    caminho_cv = file_info['saved_path']
+    nome_original_cv = file_info['original_name']
+    current_batch_folder = file_info['batch_folder']
+    file_quota_error = False
+    start_file_time = time.time()
+
+    emitir({'type': 'file_start', 'filename': nome_original_cv, 'index': index, 'total': total, 'file_id': file_id})
+
+    resultados_cv = {
+        "filename": nome_original_cv,
+        "file_id": file_id,
+        "steps": {},
+        "data": None,
+        "web_summary": None,
+        "status_final": "Pendente",
+        "error_message": None,
+        "texto_completo": None,
+        "caracteres_texto_original": None,  # Antes da normalização (relatório de tokens do lote)
+        "tempos_etapas": {},
+        "tempo_total_ms": None
+    }
+    inicio_etapas = {}
+
+    def _emitir(evento):
+        # Registra a duração de cada etapa (gravada com o resultado) e repassa o evento
+        if evento['type'] == 'step_start':
+            inicio_etapas[evento['step']] = time.time()
+        elif evento['type'] == 'step_done' and evento['step'] in inicio_etapas:
+            resultados_cv['tempos_etapas'][evento['step']] = round((time.time() - inicio_etapas.pop(evento['step'])) * 1000)
+        emitir(evento)
+    texto_extraido = None
+    dados_json = None
+    relatorio_unificado = None  # Preenchidos pela análise unificada (flags['analise_unificada'])
+    keywords_unificadas = None
+
+    try:
+        # 1. Leitura
+        _emitir({'type': 'step_start', 'filename': nome_original_cv, 'step': 'Leitura'})
+
+        # Extração feita no pool de processos (não bloqueia o GIL das threads de análise).
+        # Membros de ZIP lidos em memória já chegam com a extração em andamento.
+        extracao = file_info.pop('extracao', None)  # Não mantém o resultado da extração em memória depois de usado
+        if extracao is not None:
+            texto_extraido, unidade_segmentos, segmentos, caracteres_originais = extracao.result()
+        else:
+            origem_cv = carregar_origem_arquivo(caminho_cv)
+            if origem_cv is None:
+                raise ValueError("Arquivo físico não encontrado.")
+            texto_extraido, unidade_segmentos, segmentos, caracteres_originais = obter_extraction_pool().extrair(origem_cv, nome_original_cv)
+
+        if texto_extraido is not None:
+            resultados_cv['texto_completo'] = texto_extraido
+            resultados_cv['caracteres_texto_original'] = caracteres_originais
+            # Persistido já na ingestão: a visualização do texto não precisa reprocessar o arquivo
+            FileTextModel.save(file_id, texto_extraido, unidade_segmentos, segmentos)
+
+        if texto_extraido is None:
+            status_leitura = "Erro interno na leitura do arquivo."
+            raise ValueError(status_leitura)
+        elif not texto_extraido.strip():
+            status_leitura = "Arquivo vazio ou sem texto legível."
+        else:
+            status_leitura = f"OK ({len(texto_extraido)} caracteres)."
+
+        resultados_cv['steps']['Leitura'] = status_leitura
+        _emitir({'type': 'step_done', 'filename': nome_original_cv, 'step': 'Leitura', 'status': status_leitura})
+
+        if texto_extraido and texto_extraido.strip():
+            # 2. Extração IA -> "Analisando dados do arquivo"
+            step_name_ext = "Analisando dados do arquivo"
+            _emitir({'type': 'step_start', 'filename': nome_original_cv, 'step': step_name_ext})
+            cache = _abrir_cache(texto_extraido)
+            dados_json = cache.obter('data_json') if cache else None
+            hit_ext = bool(dados_json)
+            if hit_ext:
+                status_ext, q_error_ext = "Dados recuperados do cache (CV já analisado).", False
+            else:
+                # Resultado da extração agrupada (pré-passo), se este CV entrou em uma chamada conjunta
+                extracao_agrupada = file_info.pop('dados_agrupados', None)
+                resultado_agrupado = extracao_agrupada.result() if extracao_agrupada is not None else None
+                if resultado_agrupado:
+                    dados_json, status_ext = resultado_agrupado
+                    q_error_ext = False
+                elif flags.get('analise_unificada'):
+                    # Uma chamada para dados + relatório + keywords (só o que ainda não está no cache)
+                    pedir_relatorio = bool(flags.get('gerar_relatorio')) and not (cache and cache.obter('report_text'))
+                    pedir_keywords = bool(flags.get('pesquisar_web')) and not (cache and cache.obter('web_summary'))
+                    dados_json, relatorio_unificado, keywords_unificadas, status_ext, q_error_ext = analisar_cv_unificado(
+                        texto_extraido, pedir_relatorio, pedir_keywords)
+                    if not dados_json and not q_error_ext:
+                        # Resposta combinada inválida: volta para as chamadas separadas
+                        logging.warning(f"Análise unificada falhou para '{nome_original_cv}' ({status_ext}); usando extração separada.")
+                        dados_json, status_ext, q_error_ext = extrair_dados_com_ia(texto_extraido)
+                else:
+                    dados_json, status_ext, q_error_ext = extrair_dados_com_ia(texto_extraido)
+                if cache:
+                    cache.salvar('data_json', dados_json)
+            resultados_cv['steps'][step_name_ext] = status_ext
+
+            if q_error_ext:
+                file_quota_error = True
+
+            if not dados_json:
+                _emitir({'type': 'warning', 'filename': nome_original_cv, 'message': f'Não foi possível extrair dados básicos. ({status_ext})'})
+            else:
+                resultados_cv['data'] = dados_json
+
+            _emitir({'type': 'step_done', 'filename': nome_original_cv, 'step': step_name_ext, 'status': status_ext, 'data': dados_json, 'cache': hit_ext})
+
+            # 3. Relatório Condicional -> "Gerando relatório"
+            if flags.get('gerar_relatorio'):
+                step_name_rel = "Gerando relatório"
+                _emitir({'type': 'step_start', 'filename': nome_original_cv, 'step': step_name_rel})
+
+                texto_relatorio = cache.obter('report_text') if cache else None
+                hit_rel = bool(texto_relatorio)
+                if hit_rel:
+                    nome_relatorio = salvar_relatorio_txt(texto_relatorio, nome_original_cv, current_batch_folder)
+                    status_rel, q_error_rel = f"Relatório salvo como {nome_relatorio} (recuperado do cache).", False
+                elif relatorio_unificado:
+                    texto_relatorio = relatorio_unificado
+                    nome_relatorio = salvar_relatorio_txt(texto_relatorio, nome_original_cv, current_batch_folder)
+                    status_rel, q_error_rel = f"Relatório salvo como {nome_relatorio} (análise unificada).", False
+                    if cache:
+                        cache.salvar('report_text', texto_relatorio)
+                else:
+                    sucesso_rel, status_rel, q_error_rel, texto_relatorio = gerar_e_salvar_relatorio(dados_json or {}, texto_extraido, nome_original_cv, current_batch_folder)
+                    if cache and sucesso_rel:
+                        cache.salvar('report_text', texto_relatorio)
+                resultados_cv['steps'][step_name_rel] = status_rel
+
+                if q_error_rel:
+                    file_quota_error = True
+
+                _emitir({'type': 'step_done', 'filename': nome_original_cv, 'step': step_name_rel, 'status': status_rel, 'cache': hit_rel})
+            else:
+                resultados_cv['steps']['Gerando relatório'] = "Não solicitado"
+
+            # 4. Pesquisa Web Condicional -> "Pesquisando tópico chave online"
+            if flags.get('pesquisar_web'):
+                step_name_web = "Pesquisando tópico chave online"
+                _emitir({'type': 'step_start', 'filename': nome_original_cv, 'step': step_name_web})
+
+                resultado_pesq = cache.obter('web_summary') if cache else None
+                hit_web = bool(resultado_pesq)
+                if hit_web:
+                    status_pesq, q_error_pesq = "Pesquisa web recuperada do cache.", False
+                else:
+                    status_pesq, resultado_pesq, q_error_pesq = pesquisar_e_sumarizar_web(texto_extraido, keywords_unificadas)
+                    if cache:
+                        cache.salvar('web_summary', resultado_pesq)
+                resultados_cv['steps'][step_name_web] = status_pesq
+                resultados_cv['web_summary'] = resultado_pesq
+
+                if q_error_pesq:
+                    file_quota_error = True
+
+                _emitir({'type': 'step_done', 'filename': nome_original_cv, 'step': step_name_web, 'status': status_pesq, 'summary': resultado_pesq, 'cache': hit_web})
+            else:
+                resultados_cv['steps']['Pesquisando tópico chave online'] = "Não solicitado"
+
+            resultados_cv['status_final'] = 'Sucesso'
+        else:  # Caso não haja texto extraído
+            resultados_cv['steps']['Analisando dados do arquivo'] = "Pulado (sem texto)"
+            resultados_cv['steps']['Gerando relatório'] = "Pulado (sem texto)"
+            resultados_cv['steps']['Pesquisando tópico chave online'] = "Pulado (sem texto)"
+            resultados_cv['status_final'] = 'Sucesso (sem texto para IA)'
+    except Exception as e_proc:
+        error_msg = f"Erro no processamento do arquivo {nome_original_cv}: {e_proc}"
+        logging.error(error_msg, exc_info=True)
+        resultados_cv['status_final'] = 'Erro'
+        resultados_cv['error_message'] = str(e_proc)
+        _emitir({'type': 'file_error', 'filename': nome_original_cv, 'message': error_msg, 'file_id': file_id})
+    finally:
+        proc_time = time.time() - start_file_time
+        resultados_cv['tempo_total_ms'] = round(proc_time * 1000)
+        logging.info(f"=== Fim CV {nome_original_cv} (FileID: {file_id}): {proc_time:.2f}s | Status: {resultados_cv['status_final']} | Quota Error: {file_quota_error} ===")
+        _emitir({'type': 'file_done', 'result': resultados_cv, 'quota_error': file_quota_error})
+
+    return resultados_cv, file_quota_error
+
+def _iniciar_extracao_agrupada(app, files_to_process):
+    """
+    Pré-passo da extração agrupada, em uma thread em segundo plano: inicia no pool a extração de texto
+    de todos os arquivos e junta os CVs curtos em chamadas de extração conjuntas (extrair_dados_em_lote),
+    até MAX_CVS_POR_EXTRACAO_AGRUPADA CVs e ORCAMENTO_TOKENS_EXTRACAO_AGRUPADA tokens por chamada.
+    Cada arquivo recebe em file_info['dados_agrupados'] um Future com (dados, status), ou None quando
+    o CV não foi agrupado ou veio inválido na resposta (a thread do arquivo faz a extração individual).
+    """
+    config = app.config
+    pool = obter_extraction_pool()
+    itens = []
+    for file_info in files_to_process:
+        if 'extracao' not in file_info:
+            origem = carregar_origem_arquivo(file_info['saved_path'])
+            if origem is None:
+                continue  # A thread do arquivo informa o erro de leitura
+            file_info['extracao'] = pool.submeter(origem, file_info['original_name'])
+        file_info['dados_agrupados'] = Future()
+        # Referências guardadas: a thread do arquivo retira as chaves de file_info ao usá-las
+        itens.append((file_info['file_id'], file_info['extracao'], file_info['dados_agrupados']))
+
+    def _resolver(future, valor):
+        if not future.done():
+            future.set_result(valor)
+
+    def _enviar(grupo):
+        dados_por_arquivo, status, _ = extrair_dados_em_lote([(file_id, texto) for file_id, texto, _ in grupo])
+        for file_id, _, future in grupo:
+            dados = dados_por_arquivo.get(file_id)
+            _resolver(future, (dados, status) if dados else None)
+
+    def _pre_passo():
+        with app.app_context():
+            grupo, tokens_grupo = [], 0
+            try:
+                for file_id, extracao, future in itens:
+                    try:
+                        texto = extracao.result()[0]
+                    except Exception:
+                        texto = None
+                    if not texto or not texto.strip() or len(texto) > config['MAX_CARACTERES_CV_AGRUPADO']:
+                        _resolver(future, None)
+                        continue
+                    cache = _abrir_cache(texto)
+                    if cache and cache.obter('data_json'):
+                        _resolver(future, None)  # A thread do arquivo usa o cache
+                        continue
+                    tokens = estimar_tokens(texto)
+                    if grupo and (len(grupo) >= config['MAX_CVS_POR_EXTRACAO_AGRUPADA'] or
+                                  tokens_grupo + tokens > config['ORCAMENTO_TOKENS_EXTRACAO_AGRUPADA']):
+                        _enviar(grupo)
+                        grupo, tokens_grupo = [], 0
+                    grupo.append((file_id, texto, future))
+                    tokens_grupo += tokens
+                if len(grupo) > 1:
+                    _enviar(grupo)  # Um CV sozinho segue pela extração individual
+            except Exception as e_pre:
+                logging.error(f"Erro no pré-passo de extração agrupada: {e_pre}", exc_info=True)
+            finally:
+                # Nenhuma thread de arquivo fica esperando: o que não foi resolvido usa a extração individual
+                for _, _, future in itens:
+                    _resolver(future, None)
+                close_connection(None)
+
+    threading.Thread(target=_pre_passo, name='extracao-agrupada', daemon=True).start()
+
+def processar_arquivos_em_paralelo(files_to_process, flags, max_workers=None):
+    """
+    Processa vários CVs ao mesmo tempo com um pool limitado de threads.
+    É um gerador: devolve os eventos (dicts) de todos os arquivos, intercalados
+    na ordem em que são produzidos pelas threads de trabalho.
+    """
+    app = current_app._get_current_object()
+    if max_workers is None:
+        max_workers = app.config['MAX_ARQUIVOS_PARALELOS']
+    max_workers = max(1, min(max_workers, len(files_to_process) or 1))
+    total = len(files_to_process)
+    fila_eventos = queue.Queue()
+
+    def _worker(i, file_info):
+        # Cada thread tem o seu próprio contexto de app (e, portanto, a sua própria conexão de BD)
+        with app.app_context():
+            try:
+                processar_arquivo_cv(file_info, i + 1, total, flags, fila_eventos.put)
+            except Exception as e_worker:
+                logging.error(f"Erro inesperado na thread do arquivo {file_info.get('original_name')}: {e_worker}", exc_info=True)
+            finally:
+                close_connection(None)
+                fila_eventos.put(_FIM_ARQUIVO)
+
+    if app.config.get('CACHE_ANALISES_ATIVO'):
+        AnalysisCacheModel.evict(app.config['CACHE_MAX_BYTES'], app.config['CACHE_MAX_IDADE_DIAS'])
+
+    # A análise unificada já faz uma única chamada por CV: a extração agrupada não se aplica
+    if app.config.get('EXTRACAO_AGRUPADA_ATIVA') and not flags.get('analise_unificada') and total > 1:
+        _iniciar_extracao_agrupada(app, files_to_process)
+
+    logging.info(f"Iniciando pool de processamento: {total} arquivo(s), até {max_workers} em paralelo.")
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cv-worker')
+    try:
+        for i, file_info in enumerate(files_to_process):
+            executor.submit(_worker, i, file_info)
+
+        pendentes = total
+        while pendentes > 0:
+            evento = fila_eventos.get()
+            if evento is _FIM_ARQUIVO:
+                pendentes -= 1
+                continue
+            yield evento
+    finally:
+        # Se o consumidor abandonar o gerador, não bloqueia esperando as threads restantes
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _evento_publico(evento):
+    """Cópia do evento sem o texto completo do CV (não é exibido e não precisa ser gravado no histórico de eventos)."""
+    if evento.get('type') == 'file_done' and evento.get('result'):
+        evento = dict(evento, result={k: v for k, v in evento['result'].items() if k != 'texto_completo'})
+    return evento
+
+def _relatorio_normalizacao(caracteres_antes, caracteres_depois):
+    """Resumo da economia da normalização dos textos do lote, em tokens estimados (vazio se não houve textos)."""
+    if not caracteres_antes:
+        return ""
+    tokens_antes, tokens_depois = tokens_por_caracteres(caracteres_antes), tokens_por_caracteres(caracteres_depois)
+    reducao = (1 - tokens_depois / tokens_antes) * 100 if tokens_antes else 0
+    return (f"Normalização dos textos: ~{tokens_antes} -> ~{tokens_depois} tokens por envio dos CVs à IA "
+            f"({reducao:.0f}% a menos).")
+
+def _membro_zip(saved_path, zip_path, extract_prefix, batch_folder):
+    """Caminho do membro dentro do ZIP para um arquivo lido dele (em memória ou extraído), ou None se não veio desse ZIP."""
+    zip_origem, nome_membro = separar_caminho_membro_zip(saved_path)
+    if nome_membro is not None:
+        return nome_membro if zip_origem == zip_path else None
+    if saved_path.startswith(extract_prefix):
+        partes = os.path.relpath(saved_path, batch_folder).split(os.sep, 1)  # [pasta de extração, membro]
+        return partes[1].replace(os.sep, '/') if len(partes) == 2 else None
+    return None
+
+def _membros_ja_registrados(zip_path, extract_prefix, batch_folder, arquivos_extraidos):
+    """
+    Arquivos de um ZIP registrados em uma execução anterior do lote (ex.: antes de um reinício),
+    por caminho do membro.
+    """
+    registrados = {}
+    for f in arquivos_extraidos:
+        membro = _membro_zip(f['saved_path'], zip_path, extract_prefix, batch_folder)
+        if membro is not None:
+            registrados.setdefault(membro, f)
+    return registrados
+
+def processar_lote(batch_id):
+    """
+    Executa um lote completo (verificação/leitura de ZIPs, análise dos CVs, instrução inicial).
+    É um gerador: devolve os eventos de andamento (dicts no formato do SSE).
+    O lote já deve ter sido reservado (status 'processando') pelo executor de tarefas.
+    """
+    logging.info(f"--- Iniciando processamento do Batch ID: {batch_id} ---")
+    batch_quota_error_occurred = False
+    final_status = 'pendente'  # Valor padrão para variável de controle
+    temp_folders_to_clean = []
+    
+    try:
+        # Obter informações do batch
+        batch_info_db = BatchModel.get_batch_info(batch_id)
+        
+        if not batch_info_db:
+            yield {'type': 'error', 'message': 'ID de lote inválido.'}
+            return
+            
+        flags = json.loads(batch_info_db['flags_json']) if batch_info_db['flags_json'] else {}
+        initial_instruction = batch_info_db['initial_instruction']
+        
+        # Obter arquivos iniciais do lote
+        initial_files_db = FileModel.get_batch_files(batch_id, only_initial=True)
+        arquivos_extraidos_antes = FileModel.get_extracted_files(batch_id)
+        
+        files_to_process_db = []
+        batch_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], batch_id)
+
+        # Passo 1 Condicional (Verificação/Extração ZIP)
+        contains_zip = any(f['original_name'].lower().endswith('.zip') for f in initial_files_db)
+        if contains_zip:
+            # <<< PASSO 1 >>>
+            yield {'type': 'status', 'message': 'Passo 1: Verificando e extraindo arquivos ZIP...'}
+        else:
+            # <<< PASSO 1 >>>
+            yield {'type': 'status', 'message': 'Passo 1: Verificando arquivos...'}
+
+        # Função callback para registrar arquivos extraídos no banco
+        def register_extracted_file(batch_id, filename, filepath, is_extracted=1, conteudo=None):
+            file_id = FileModel.create(batch_id, filename, filepath, is_extracted)
+            if file_id:
+                file_info = {
+                    'file_id': file_id, 
+                    'original_name': filename, 
+                    'saved_path': filepath, 
+                    'batch_folder': batch_folder
+                }
+                if conteudo is not None:
+                    # Lido em memória: a extração de texto começa já, enquanto o ZIP ainda é lido
+                    file_info['extracao'] = obter_extraction_pool().submeter(conteudo, filename)
+                files_to_process_db.append(file_info)
+            return file_id
+
+        # Loop de extração de ZIPs
+        for file_row in initial_files_db:
+            file_id = file_row['file_id']
+            original_name = file_row['original_name']
+            saved_path = file_row['saved_path']
+            
+            if original_name.lower().endswith('.zip'):
+                extract_prefix = os.path.join(batch_folder, f"zip_extract_{secure_filename(original_name)}_")
+                registrados = _membros_ja_registrados(saved_path, extract_prefix, batch_folder, arquivos_extraidos_antes)
+                registrar = register_extracted_file
+                if registrados:
+                    # Lote retomado: o ZIP é lido de novo, mas só os itens que ainda não foram registrados viram arquivos novos
+                    yield {'type': 'status', 'message': f'ZIP {original_name} lido parcialmente antes ({len(registrados)} CVs registrados); lendo os itens restantes...'}
+                    for f in registrados.values():
+                        if f['saved_path'].startswith(extract_prefix):
+                            pasta = os.path.join(batch_folder, os.path.relpath(f['saved_path'], batch_folder).split(os.sep)[0])
+                            if pasta not in temp_folders_to_clean and os.path.isdir(pasta):
+                                temp_folders_to_clean.append(pasta)
+
+                    def registrar(batch_id, filename, filepath, is_extracted=1, conteudo=None,
+                                  registrados=registrados, zip_path=saved_path, extract_prefix=extract_prefix):
+                        anterior = registrados.pop(_membro_zip(filepath, zip_path, extract_prefix, batch_folder), None)
+                        if anterior is None:
+                            return register_extracted_file(batch_id, filename, filepath, is_extracted, conteudo)
+                        caminho = anterior['saved_path']
+                        if separar_caminho_membro_zip(caminho)[1] is None and not os.path.exists(caminho):
+                            # A pasta de extração anterior já foi apagada: passa a usar a cópia extraída agora
+                            FileModel.update_saved_path(anterior['file_id'], filepath)
+                            caminho = filepath
+                        file_info = {'file_id': anterior['file_id'], 'original_name': anterior['original_name'],
+                                     'saved_path': caminho, 'batch_folder': batch_folder}
+                        if conteudo is not None:
+                            file_info['extracao'] = obter_extraction_pool().submeter(conteudo, anterior['original_name'])
+                        files_to_process_db.append(file_info)
+                        return anterior['file_id']
+                else:
+                    yield {'type': 'status', 'message': f'Extraindo ZIP: {original_name}...'}
+
+                if current_app.config.get('EXTRAIR_ZIP_EM_MEMORIA'):
+                    yield from ler_arquivos_zip_em_memoria(saved_path, batch_id, registrar)
+                else:
+                    extract_path = f"{extract_prefix}{uuid.uuid4().hex[:8]}"
+                    os.makedirs(extract_path, exist_ok=True)
+                    temp_folders_to_clean.append(extract_path)
+
+                    # Extrair arquivos ZIP
+                    yield from extrair_arquivos_zip(saved_path, extract_path, batch_id, registrar)
+
+                # Registrados antes, mas não encontrados nesta leitura (ex.: limites do ZIP): continuam no lote
+                for f in registrados.values():
+                    if separar_caminho_membro_zip(f['saved_path'])[1] is None and not os.path.exists(f['saved_path']):
+                        continue
+                    files_to_process_db.append({'file_id': f['file_id'], 'original_name': f['original_name'],
+                                                'saved_path': f['saved_path'], 'batch_folder': batch_folder})
+                    
+            elif allowed_cv_file(original_name):
+                files_to_process_db.append({
+                    'file_id': file_id, 
+                    'original_name': original_name, 
+                    'saved_path': saved_path, 
+                    'batch_folder': batch_folder
+                })
+
+        # Lote retomado: arquivos que já têm resultado gravado não são analisados de novo
+        total_cvs = len(files_to_process_db)
+        ja_analisados = ResultModel.get_file_ids_with_results(batch_id)
+        if ja_analisados:
+            files_to_process_db = [f for f in files_to_process_db if f['file_id'] not in ja_analisados]
+            yield {'type': 'status', 'message': f'{total_cvs - len(files_to_process_db)} CV(s) já analisado(s) anteriormente; continuando com os restantes.'}
+
+        # Passo 2: Processar Arquivos de CV
+        if total_cvs == 0:
+            yield {'type': 'warning', 'message': 'Nenhum arquivo CV válido (PDF/DOCX) encontrado para analisar.'}
+            final_status = 'concluido'
+            BatchModel.update_status(batch_id, final_status, batch_quota_error_occurred)
+            yield {'type': 'batch_done', 'message': 'Nenhum arquivo válido para analisar.', 'quota_error': batch_quota_error_occurred}
+            return
+        else:
+            # <<< PASSO 2 >>>
+            yield {'type': 'status', 'message': f'Passo 2: Iniciando análise de {len(files_to_process_db)} CV(s)...'}
+
+        # Os arquivos são processados em paralelo; os eventos chegam na ordem em que são produzidos.
+        # Cada resultado é gravado assim que o arquivo termina (um erro no meio do lote não perde os anteriores)
+        caracteres_antes = caracteres_depois = 0  # Tamanho dos textos antes/depois da normalização
+        for evento in processar_arquivos_em_paralelo(files_to_process_db, flags):
+            if evento['type'] == 'file_done':
+                res_data = evento['result']
+                if res_data.get('caracteres_texto_original') and res_data['texto_completo']:
+                    caracteres_antes += res_data['caracteres_texto_original']
+                    caracteres_depois += len(res_data['texto_completo'])
+                ResultModel.create(
+                    res_data['file_id'], 
+                    batch_id, 
+                    res_data['status_final'], 
+                    res_data['error_message'], 
+                    res_data['steps'], 
+                    res_data['data'], 
+                    res_data['web_summary'], 
+                    res_data['texto_completo'],
+                    res_data['tempo_total_ms'],
+                    res_data['tempos_etapas']
+                )
+                if evento.get('quota_error'):
+                    batch_quota_error_occurred = True
+            yield _evento_publico(evento)
+            
+        logging.info(f"Resultados do Batch {batch_id} salvos no DB.")
+
+        relatorio_normalizacao = _relatorio_normalizacao(caracteres_antes, caracteres_depois)
+        if relatorio_normalizacao:
+            logging.info(f"Batch {batch_id}: {relatorio_normalizacao}")
+            yield {'type': 'status', 'message': relatorio_normalizacao}
+
+        # Processar Instrução Inicial
+        if initial_instruction and total_cvs > 0:
+            yield {'type': 'status', 'message': 'Processando instrução inicial...'}
+            logging.info(f"Processando instrução inicial Batch {batch_id}...")
+            
+            ai_reply, quota_error = processar_instrucao_inicial(batch_id, initial_instruction)
+            
+            if quota_error:
+                batch_quota_error_occurred = True
+                yield {'type': 'error', 'message': ai_reply}
+            elif ai_reply.startswith("Instrução inicial não processada"):
+                yield {'type': 'warning', 'message': ai_reply}
+            else:
+                yield {'type': 'initial_instruction_result', 'reply': ai_reply}
+                ChatModel.create(batch_id, initial_instruction, ai_reply)
+                logging.info("Instrução inicial salva no histórico DB.")
+
+        # Finalizar o lote
+        final_status = 'concluido'
+        logging.info(f"Atualizando status final Batch {batch_id} para '{final_status}', quota_error={batch_quota_error_occurred}")
+        BatchModel.update_status(batch_id, final_status, batch_quota_error_occurred)
+        yield {'type': 'batch_done', 'message': 'Análise do lote concluída.', 'quota_error': batch_quota_error_occurred}
+
+    except Exception as e_geral:
+        # Tratamento de erro geral e limpeza
+        final_status = 'erro_processamento'
+        logging.error(f"Erro crítico Batch {batch_id}: {e_geral}", exc_info=True)
+        
+        try:
+            BatchModel.update_status(batch_id, final_status, batch_quota_error_occurred)
+        except Exception as e_update_fail:
+            logging.error(f"Falha update status erro Batch {batch_id}: {e_update_fail}", exc_info=True)
+            
+        yield {'type': 'error', 'message': f'Erro crítico durante a análise do lote.'}
+        yield {'type': 'batch_failed', 'message': 'Análise do lote falhou.', 'quota_error': batch_quota_error_occurred}
+    finally:
+        # Limpeza de pastas ZIP
+        for folder in temp_folders_to_clean:
+            try:
+                shutil.rmtree(folder)
+                logging.info(f"Pasta ZIP removida: {folder}")
+            except Exception as e_clean:
+                logging.error(f"Erro remover pasta {folder}: {e_clean}", exc_info=True)
+                
+        logging.info(f"--- Fim do processamento Batch {batch_id} | Status DB Final: {final_status} ---")
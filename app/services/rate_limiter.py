@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import logging
+import threading
+from flask import current_app, has_app_context
+from app.config import LIMITE_REQUISICOES_POR_MINUTO, LIMITE_TOKENS_POR_MINUTO
+
+class TokenBucket:
+    """Balde de fichas: acumula até `capacidade` fichas, repostas continuamente a `taxa_por_segundo`."""
+
+    def __init__(self, capacidade, taxa_por_segundo, agora=None):
+        self.capacidade = float(capacidade)
+        self.taxa_por_segundo = float(taxa_por_segundo)
+        self.fichas = float(capacidade)
+        self.ultima_reposicao = time.monotonic() if agora is None else agora
+
+    def _repor(self, agora, fator):
+        decorrido = agora - self.ultima_reposicao
+        if decorrido > 0:
+            self.fichas = min(self.capacidade, self.fichas + decorrido * self.taxa_por_segundo * fator)
+            self.ultima_reposicao = agora
+
+    def tempo_espera(self, quantidade, agora, fator=1.0):
+        """Segundos até haver `quantidade` fichas disponíveis (0 se já houver), com a taxa multiplicada por `fator`."""
+        self._repor(agora, fator)
+        falta = quantidade - self.fichas
+        if falta <= 0:
+            return 0.0
+        return falta / (self.taxa_por_segundo * fator)
+
+    def consumir(self, quantidade):
+        """Retira fichas (o saldo pode ficar negativo: a dívida atrasa as próximas chamadas). Quantidade negativa devolve."""
+        self.fichas = min(self.capacidade, self.fichas - quantidade)
+
+class RateLimiter:
+    """
+    Limitador de taxa compartilhado por todas as chamadas à IA do processo.
+    Controla dois orçamentos ao mesmo tempo: requisições por minuto (RPM) e tokens por minuto (TPM).
+    As chamadas só esperam quando algum dos orçamentos está de fato esgotado.
+
+    A taxa é adaptativa: cada erro 429 reduz o ritmo de envio de todo o pipeline pela metade
+    (até FATOR_MINIMO) e cada sucesso o recupera aos poucos. Uma dica de "retry-after" da API
+    suspende todas as chamadas até o instante indicado.
+
+    O orçamento de tokens é reservado com a estimativa do prompt e acertado depois da chamada com a
+    contagem real devolvida pela API (entrada + saída), ver registrar_tokens_reais.
+    `relogio` e `dormir` podem ser substituídos (ex.: relógio simulado nos testes).
+    """
+
+    FATOR_MINIMO = 0.2
+    RECUPERACAO_POR_SUCESSO = 0.05
+    JANELA_AGRUPAMENTO_429 = 5.0  # 429s dentro desta janela (s) contam como um único episódio
+
+    def __init__(self, requisicoes_por_minuto, tokens_por_minuto, relogio=time.monotonic, dormir=time.sleep):
+        self._lock = threading.Lock()
+        self._relogio = relogio
+        self._dormir = dormir
+        self.balde_requisicoes = TokenBucket(requisicoes_por_minuto, requisicoes_por_minuto / 60.0, relogio())
+        self.balde_tokens = TokenBucket(tokens_por_minuto, tokens_por_minuto / 60.0, relogio())
+        self.fator = 1.0
+        self.suspenso_ate = 0.0
+        self.ultimo_limite = float('-inf')
+
+    def adquirir(self, tokens_estimados=0):
+        """Bloqueia até haver orçamento para uma requisição com `tokens_estimados`. Retorna o tempo esperado."""
+        tokens = self._tokens_reservados(tokens_estimados)
+        inicio = self._relogio()
+        while True:
+            with self._lock:
+                agora = self._relogio()
+                espera = max(self.suspenso_ate - agora,
+                             self.balde_requisicoes.tempo_espera(1, agora, self.fator),
+                             self.balde_tokens.tempo_espera(tokens, agora, self.fator))
+                if espera <= 0:
+                    self.balde_requisicoes.consumir(1)
+                    self.balde_tokens.consumir(tokens)
+                    esperado = agora - inicio
+                    if esperado > 0.5:
+                        logging.info(f"Rate limiter: chamada liberada após {esperado:.1f}s de espera (~{tokens} tokens).")
+                    return esperado
+            # Dorme fora do lock para não bloquear quem só quer consultar o estado
+            self._dormir(min(espera, 5.0))
+
+    def _tokens_reservados(self, tokens_estimados):
+        # Uma chamada maior que o orçamento inteiro nunca caberia: limita ao tamanho do balde
+        return min(max(int(tokens_estimados), 0), int(self.balde_tokens.capacidade))
+
+    def registrar_tokens_reais(self, tokens_estimados, tokens_reais):
+        """
+        Acerta o orçamento de tokens depois de uma chamada: cobra (ou devolve) a diferença entre o total
+        medido pela API (prompt + resposta) e o que foi reservado em adquirir(tokens_estimados).
+        """
+        if not isinstance(tokens_reais, int) or tokens_reais < 0:
+            return
+        with self._lock:
+            self.balde_tokens.consumir(tokens_reais - self._tokens_reservados(tokens_estimados))
+
+    def registrar_limite_atingido(self, retry_after=None):
+        """Chamado ao receber um 429: reduz o ritmo global e respeita a dica de espera da API."""
+        with self._lock:
+            agora = self._relogio()
+            if retry_after:
+                self.suspenso_ate = max(self.suspenso_ate, agora + retry_after)
+            if agora - self.ultimo_limite >= self.JANELA_AGRUPAMENTO_429:
+                self.fator = max(self.FATOR_MINIMO, self.fator * 0.5)
+                logging.warning(f"Rate limiter: limite da API atingido, ritmo reduzido para {self.fator:.0%} do orçamento.")
+            self.ultimo_limite = agora
+
+    def registrar_sucesso(self):
+        """Chamado após uma chamada bem-sucedida: recupera o ritmo gradualmente."""
+        if self.fator >= 1.0:
+            return
+        with self._lock:
+            self.fator = min(1.0, self.fator + self.RECUPERACAO_POR_SUCESSO)
+
+# Estimativa local de tokens: razão caracteres/token calibrada pelas contagens reais devolvidas pela API
+CARACTERES_POR_TOKEN_INICIAL = 4.0
+_caracteres_por_token = CARACTERES_POR_TOKEN_INICIAL
+
+def calibrar_estimativa_tokens(num_caracteres, tokens_reais):
+    """Ajusta a razão caracteres/token com a contagem real de um prompt (média móvel, dentro de limites)."""
+    global _caracteres_por_token
+    if num_caracteres < 200 or not tokens_reais:
+        return  # Prompts muito curtos distorcem a razão
+    razao = min(6.0, max(2.0, num_caracteres / tokens_reais))
+    _caracteres_por_token = 0.8 * _caracteres_por_token + 0.2 * razao
+
+def tokens_por_caracteres(num_caracteres):
+    """Número estimado de tokens de um texto com num_caracteres caracteres."""
+    return int(math.ceil(num_caracteres / _caracteres_por_token)) if num_caracteres > 0 else 0
+
+def estimar_tokens(texto):
+    """Estimativa do número de tokens de um texto (razão caracteres/token calibrada; ~4 no início)."""
+    if not texto:
+        return 0
+    return tokens_por_caracteres(len(texto))
+
+# Instância única do processo (compartilhada entre threads de trabalho e requisições)
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def obter_rate_limiter():
+    """Retorna o limitador de taxa global, criando-o na primeira chamada."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                rpm, tpm = LIMITE_REQUISICOES_POR_MINUTO, LIMITE_TOKENS_POR_MINUTO
+                if has_app_context():
+                    rpm = current_app.config.get('LIMITE_REQUISICOES_POR_MINUTO', rpm)
+                    tpm = current_app.config.get('LIMITE_TOKENS_POR_MINUTO', tpm)
+                logging.info(f"Rate limiter da IA criado: {rpm} req/min, {tpm} tokens/min.")
+                _rate_limiter = RateLimiter(rpm, tpm)
+    return _rate_limiter
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Normalização do texto extraído dos CVs, antes de ele ser gravado e enviado à IA.
+O texto do PyPDF2 traz cabeçalhos/rodapés repetidos em cada página, números de página, palavras hifenizadas
+na quebra de linha, espaços em excesso e linhas de boilerplate, que custam tokens em todas as chamadas.
+A normalização é feita por parte (página/parágrafo), mantendo uma parte por segmento.
+"""
+import re
+from app.services.token_budget import compactar_texto
+
+LINHAS_ZONA_MOBILIA = 3  # Linhas do topo e do fim de cada página onde ficam cabeçalhos, rodapés e números
+FRACAO_MINIMA_PAGINAS_REPETIDAS = 0.5  # Linha repetida em pelo menos metade das páginas = cabeçalho/rodapé
+MAX_CARACTERES_LINHA_MOBILIA = 120
+
+# Prefixos que mantêm o hífen ao juntar uma palavra quebrada no fim da linha ("pós-\ngraduação")
+PREFIXOS_COM_HIFEN = {'pós', 'pré', 'pró', 'ex', 'vice', 'recém', 'além', 'aquém', 'sem', 'bem', 'mal', 'co', 'e'}
+
+_NUMERO_PAGINA = [
+    re.compile(r'^[-–—\s]*((p[áa]g(ina)?|page|p)\.?\s*)?\d{1,3}(\s*(de|of|/)\s*\d{1,3})?[-–—\s]*$', re.I),  # "3", "- 3 -", "2/5"
+    re.compile(r'^.{0,60}\b(p[áa]g(ina)?|page)\.?\s*\d{1,3}(\s*(de|of|/)\s*\d{1,3})?[\s.]*$', re.I),  # "Ana Souza | Página 2 de 3"
+]
+_HIFENIZACAO = re.compile(r'(\w+)-[ \t]*\n[ \t]*([^\W\d_]\w*)')
+_BOILERPLATE = [
+    re.compile(r'^(este\s+)?(curr[íi]culo|cv|resume|documento|pdf)\s+(gerado|criado|produzido|exportado)\s+(por|com|pelo|pela|via|by|with)\b.{0,80}$', re.I),
+    re.compile(r'^(powered|generated|created)\s+(by|with)\b.{0,80}$', re.I),
+    re.compile(r'^(curr[íi]culo\s+vitae|curriculum\s+vitae|curr[íi]culo)$', re.I),
+]
+
+def _chave_linha(linha):
+    """Forma de comparação de cabeçalhos/rodapés (rodapés com o número da página são tratados à parte)."""
+    return " ".join(linha.lower().split())
+
+def _indices_zona(linhas):
+    """Índices das primeiras e últimas linhas não vazias de uma página."""
+    preenchidas = [i for i, linha in enumerate(linhas) if linha.strip()]
+    return set(preenchidas[:LINHAS_ZONA_MOBILIA] + preenchidas[-LINHAS_ZONA_MOBILIA:])
+
+def _linhas_repetidas(paginas):
+    """Chaves das linhas do topo/fim que se repetem em várias páginas (cabeçalhos e rodapés)."""
+    if len(paginas) < 2:
+        return set()
+    contagem = {}
+    for linhas in paginas:
+        chaves = {_chave_linha(linhas[i]) for i in _indices_zona(linhas) if len(linhas[i].strip()) <= MAX_CARACTERES_LINHA_MOBILIA}
+        for chave in chaves:
+            contagem[chave] = contagem.get(chave, 0) + 1
+    minimo = max(2, len(paginas) * FRACAO_MINIMA_PAGINAS_REPETIDAS)
+    return {chave for chave, vezes in contagem.items() if vezes >= minimo}
+
+def _juntar_hifenizacao(texto):
+    """Junta palavras quebradas com hífen no fim da linha ("desenvol-\nvimento" -> "desenvolvimento")."""
+    def _juntar(match):
+        antes, depois = match.group(1), match.group(2)
+        if not depois[0].islower():
+            return match.group(0)  # "Back-\nEnd", siglas: provavelmente um hífen de verdade
+        separador = '-' if antes.lower() in PREFIXOS_COM_HIFEN else ''
+        return f"{antes}{separador}{depois}\n"
+    return _HIFENIZACAO.sub(_juntar, texto)
+
+def _e_boilerplate(linha):
+    return any(padrao.match(linha) for padrao in _BOILERPLATE)
+
+def normalizar_partes(partes, paginado=True):
+    """
+    Normaliza as partes (páginas/parágrafos) de um documento. Remove o boilerplate e as linhas repetidas em
+    sequência, junta palavras hifenizadas e compacta os espaços; em documentos paginados (PDF), remove também os
+    números de página e os cabeçalhos/rodapés repetidos (mantendo a primeira ocorrência).
+    Retorna uma lista com o mesmo número de partes.
+    """
+    # A hifenização é desfeita antes da busca por cabeçalhos/rodapés (a continuação da palavra não é uma linha)
+    paginas = [_juntar_hifenizacao((parte or "").replace('\r\n', '\n').replace('\r', '\n')).split('\n') for parte in partes]
+    repetidas = _linhas_repetidas(paginas) if paginado else set()
+    vistas = set()
+    normalizadas = []
+    for linhas in paginas:
+        zona = _indices_zona(linhas) if paginado else set()
+        mantidas, anterior = [], None
+        for i, linha in enumerate(linhas):
+            limpa = linha.strip()
+            if i in zona:
+                if any(padrao.match(limpa) for padrao in _NUMERO_PAGINA):
+                    continue
+                chave = _chave_linha(limpa)
+                if chave in repetidas:
+                    if chave in vistas:
+                        continue
+                    vistas.add(chave)
+            if limpa and (_e_boilerplate(limpa) or limpa == anterior):
+                continue
+            mantidas.append(linha)
+            if limpa:
+                anterior = limpa
+        normalizadas.append(compactar_texto("\n".join(mantidas)))
+    return normalizadas
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Orçamento de tokens dos prompts.
+Cada chamada tem um teto (MAX_TOKENS_PROMPT_IA, abaixo do limite de tokens por minuto da API): as partes fixas
+(instruções, pergunta) são reservadas primeiro e o restante é distribuído entre histórico e textos dos CVs,
+que são compactados (espaços, linhas decorativas) e, se ainda não couberem, cortados em um limite de linha/palavra.
+A contagem usa a estimativa local calibrada de rate_limiter (sem chamadas extras à API).
+"""
+import re
+import logging
+from flask import current_app, has_app_context
+from app.config import MAX_TOKENS_PROMPT_IA
+from app.services.rate_limiter import estimar_tokens
+
+AVISO_TEXTO_CORTADO = "\n[... texto truncado para caber no limite do prompt ...]"
+# Marca, no modelo do prompt, o lugar do texto variável (CV, conteúdo da página...) a ser encaixado
+MARCADOR_TEXTO = "\x00TEXTO\x00"
+
+_ESPACOS = re.compile(r'[ \t\f\v\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+_INVISIVEIS = re.compile(r'[\u200b-\u200d\u2060\ufeff\u00ad]')
+_LINHA_DECORATIVA = re.compile(r'^[\W_]{3,}$')  # Ex.: "-----", "=====", "• • •", "____"
+_LINHAS_EM_BRANCO = re.compile(r'\n{3,}')
+
+def compactar_texto(texto):
+    """
+    Remove o que só gasta tokens: espaços repetidos e no fim das linhas, caracteres invisíveis,
+    linhas decorativas (separadores) e sequências de linhas em branco.
+    """
+    if not texto:
+        return ""
+    texto = _INVISIVEIS.sub('', texto.replace('\r\n', '\n').replace('\r', '\n'))
+    linhas = []
+    for linha in texto.split('\n'):
+        linha = _ESPACOS.sub(' ', linha).strip()
+        if _LINHA_DECORATIVA.match(linha):
+            linha = ''
+        linhas.append(linha)
+    return _LINHAS_EM_BRANCO.sub('\n\n', '\n'.join(linhas)).strip()
+
+def cortar_para_tokens(texto, max_tokens):
+    """Corta o texto para caber em max_tokens (estimados), de preferência em uma quebra de linha ou espaço."""
+    if not texto or estimar_tokens(texto) <= max_tokens:
+        return texto or ""
+    limite = max(0, int((max_tokens - estimar_tokens(AVISO_TEXTO_CORTADO)) * len(texto) / estimar_tokens(texto)))
+    if limite <= 0:
+        return ""
+    corte = texto.rfind('\n', limite // 2, limite)
+    if corte == -1:
+        corte = texto.rfind(' ', limite // 2, limite)
+    return texto[:corte if corte != -1 else limite].rstrip() + AVISO_TEXTO_CORTADO
+
+class OrcamentoPrompt:
+    """
+    Orçamento de tokens de um prompt. Uso: reservar() as partes fixas e então encaixar() as partes variáveis,
+    em ordem de prioridade; cada parte encaixada é descontada do que resta.
+    """
+
+    def __init__(self, total_tokens=None):
+        if total_tokens is None:
+            total_tokens = current_app.config.get('MAX_TOKENS_PROMPT_IA', MAX_TOKENS_PROMPT_IA) if has_app_context() else MAX_TOKENS_PROMPT_IA
+        self.total = total_tokens
+        self.usado = 0
+
+    @property
+    def restante(self):
+        return max(0, self.total - self.usado)
+
+    def reservar(self, *textos):
+        """Desconta partes que entram no prompt de qualquer forma (modelo do prompt, pergunta...)."""
+        self.usado += sum(estimar_tokens(texto) for texto in textos)
+        return self
+
+    def encaixar(self, texto, max_tokens=None, descricao="texto"):
+        """Compacta o texto e o corta para caber no que resta do orçamento (e em max_tokens, se informado)."""
+        limite = self.restante if max_tokens is None else min(self.restante, max_tokens)
+        compactado = compactar_texto(texto)
+        ajustado = cortar_para_tokens(compactado, limite)
+        if len(ajustado) < len(compactado):
+            logging.info(f"Orçamento do prompt: {descricao} cortado de ~{estimar_tokens(compactado)} para ~{limite} tokens.")
+        self.usado += estimar_tokens(ajustado)
+        return ajustado
+
+    def selecionar_recentes(self, itens, custo, max_tokens=None):
+        """
+        Mantém os itens mais recentes (itens em ordem do mais recente para o mais antigo) enquanto couberem;
+        custo(item) retorna o texto do item no prompt.
+        """
+        limite = self.restante if max_tokens is None else min(self.restante, max_tokens)
+        selecionados, usado = [], 0
+        for item in itens:
+            tokens = estimar_tokens(custo(item))
+            if usado + tokens > limite:
+                break
+            selecionados.append(item)
+            usado += tokens
+        self.usado += usado
+        return selecionados
+
+def encaixar_no_prompt(prompt, texto, max_tokens=None, descricao="texto"):
+    """
+    Substitui MARCADOR_TEXTO no prompt pelo texto compactado e, se preciso, cortado para que o prompt
+    inteiro caiba no orçamento (e o texto em max_tokens, se informado).
+    """
+    orcamento = OrcamentoPrompt().reservar(prompt.replace(MARCADOR_TEXTO, ""))
+    return prompt.replace(MARCADOR_TEXTO, orcamento.encaixar(texto, max_tokens, descricao))
@@ -1,27 +1,29 @@
 # -*- coding: utf-8 -*-
 # Imports necessários para ESTA função (adapte se já importados no seu arquivo)
 import json
-import time
 import logging
 import random # Importado para seleção de keyword
 import requests
 from bs4 import BeautifulSoup
-from flask import current_app # Assume que está rodando em um contexto Flask
+from flask import current_app
 
 # --- CORREÇÃO: Descomentada/Adicionada a linha de importação ---
-from app.config import get_modelo_gemini, NOME_MODELO_GEMMA # Assume que essas funções/constantes existem no seu ambiente app.config
+from app.config import get_modelo_gemini, ESQUEMA_KEYWORDS, ORCAMENTO_TOKENS_RESUMO_WEB # Assume que essas funções/constantes existem no seu ambiente app.config
+from app.services.ia_client import gerar_conteudo, texto_da_resposta
+from app.services.token_budget import MARCADOR_TEXTO, encaixar_no_prompt
+from app.utils.json_parser import extrair_json, ajustar_ao_esquema
 
-import google.generativeai as genai
 from google.api_core import exceptions as api_exceptions
 
 # === CÓDIGO DA FUNÇÃO (Abordagem 2: Keywords, com import corrigido) ===
-def pesquisar_e_sumarizar_web(texto_cv_completo):
+def pesquisar_e_sumarizar_web(texto_cv_completo, lista_keywords=None):
     """
     Extrai keywords do CV, seleciona uma, busca uma URL relevante para ela (via IA),
     baixa o conteúdo da URL e o sumariza usando Gemma 3.
+    Se lista_keywords for informada (ex.: análise unificada), a extração de keywords é pulada.
     """
-    # Pré-requisito: Assume que get_modelo_gemini() e NOME_MODELO_GEMMA estão definidos
-    # e que current_app.config contém 'PAUSA_ENTRE_CHAMADAS_IA'
+    # Pré-requisito: Assume que get_modelo_gemini() está definido
+    # O intervalo entre as chamadas de IA fica a cargo do rate limiter global
     try:
         # Agora get_modelo_gemini() deve ser encontrado devido ao import acima
         client = get_modelo_gemini()
@@ -44,7 +46,8 @@ def pesquisar_e_sumarizar_web(texto_cv_completo):
     resultado_pesquisa_final = None
     status_final = "Pesquisa não iniciada"
     quota_error_ocorreu = False
-    lista_keywords = []
+    keywords_informadas = bool(lista_keywords)
+    lista_keywords = list(lista_keywords) if lista_keywords else []
     topico_selecionado = None
     url_encontrada = None
     response_keywords = None # Resposta da IA para keywords
@@ -54,42 +57,43 @@ def pesquisar_e_sumarizar_web(texto_cv_completo):
     # Bloco principal para capturar erros gerais inesperados
     try:
         # --- Passo 1: Extrair Keywords do CV (Modificado) ---
-        prompt_keywords = f"""Analise o CV abaixo e extraia uma lista [array] das 5 a 7 palavras-chave ou entidades mais relevantes (Ex: tecnologias específicas, nomes de empresas importantes, conceitos de projetos, metodologias). Dê preferência a termos técnicos ou específicos da área. Retorne APENAS um array JSON de strings, sem nenhum outro texto.
+        if keywords_informadas:
+            logging.info(f"Keywords recebidas da análise unificada: {lista_keywords}")
+        else:
+            prompt_keywords = f"""Analise o CV abaixo e extraia uma lista [array] das 5 a 7 palavras-chave ou entidades mais relevantes (Ex: tecnologias específicas, nomes de empresas importantes, conceitos de projetos, metodologias). Dê preferência a termos técnicos ou específicos da área. Retorne APENAS um array JSON de strings, sem nenhum outro texto.
 --- CV ---
-{texto_cv_completo}
+{MARCADOR_TEXTO}
 --- FIM CV ---"""
-        logging.info("Solicitando IA (extração de keywords)...")
-        resp_limpa_kw = "" # Inicializa para o bloco except
+            prompt_keywords = encaixar_no_prompt(prompt_keywords, texto_cv_completo, descricao="CV (keywords)")
+            logging.info("Solicitando IA (extração de keywords)...")
+            raw_text_kw = "" # Inicializa para o bloco except
 
-        try:
-            # Assume NOME_MODELO_GEMMA está definido via import
-            model_kw = genai.GenerativeModel(NOME_MODELO_GEMMA)
-            response_keywords = model_kw.generate_content(prompt_keywords)
-            raw_text_kw = getattr(response_keywords, 'text', '')
-            logging.debug(f"Resposta bruta IA (keywords): {raw_text_kw[:200]}...")
-            # Limpeza da resposta - tentar remover markdown e espaços
-            resp_limpa_kw = raw_text_kw.strip().lstrip('```json').lstrip('```').rstrip('```').strip()
-            lista_keywords = json.loads(resp_limpa_kw)
-
-            if not isinstance(lista_keywords, list) or not lista_keywords:
-                raise ValueError("Resposta da IA não é uma lista de keywords válida ou está vazia.")
-
-            logging.info(f"Keywords extraídas: {lista_keywords}")
-
-        except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e_api_kw:
-            logging.error(f"Erro API GenAI (keywords): {e_api_kw}", exc_info=True)
-            quota_error_ocorreu = "quota" in str(e_api_kw).lower() or "rate limit" in str(e_api_kw).lower()
-            status_final = "Erro de Cota da API (keywords)" if quota_error_ocorreu else "Erro na API ao extrair keywords."
-            return status_final, None, quota_error_ocorreu # Retorna erro e para
-        except (json.JSONDecodeError, ValueError) as e_json_kw:
-            # Log inclui a resposta que falhou no parse
-            logging.error(f"Erro JSON/Valor (keywords): {e_json_kw}. Resposta: '{resp_limpa_kw[:200]}...'", exc_info=True)
-            status_final = "Erro ao processar keywords da IA (formato inválido)."
-            return status_final, None, quota_error_ocorreu # Retorna erro e para
-        except Exception as e_kw:
-            logging.error(f"Erro inesperado na extração de keywords: {e_kw}", exc_info=True)
-            status_final = "Erro geral ao extrair keywords com IA."
-            return status_final, None, quota_error_ocorreu # Retorna erro e para
+            try:
+                response_keywords = gerar_conteudo(prompt_keywords, 'palavras_chave')
+                raw_text_kw = texto_da_resposta(response_keywords)
+                logging.debug(f"Resposta bruta IA (keywords): {raw_text_kw[:200]}...")
+                # Interpretação tolerante (markdown, texto extra, resposta cortada) e ajuste ao esquema
+                lista_keywords = ajustar_ao_esquema(extrair_json(raw_text_kw, list), ESQUEMA_KEYWORDS)
+
+                if not isinstance(lista_keywords, list) or not lista_keywords:
+                    raise ValueError("Resposta da IA não é uma lista de keywords válida ou está vazia.")
+
+                logging.info(f"Keywords extraídas: {lista_keywords}")
+
+            except (api_exceptions.ResourceExhausted, api_exceptions.PermissionDenied) as e_api_kw:
+                logging.error(f"Erro API GenAI (keywords): {e_api_kw}", exc_info=True)
+                quota_error_ocorreu = "quota" in str(e_api_kw).lower() or "rate limit" in str(e_api_kw).lower()
+                status_final = "Erro de Cota da API (keywords)" if quota_error_ocorreu else "Erro na API ao extrair keywords."
+                return status_final, None, quota_error_ocorreu # Retorna erro e para
+            except (json.JSONDecodeError, ValueError) as e_json_kw:
+                # Log inclui a resposta que falhou no parse
+                logging.error(f"Erro JSON/Valor (keywords): {e_json_kw}. Resposta: '{raw_text_kw[:200]}...'", exc_info=True)
+                status_final = "Erro ao processar keywords da IA (formato inválido)."
+                return status_final, None, quota_error_ocorreu # Retorna erro e para
+            except Exception as e_kw:
+                logging.error(f"Erro inesperado na extração de keywords: {e_kw}", exc_info=True)
+                status_final = "Erro geral ao extrair keywords com IA."
+                return status_final, None, quota_error_ocorreu # Retorna erro e para
 
         # --- Passo 2: Selecionar uma Keyword (Modificado) ---
         # <<< IMPORTANTE: Revise e personalize esta lógica de seleção! >>>
@@ -110,16 +114,11 @@ def pesquisar_e_sumarizar_web(texto_cv_completo):
         prompt_url_lookup = f"Sugira a melhor URL (página oficial, documentação, artigo de referência confiável) para saber mais sobre o tópico: '{topico_selecionado}'. Retorne APENAS a URL completa como texto simples."
         logging.info(f"Solicitando IA (busca de URL para '{topico_selecionado}')...")
 
-        # Pausa entre chamadas de IA (configurável via Flask app.config)
-        # Pega da config, usa default 1 segundo se não existir
-        pausa = current_app.config.get('PAUSA_ENTRE_CHAMADAS_IA', 1)
-        logging.info(f"Pausa de {pausa}s antes da busca de URL...")
-        time.sleep(pausa)
+        # O ritmo entre chamadas de IA é controlado pelo rate limiter global (gerar_conteudo)
 
         try:
-            model_url = genai.GenerativeModel(NOME_MODELO_GEMMA)
-            response_url = model_url.generate_content(prompt_url_lookup)
-            url_encontrada = getattr(response_url, 'text', '').strip()
+            response_url = gerar_conteudo(prompt_url_lookup, 'url')
+            url_encontrada = texto_da_resposta(response_url).strip()
 
             # Validação básica da URL (começa com http:// ou https://)
             if not url_encontrada or not url_encontrada.startswith(('http://', 'https://')):
@@ -216,22 +215,14 @@ def pesquisar_e_sumarizar_web(texto_cv_completo):
         if conteudo_texto != "N/E":
             logging.info("Enviando conteúdo web para IA sumarizar...")
 
-            # Pausa antes da terceira chamada de IA
-            pausa_sum = current_app.config.get('PAUSA_ENTRE_CHAMADAS_IA', 1)
-            logging.info(f"Pausa de {pausa_sum}s antes da sumarização...")
-            time.sleep(pausa_sum)
-
-            # Limita o contexto para a sumarização para evitar erros/custos
-            # Aumentado o limite para dar mais contexto à IA
-            contexto_para_sumarizar = conteudo_texto[:8000]
-
             # Prompt de sumarização usa o tópico selecionado
-            prompt_resumo = f"Você é um assistente que resume conteúdo técnico. Resuma o seguinte conteúdo web sobre '{topico_selecionado}' em 3 a 5 frases concisas e informativas para um recrutador. Foque nos pontos chave e na relevância do tópico.\n\nTítulo da Página: {titulo}\n\nConteúdo Extraído:\n{contexto_para_sumarizar}\n\n---\nResumo Conciso (em português, formato TXT simples):"
+            prompt_resumo = f"Você é um assistente que resume conteúdo técnico. Resuma o seguinte conteúdo web sobre '{topico_selecionado}' em 3 a 5 frases concisas e informativas para um recrutador. Foque nos pontos chave e na relevância do tópico.\n\nTítulo da Página: {titulo}\n\nConteúdo Extraído:\n{MARCADOR_TEXTO}\n\n---\nResumo Conciso (em português, formato TXT simples):"
+            # Limita o conteúdo da página (compactado) ao orçamento de tokens da sumarização, para evitar erros/custos
+            prompt_resumo = encaixar_no_prompt(prompt_resumo, conteudo_texto, current_app.config.get('ORCAMENTO_TOKENS_RESUMO_WEB', ORCAMENTO_TOKENS_RESUMO_WEB), "conteúdo web")
 
             try:
-                model_sum = genai.GenerativeModel(NOME_MODELO_GEMMA)
-                response_resumo = model_sum.generate_content(prompt_resumo)
-                resumo_web = getattr(response_resumo, 'text', '').strip()
+                response_resumo = gerar_conteudo(prompt_resumo, 'resumo_web')
+                resumo_web = texto_da_resposta(response_resumo).strip()
 
                 if not resumo_web:
                     # Se a IA retornar vazio, considera um erro leve
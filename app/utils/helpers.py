@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import math  # Adicionado import math para format_bytes
+import hashlib
 from flask import current_app
 
 def allowed_file(filename):
@@ -19,4 +20,9 @@ def format_bytes(bytes, decimals=2):
     dm = decimals
     sizes = ['Bytes', 'KB', 'MB', 'GB', 'TB', 'PB', 'EB', 'ZB', 'YB']
     i = int(math.floor(math.log(bytes) / math.log(k)))
-    return f"{round(bytes / (k ** i), dm)} {sizes[i]}"
\ No newline at end of file
+    return f"{round(bytes / (k ** i), dm)} {sizes[i]}"
+
+def calcular_hash_texto(texto):
+    """Calcula o SHA-256 de um texto normalizado (espaços colapsados), estável entre re-exportações do mesmo CV."""
+    texto_normalizado = " ".join(texto.split())
+    return hashlib.sha256(texto_normalizado.encode('utf-8')).hexdigest()
\ No newline at end of file
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Interpretação tolerante do JSON devolvido pela IA.
+A resposta pode vir com texto antes/depois, dentro de blocos de código markdown ou cortada pelo limite
+de tokens de saída: o JSON é localizado na resposta, o lixo depois dele é ignorado e um JSON incompleto
+é reparado (fechando strings, objetos e arrays abertos) em uma única passada sobre o texto.
+"""
+import re
+import json
+
+_BLOCO_CODIGO = re.compile(r'```(?:json|JSON)?\s*(.*?)(?:```|$)', re.S)
+_NUMERO = re.compile(r'-?\d+(?:[.,]\d+)?')
+MAX_TENTATIVAS_INICIO = 20  # Posições de '{'/'[' testadas como início do JSON
+
+def _reparar_json(texto, inicio=0):
+    """
+    Percorre o texto a partir de inicio (um '{' ou '[') acompanhando strings e a pilha de objetos/arrays abertos.
+    Retorna (json, item_cortado, fim): o JSON completo, se ele terminar no texto, ou o maior prefixo que pode
+    ser fechado, com os fechamentos que faltam (None se nada puder ser aproveitado); item_cortado indica que
+    o último item do valor externo também foi fechado à força; fim é a posição onde o candidato termina.
+    """
+    saida, pilha = [], []
+    em_string = escape = string_e_valor = False
+    anterior = ''  # Último caractere significativo fora de strings
+    corte = None  # (tamanho da saída, pilha) no último ponto em que o JSON pode ser fechado
+    fim = len(texto)
+
+    for posicao in range(inicio, len(texto)):
+        ch = texto[posicao]
+        if em_string:
+            saida.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                em_string = False
+                anterior = '"'
+                if string_e_valor:
+                    corte = (len(saida), list(pilha))
+            continue
+
+        if ch == '"':
+            em_string = True
+            # Dentro de um objeto, só a string depois de ':' é valor (as demais são chaves)
+            string_e_valor = bool(pilha) and (pilha[-1] == ']' or anterior == ':')
+        elif ch in '}]':
+            if not pilha or pilha[-1] != ch:
+                fim = posicao
+                break  # Lixo depois do JSON
+            while saida and (saida[-1].isspace() or saida[-1] == ','):
+                saida.pop()  # Vírgula final antes do fechamento
+            pilha.pop()
+        elif ch == ',':
+            corte = (len(saida), list(pilha))
+        elif ch in '{[':
+            pilha.append('}' if ch == '{' else ']')
+
+        saida.append(ch)
+        if not ch.isspace():
+            anterior = ch
+        if ch in '{[}]':
+            if not pilha:
+                return ''.join(saida), False, posicao + 1  # JSON completo
+            corte = (len(saida), list(pilha))
+
+    if em_string and string_e_valor:
+        # Resposta cortada no meio de um valor de texto: fecha a string
+        if escape:
+            saida.pop()
+        saida.append('"')
+        corte = (len(saida), list(pilha))
+    if corte is None:
+        return None, False, fim
+
+    tamanho, pilha = corte
+    parcial = ''.join(saida[:tamanho]).rstrip().rstrip(',')
+    return parcial + ''.join(reversed(pilha)), len(pilha) > 1, fim
+
+def extrair_json(texto, tipo=None, descartar_item_cortado=False):
+    """
+    Localiza e interpreta o JSON em uma resposta da IA. tipo (dict ou list) restringe o valor esperado;
+    com descartar_item_cortado, o último item de um array reparado é descartado se estava incompleto.
+    Lança ValueError (ou json.JSONDecodeError) se não houver JSON válido nem reparável.
+    """
+    texto = (texto or "").strip()
+    bloco = _BLOCO_CODIGO.search(texto)
+    if bloco and bloco.group(1).strip():
+        texto = bloco.group(1).strip()
+
+    aberturas = {dict: '{', list: '['}.get(tipo, '{[')
+    inicios = [i for i, ch in enumerate(texto) if ch in aberturas][:MAX_TENTATIVAS_INICIO]
+    if not inicios:
+        raise ValueError("Resposta da IA não contém JSON.")
+
+    decoder = json.JSONDecoder()
+    fim_candidato = 0
+    for inicio in inicios:
+        if inicio < fim_candidato:
+            continue  # Abertura dentro de um candidato anterior: seria um valor aninhado, não a resposta
+        item_cortado = False
+        try:
+            valor, fim_candidato = decoder.raw_decode(texto, inicio)  # Ignora o que vier depois do JSON
+        except json.JSONDecodeError:
+            # JSON incompleto (ex.: resposta cortada) ou chaves soltas no texto: repara a partir desta abertura
+            reparado, item_cortado, fim_candidato = _reparar_json(texto, inicio)
+            if reparado is None:
+                continue
+            try:
+                valor = json.loads(reparado)
+            except json.JSONDecodeError:
+                continue
+        if tipo is None or isinstance(valor, tipo):
+            if descartar_item_cortado and item_cortado and isinstance(valor, list) and valor:
+                valor.pop()
+            return valor
+
+    raise ValueError(f"Resposta da IA não contém um {'objeto' if tipo is dict else 'array' if tipo is list else 'valor'} JSON válido.")
+
+def ajustar_ao_esquema(valor, esquema):
+    """
+    Ajusta um valor ao esquema declarado (subconjunto de JSON Schema: type, properties, items, nullable):
+    campos ausentes viram null/[], números em texto viram números e valores de tipo errado são descartados.
+    Chaves fora do esquema são mantidas.
+    """
+    tipo = esquema.get('type')
+    if valor is None:
+        return [] if tipo == 'array' else None
+
+    if tipo == 'object':
+        if not isinstance(valor, dict):
+            return None
+        ajustado = dict(valor)
+        for campo, esquema_campo in esquema.get('properties', {}).items():
+            ajustado[campo] = ajustar_ao_esquema(valor.get(campo), esquema_campo)
+        return ajustado
+
+    if tipo == 'array':
+        if not isinstance(valor, list):
+            valor = [valor]
+        if 'items' in esquema:
+            valor = [ajustar_ao_esquema(item, esquema['items']) for item in valor]
+        return [item for item in valor if item is not None]
+
+    if tipo == 'string':
+        if isinstance(valor, (dict, list)):
+            return None
+        valor = str(valor).strip()
+        return valor or None
+
+    if tipo in ('number', 'integer'):
+        if isinstance(valor, bool):
+            return None
+        if isinstance(valor, str):
+            numero = _NUMERO.search(valor)
+            if not numero:
+                return None
+            valor = float(numero.group().replace(',', '.'))
+        if not isinstance(valor, (int, float)):
+            return None
+        if tipo == 'integer' or float(valor).is_integer():
+            return int(valor)
+        return valor
+
+    return valor
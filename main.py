@@ -15,6 +15,7 @@ if __name__ == '__main__':
         print(f"DB: {app.config['DATABASE']}")
         print(f"Extensões: {app.config['ALLOWED_EXTENSIONS']}")
         print(f"Modelo IA: {app.config['NOME_MODELO_GEMMA']}")
-        print(f"Pausas: IA={app.config['PAUSA_ENTRE_CHAMADAS_IA']}s, Arquivos={app.config['PAUSA_ENTRE_ARQUIVOS']}s")
+        print(f"Limites IA: {app.config['LIMITE_REQUISICOES_POR_MINUTO']} req/min, {app.config['LIMITE_TOKENS_POR_MINUTO']} tokens/min")
+        print(f"CVs em paralelo: {app.config['MAX_ARQUIVOS_PARALELOS']}")
         print("-------------------------------------\n")
         app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=True)
\ No newline at end of file
@@ -6,12 +6,19 @@ let eventSource = null;
 let currentBatchId = null;
 let isProcessing = false;
 let currentBatchHadQuotaError = false; // Flag para erro de cota no lote atual
+let streamBatchId = null; // Lote ao qual o cursor abaixo se refere
+let ultimoEventoId = 0; // Cursor: último evento recebido (permite reconectar sem perder ou repetir eventos)
 
 // --- Funções de comunicação com a API ---
 
 // Conectar ao Stream SSE
 function conectarAoStream(batchId) {
-    const streamUrl = `/api/stream-processing/${batchId}`; // Assumindo que a rota está correta
+    if (streamBatchId !== batchId) {
+        streamBatchId = batchId;
+        ultimoEventoId = 0;
+    }
+    // O processamento roda no servidor mesmo sem conexão; o cursor evita receber eventos repetidos
+    const streamUrl = `/api/stream-processing/${batchId}?cursor=${ultimoEventoId}`;
     window.adicionarMensagemStatus(`Conectando para receber andamento da análise (stream)...`, 'info');
     if (eventSource && eventSource.readyState !== EventSource.CLOSED) {
         console.warn("Fechando conexão SSE anterior antes de abrir uma nova.");
@@ -28,6 +35,7 @@ function conectarAoStream(batchId) {
         try {
             const updateData = JSON.parse(event.data);
             console.log('SSE Data:', updateData);
+            if (event.lastEventId) ultimoEventoId = parseInt(event.lastEventId, 10) || ultimoEventoId;
 
             // --- Lógica de tratamento de mensagens SSE (Mantida) ---
             // Adiciona ao Status (exceto tipos específicos)
@@ -113,6 +121,18 @@ function conectarAoStream(batchId) {
 
     eventSource.onerror = (error) => {
         console.error('Erro na conexão EventSource:', error);
+        if (isProcessing && currentBatchId) {
+            // A análise continua no servidor: reconecta a partir do último evento recebido
+            if (eventSource) eventSource.close();
+            if (!reconectarTimeout) {
+                window.adicionarMensagemStatus('Conexão perdida. A análise continua no servidor; reconectando...', 'warning');
+                reconectarTimeout = setTimeout(() => {
+                    reconectarTimeout = null;
+                    conectarAoStream(currentBatchId);
+                }, 3000);
+            }
+            return;
+        }
         if (isProcessing) {
             window.adicionarMensagemStatus('Erro de conexão com o servidor. A análise pode não ter sido concluída ou atualizada.', 'error');
             isProcessing = false;
@@ -221,25 +241,66 @@ function enviarMensagemChat() {
     window.btnEnviarChat.disabled = true;
     window.adicionarMensagemChat("Assistente", "Processando sua pergunta...", 'loading'); // Classe 'loading'
 
-    fetch('/api/chat', { // Rota do chat
+    // Resposta em streaming (SSE sobre fetch): o texto aparece à medida que a IA o gera
+    let respostaAcumulada = '';
+    let spanResposta = null;
+    const removerIndicadorCarregando = () => {
+        const thinkingMsg = window.chatMessages.querySelector('.ai-message > .loading');
+        if (thinkingMsg) thinkingMsg.parentElement.remove();
+    };
+    const tratarEventoChat = (evento) => {
+        if (evento.type === 'delta') {
+            if (!spanResposta) {
+                removerIndicadorCarregando();
+                window.adicionarMensagemChat("Assistente", "");
+                spanResposta = window.chatMessages.lastElementChild.querySelector('span');
+            }
+            respostaAcumulada += evento.text;
+            spanResposta.innerHTML = window.formatarTextoIA(respostaAcumulada);
+            window.chatMessages.scrollTop = window.chatMessages.scrollHeight;
+        } else if (evento.type === 'done') {
+            removerIndicadorCarregando();
+            if (spanResposta) {
+                spanResposta.innerHTML = window.formatarTextoIA(evento.reply);
+            } else {
+                window.adicionarMensagemChat("Assistente", evento.reply || "[Assistente não retornou uma resposta.]");
+            }
+        } else if (evento.type === 'error') {
+            throw new Error(evento.error || 'Erro na resposta do Chat');
+        }
+    };
+
+    fetch('/api/chat/stream', { // Rota do chat (streaming)
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ batch_id: currentBatchId, message: mensagemUsuario })
     })
-    .then(response => response.json().then(data => ({ ok: response.ok, status: response.status, data })))
-    .then(({ ok, status, data }) => {
-        const thinkingMsg = window.chatMessages.querySelector('.ai-message.loading');
-        if (thinkingMsg) thinkingMsg.remove();
-
-        if (!ok || !data || data.error) {
-            throw new Error(data?.error || `Erro na resposta do Chat (Status: ${status})`);
+    .then(async response => {
+        if (!response.ok || !response.body) {
+            const data = await response.json().catch(() => null);
+            throw new Error(data?.error || `Erro na resposta do Chat (Status: ${response.status})`);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            // Cada evento SSE termina com uma linha em branco
+            let fimEvento;
+            while ((fimEvento = buffer.indexOf('\n\n')) !== -1) {
+                const bloco = buffer.slice(0, fimEvento);
+                buffer = buffer.slice(fimEvento + 2);
+                const linhaDados = bloco.split('\n').find(l => l.startsWith('data: '));
+                if (linhaDados) tratarEventoChat(JSON.parse(linhaDados.slice(6)));
+            }
         }
-        window.adicionarMensagemChat("Assistente", data.reply || "[Assistente não retornou uma resposta.]");
+        removerIndicadorCarregando();
     })
     .catch(error => {
         console.error('Erro fetch chat:', error);
-        const thinkingMsg = window.chatMessages.querySelector('.ai-message.loading');
-        if (thinkingMsg) thinkingMsg.remove();
+        removerIndicadorCarregando();
         window.adicionarMensagemChat("Sistema", `Erro ao processar pergunta: ${error.message}`, 'system-message error'); // Usa o formatter que trata erros
 
         // Se for erro de cota, desabilita chat
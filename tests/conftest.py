@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import pytest
+from flask import Flask
+from app.config import configure_app
+from app.database.db_manager import close_connection, init_db
+
+@pytest.fixture
+def app(tmp_path):
+    """App com um banco novo (todas as migrações aplicadas) em um diretório temporário."""
+    app = Flask(__name__)
+    configure_app(app)
+    app.config.update(TESTING=True, DATABASE=str(tmp_path / 'teste.db'), UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+    with app.app_context():
+        init_db()
+    yield app
+
+@pytest.fixture
+def contexto(app):
+    """Contexto de app com a conexão devolvida ao pool no final."""
+    with app.app_context():
+        yield app
+        close_connection(None)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import pytest
+from app.database.candidate_index import _anos_experiencia, nivel_escolaridade, nivel_idioma, normalizar_termo
+from app.database.models import BatchModel, CandidateModel, FileModel, ResultModel
+
+@pytest.mark.parametrize('valor, esperado', [
+    (5, 5.0), ("5", 5.0), ("5 anos", 5.0), ("Cerca de 3,5 anos", 3.5), ("mais de 10 anos de experiência", 10.0),
+    ("sem experiência", None), (None, None),
+])
+def test_anos_experiencia(valor, esperado):
+    assert _anos_experiencia(valor) == esperado
+
+@pytest.mark.parametrize('valor, esperado', [
+    ("Mestrado", 6), ("Mestrado em Ciência da Computação", 6), ("MBA em Gestão", 5), ("Pós-graduação", 5),
+    ("Ensino Superior Completo", 4), ("Bacharelado em Direito", 4), ("Técnico em Informática", 3),
+    ("Ensino Médio", 2), ("Doutorado", 7), ("PhD", 7), ("mestrado", 6), ("6", 6), (4, 4), ("Autodidata", None), (None, None),
+])
+def test_nivel_escolaridade(valor, esperado):
+    assert nivel_escolaridade(valor) == esperado
+
+@pytest.mark.parametrize('valor, esperado', [
+    ("Fluente", 4), ("Avançado", 3), ("intermediário", 2), ("Básico", 1), ("Nativo", 5), ("B2", None), (None, None),
+])
+def test_nivel_idioma(valor, esperado):
+    assert nivel_idioma(valor) == esperado
+
+def test_normalizar_termo_mantem_simbolos_de_tecnologias():
+    assert normalizar_termo("  Inglês ") == "ingles"
+    assert normalizar_termo("C++") == "c++"
+    assert normalizar_termo("C#") == "c#"
+    assert normalizar_termo(".NET") == "net"
+    assert normalizar_termo("São  Paulo / SP") == "sao paulo sp"
+
+def _criar_candidato(batch_id, nome, **dados):
+    file_id = FileModel.create(batch_id, f"{nome}.pdf", f"/tmp/{nome}.pdf")
+    ResultModel.create(file_id, batch_id, 'Sucesso', data_json={'nome_completo': nome, **dados}, texto_completo=nome)
+
+@pytest.fixture
+def candidatos(contexto):
+    BatchModel.create('lote')
+    BatchModel.create('outro')
+    _criar_candidato('lote', 'Ana', habilidades_tecnicas=['Python', 'SQL', 'Docker'], anos_experiencia_total="8 anos",
+                     nivel_escolaridade_max="Mestrado em Computação", localizacao="São Paulo, SP",
+                     idiomas=[{'idioma': 'Inglês', 'nivel': 'Fluente'}])
+    _criar_candidato('lote', 'Bruno', habilidades_tecnicas=['python', 'Java'], anos_experiencia_total="3",
+                     nivel_escolaridade_max="Graduação", localizacao="Recife",
+                     idiomas=[{'idioma': 'inglês', 'nivel': 'Básico'}])
+    _criar_candidato('lote', 'Carla', habilidades_tecnicas=['SQL', 'Power BI'], anos_experiencia_total="5 anos",
+                     nivel_escolaridade_max="MBA", localizacao="Sao Paulo")
+    _criar_candidato('outro', 'Davi', habilidades_tecnicas=['Python', 'SQL'], anos_experiencia_total=12,
+                     nivel_escolaridade_max="Doutorado")
+
+def _nomes(resultado):
+    return [candidato['nome'] for candidato in resultado[1]]
+
+def test_filtro_intersecao_de_habilidades(candidatos):
+    assert _nomes(CandidateModel.filter(habilidades=['python'])) == ['Davi', 'Ana', 'Bruno']
+    # Todas as habilidades são exigidas, sem diferenciar acentos/maiúsculas
+    assert _nomes(CandidateModel.filter(habilidades=['PYTHON', 'sql'])) == ['Davi', 'Ana']
+    assert _nomes(CandidateModel.filter(habilidades=['Python', 'SQL', 'Docker'])) == ['Ana']
+    assert _nomes(CandidateModel.filter(habilidades=['Python', 'Power BI'])) == []
+    # Habilidade que não aparece em nenhum CV
+    assert CandidateModel.filter(habilidades=['Python', 'Cobol']) == (0, [])
+
+def test_filtro_combina_criterios(candidatos):
+    assert _nomes(CandidateModel.filter(anos_min=5)) == ['Davi', 'Ana', 'Carla']
+    assert _nomes(CandidateModel.filter(escolaridade_min=nivel_escolaridade('Mestrado'))) == ['Davi', 'Ana']
+    assert _nomes(CandidateModel.filter(idioma='ingles')) == ['Ana', 'Bruno']
+    assert _nomes(CandidateModel.filter(idioma='Inglês', nivel_idioma_min=nivel_idioma('Avançado'))) == ['Ana']
+    assert _nomes(CandidateModel.filter(localizacao='são paulo')) == ['Ana', 'Carla']
+    assert _nomes(CandidateModel.filter(habilidades=['SQL'], anos_min=5, batch_id='lote')) == ['Ana', 'Carla']
+
+def test_filtro_retorna_campos_normalizados_e_pagina(candidatos):
+    total, resultados = CandidateModel.filter(habilidades=['sql'], limit=1, offset=1)
+    assert total == 3
+    ana, = resultados
+    assert ana['nome'] == 'Ana'
+    assert ana['anos_experiencia'] == 8.0
+    assert ana['escolaridade'] == 'mestrado'
+    assert ana['habilidades'] == ['Docker', 'Python', 'SQL']
+    assert ana['idiomas'] == [{'idioma': 'ingles', 'nivel': 4}]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import itertools
+import pytest
+from app.services import context_service
+from app.services.context_service import CacheContextoChat, registrar_mensagem_chat
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = CacheContextoChat(max_bytes=10_000_000, max_lotes=10)
+    monkeypatch.setattr(context_service, '_cache_contexto', cache)
+    return cache
+
+def _entrada(versao_chat, historico):
+    return {'versao_resultados': (1, 1), 'cvs': [], 'textos': {}, 'contexto_completo': None,
+            'versao_chat': versao_chat, 'historico': historico}
+
+def _simular_ids(monkeypatch, ids):
+    ids = iter(ids)
+    monkeypatch.setattr(context_service.ChatModel, 'create', staticmethod(lambda *a: next(ids)))
+
+def test_mensagem_seguinte_entra_no_historico_em_cache(cache, monkeypatch):
+    cache.guardar('b1', _entrada(9, [{'user_message': 'oi', 'model_reply': 'olá'}]))
+    _simular_ids(monkeypatch, [10])
+    registrar_mensagem_chat('b1', 'pergunta', 'resposta')
+    entrada = cache.obter('b1')
+    assert entrada['versao_chat'] == 10
+    assert [h['user_message'] for h in entrada['historico']] == ['pergunta', 'oi']
+
+def test_mensagem_fora_de_ordem_descarta_o_historico(cache, monkeypatch):
+    cache.guardar('b1', _entrada(9, [{'user_message': 'oi', 'model_reply': 'olá'}]))
+    _simular_ids(monkeypatch, [11, 10])  # A gravação 11 chega ao cache antes da 10
+    registrar_mensagem_chat('b1', 'segunda', 'r2')
+    assert cache.obter('b1')['historico'] is None
+    registrar_mensagem_chat('b1', 'primeira', 'r1')
+    assert cache.obter('b1')['historico'] is None
+
+def test_lote_fora_do_cache_nao_e_criado(cache, monkeypatch):
+    _simular_ids(monkeypatch, itertools.count(1))
+    assert registrar_mensagem_chat('b2', 'pergunta', 'resposta') == 1
+    assert cache.obter('b2') is None
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import pytest
+from app.services.extraction_pool import ExtractionPool
+
+@pytest.fixture
+def pool():
+    pool = ExtractionPool(max_processos=1, timeout_segundos=2, limite_memoria_mb=None, paginas_por_tarefa=10)
+    yield pool
+    if pool._executor is not None:
+        pool._reiniciar(pool._executor)
+    pool.encerrar()
+
+def test_tempo_na_fila_nao_conta_no_timeout(pool):
+    executor = pool._obter_executor()
+    resultados = []
+
+    def rodar():
+        try:
+            pool._aguardar([pool._submeter_tarefa(executor, time.sleep, 1.2)])
+            resultados.append('ok')
+        except FuturesTimeoutError:
+            resultados.append('timeout')
+
+    threads = [threading.Thread(target=rodar) for _ in range(3)]  # 3 x 1,2s em um processo: passa de 2s na fila
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert resultados == ['ok', 'ok', 'ok']
+    assert pool._inicios == {} and pool._prazos == {}
+
+def test_tarefa_lenta_excede_o_timeout(pool):
+    executor = pool._obter_executor()
+    with pytest.raises(FuturesTimeoutError):
+        pool._aguardar([pool._submeter_tarefa(executor, time.sleep, 30)])
+
+def test_prazo_maximo_sem_aviso_de_inicio(pool):
+    executor = pool._obter_executor()
+    pool._parar_escuta.set()  # Nenhuma tarefa recebe o horário de início
+    inicio = time.monotonic()
+    with pytest.raises(FuturesTimeoutError):
+        pool._aguardar([pool._submeter_tarefa(executor, time.sleep, 30)])
+    assert time.monotonic() - inicio < 10
+
+def test_falha_da_fila_de_inicios_recria_o_pool(pool):
+    class FilaQuebrada:
+        def get(self, timeout=None):
+            raise OSError("fila fechada")
+
+    executor = pool._obter_executor()
+    pool._escutar_inicios(FilaQuebrada(), pool._parar_escuta)
+    assert pool._executor is None
+    assert pool._obter_executor() is not executor
+    executor.shutdown(wait=False)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from app.database.db_manager import get_db
+from app.database.models import BatchModel
+from app.services.job_runner import JobRunner
+
+def _status(batch_id):
+    return get_db().execute("SELECT status, executor_id FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+
+def _envelhecer_heartbeat(batch_id, segundos):
+    get_db().execute("UPDATE batches SET heartbeat_at = datetime('now', ?) WHERE batch_id = ?", (f"-{segundos} seconds", batch_id))
+    get_db().commit()
+
+def test_reserva_registra_dono_e_heartbeat(contexto):
+    BatchModel.create('b1', status='na_fila')
+    assert BatchModel.claim_next_queued('executor-a') == 'b1'
+    assert BatchModel.claim_next_queued('executor-b') is None
+    row = get_db().execute("SELECT status, executor_id, heartbeat_at FROM batches WHERE batch_id = 'b1'").fetchone()
+    assert (row['status'], row['executor_id']) == ('processando', 'executor-a')
+    assert row['heartbeat_at'] is not None
+
+def test_lote_com_heartbeat_recente_nao_volta_para_a_fila(contexto):
+    BatchModel.create('b1', status='na_fila')
+    BatchModel.claim_next_queued('executor-a')
+    assert BatchModel.requeue_interrupted(60) == []
+    assert tuple(_status('b1')) == ('processando', 'executor-a')
+
+def test_lote_com_heartbeat_antigo_volta_para_a_fila(contexto):
+    BatchModel.create('b1', status='na_fila')
+    BatchModel.create('b2', status='processando')  # Reservado antes dos donos existirem
+    BatchModel.claim_next_queued('executor-a')
+    _envelhecer_heartbeat('b1', 120)
+    assert sorted(BatchModel.requeue_interrupted(60)) == ['b1', 'b2']
+    assert tuple(_status('b1')) == ('na_fila', None)
+
+def test_heartbeat_renova_so_os_lotes_do_executor(contexto):
+    for batch_id in ('b1', 'b2'):
+        BatchModel.create(batch_id, status='na_fila')
+    BatchModel.claim_next_queued('executor-a')
+    BatchModel.claim_next_queued('executor-b')
+    _envelhecer_heartbeat('b1', 120)
+    _envelhecer_heartbeat('b2', 120)
+    BatchModel.heartbeat('executor-a', ['b1', 'b2'])
+    assert BatchModel.requeue_interrupted(60) == ['b2']
+
+def test_executor_so_recupera_lotes_parados(app, contexto):
+    BatchModel.create('vivo', status='na_fila')
+    BatchModel.claim_next_queued('outro-processo')
+    BatchModel.create('parado', status='na_fila')
+    BatchModel.claim_next_queued('processo-encerrado')
+    _envelhecer_heartbeat('parado', 300)
+    runner = JobRunner(app, 1, 60, intervalo_heartbeat=15, limite_heartbeat=60)
+    runner._recuperar_lotes_interrompidos()
+    get_db().commit()
+    assert _status('vivo')['status'] == 'processando'
+    assert _status('parado')['status'] == 'na_fila'
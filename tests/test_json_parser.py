@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import pytest
+from app.utils.json_parser import extrair_json, ajustar_ao_esquema
+
+def test_json_completo_com_texto_em_volta():
+    assert extrair_json('Segue o resultado: {"nome": "Ana"} Espero ter ajudado.', dict) == {"nome": "Ana"}
+
+def test_bloco_de_codigo_markdown():
+    assert extrair_json('```json\n{"nome": "Ana", "idade": 30}\n```', dict) == {"nome": "Ana", "idade": 30}
+
+def test_lixo_depois_do_json():
+    assert extrair_json('{"nome": "Ana"}}]\nfim', dict) == {"nome": "Ana"}
+
+def test_chaves_soltas_antes_do_json():
+    assert extrair_json('Campos {nome}: {"nome": "Ana"}', dict) == {"nome": "Ana"}
+
+def test_truncado_com_objeto_aninhado_repara_o_valor_externo():
+    texto = '{"nome": "Ana", "contato": {"email": "a@b.c"}, "habilidades": ["Python"], "experiencia": [{"cargo": "Dev'
+    valor = extrair_json(texto, dict)
+    assert valor["nome"] == "Ana"
+    assert valor["contato"] == {"email": "a@b.c"}
+    assert valor["habilidades"] == ["Python"]
+    assert valor["experiencia"] == [{"cargo": "Dev"}]
+
+def test_truncado_no_meio_de_uma_chave():
+    assert extrair_json('{"nome": "Ana", "habilidades": ["Python", "SQL"], "expe', dict) == {
+        "nome": "Ana", "habilidades": ["Python", "SQL"]}
+
+def test_array_truncado_descarta_item_cortado():
+    texto = '[{"file_id": 1, "nome": "Ana"}, {"file_id": 2, "nome": "Be'
+    assert extrair_json(texto, list, descartar_item_cortado=True) == [{"file_id": 1, "nome": "Ana"}]
+    assert extrair_json(texto, list) == [{"file_id": 1, "nome": "Ana"}, {"file_id": 2, "nome": "Be"}]
+
+def test_sem_json():
+    with pytest.raises(ValueError):
+        extrair_json("Não consegui analisar o currículo.", dict)
+
+def test_ajustar_ao_esquema():
+    esquema = {"type": "object", "properties": {
+        "nome": {"type": "string"},
+        "anos": {"type": "integer"},
+        "habilidades": {"type": "array", "items": {"type": "string"}},
+    }}
+    assert ajustar_ao_esquema({"nome": " Ana ", "anos": "5 anos"}, esquema) == {"nome": "Ana", "anos": 5, "habilidades": []}
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import json
+import pytest
+from flask import Flask
+from app.config import configure_app
+from app.database import migrations
+from app.database.blob_store import ler_blob
+from app.database.db_manager import init_db
+from app.utils.helpers import calcular_hash_texto
+
+TEXTOS = [
+    "Ana Souza\nDesenvolvedora Python com 5 anos de experiência em APIs REST.\n" * 40,
+    "Bruno Lima\nAnalista de dados, SQL e Power BI.\n" * 40,
+    "Carla Dias\nGerente de projetos, inglês fluente.\n" * 40,
+]
+
+@pytest.fixture
+def banco_versao_2(tmp_path):
+    """Banco na versão 2 do esquema, com os textos ainda gravados nas colunas antigas (sem blobs nem índices)."""
+    db_path = str(tmp_path / 'legado.db')
+    db = migrations._conectar(db_path)
+    migrations._migracao_1(db.cursor())
+    migrations._migracao_2(db.cursor())
+    db.execute("PRAGMA user_version = 2")
+    db.execute("INSERT INTO batches (batch_id, status) VALUES ('legado', 'concluido')")
+    for i, texto in enumerate(TEXTOS):
+        file_id = db.execute("INSERT INTO files (batch_id, original_name, saved_path) VALUES ('legado', ?, ?)",
+                             (f"cv{i}.pdf", f"/antigo/cv{i}.pdf")).lastrowid
+        db.execute("INSERT INTO file_texts (file_id, texto, content_hash) VALUES (?, ?, ?)",
+                   (file_id, texto, calcular_hash_texto(texto)))
+        dados = {'nome_completo': texto.split('\n')[0], 'anos_experiencia_total': f"{i + 2} anos", 'habilidades': ['Python', 'SQL']}
+        db.execute("INSERT INTO results (file_id, batch_id, status_final, data_json, web_summary, texto_completo) VALUES (?, 'legado', 'Sucesso', ?, ?, ?)",
+                   (file_id, json.dumps(dados), f"Resumo web {i}", texto))
+    db.close()
+    return db_path
+
+def test_init_db_migra_banco_versao_2_com_textos_antigos(tmp_path, monkeypatch, banco_versao_2):
+    # Backfills síncronos (init_db normalmente os roda em uma thread) e em lotes pequenos, para passar por mais de um lote
+    monkeypatch.setattr(migrations, 'iniciar_backfills', lambda db_path, tamanho_lote, intervalo: migrations.executar_backfills(db_path, 2, 0))
+    app = Flask(__name__)
+    configure_app(app)
+    app.config.update(TESTING=True, DATABASE=banco_versao_2, UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+    with app.app_context():
+        init_db()
+
+    db = migrations._conectar(banco_versao_2)
+    try:
+        assert migrations.versao_esquema(db) == migrations.MIGRACOES[-1][0]
+        cursor = db.cursor()
+        resultados = db.execute("SELECT * FROM results ORDER BY result_id").fetchall()
+        assert len(resultados) == len(TEXTOS)
+        for row, texto in zip(resultados, TEXTOS):
+            assert row['texto_completo'] is None and row['web_summary'] is None
+            assert ler_blob(cursor, row['texto_hash']) == texto
+            assert ler_blob(cursor, row['web_summary_hash']).startswith("Resumo web")
+            assert row['indexado_busca'] == 1 and row['indexado_trechos'] == 1
+            assert db.execute("SELECT COUNT(*) FROM candidates WHERE result_id = ?", (row['result_id'],)).fetchone()[0] == 1
+            assert db.execute("SELECT COUNT(*) FROM cv_chunks WHERE result_id = ?", (row['result_id'],)).fetchone()[0] > 0
+        assert db.execute("SELECT COUNT(*) FROM cv_search").fetchone()[0] == len(TEXTOS)
+        assert [row[0] for row in db.execute("SELECT rowid FROM cv_search WHERE cv_search MATCH 'gerente'")] == [resultados[2]['result_id']]
+        for row in db.execute("SELECT f.content_hash, t.texto, t.texto_hash FROM files f JOIN file_texts t ON t.file_id = f.file_id"):
+            assert row['texto'] == '' and row['content_hash'] == calcular_hash_texto(ler_blob(cursor, row['texto_hash']))
+        anos = [row[0] for row in db.execute("SELECT anos_experiencia FROM candidates ORDER BY result_id")]
+        assert anos == [2, 3, 4]
+    finally:
+        db.close()
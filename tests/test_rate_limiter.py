@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+import pytest
+from google.api_core import exceptions as api_exceptions
+from app.services import ia_client
+from app.services.rate_limiter import RateLimiter
+
+class RelogioSimulado:
+    """Relógio monotônico controlado pelo teste: dormir só avança o tempo."""
+
+    def __init__(self):
+        self.agora = 1000.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+@pytest.fixture
+def relogio():
+    return RelogioSimulado()
+
+def _limitador(relogio, rpm=600, tpm=6000):
+    return RateLimiter(rpm, tpm, relogio=relogio, dormir=relogio.dormir)
+
+def test_balde_de_tokens_e_reposto_com_o_tempo(relogio):
+    limitador = _limitador(relogio)  # 100 tokens/s
+    assert limitador.adquirir(6000) == 0
+    assert limitador.adquirir(1000) == pytest.approx(10.0)
+    relogio.agora += 30
+    assert limitador.adquirir(3000) == 0
+    # O balde não acumula além da capacidade
+    relogio.agora += 600
+    assert limitador.adquirir(6000) == 0
+    assert limitador.adquirir(100) == pytest.approx(1.0)
+
+def test_chamada_maior_que_o_balde_e_limitada_a_capacidade(relogio):
+    limitador = _limitador(relogio)
+    assert limitador.adquirir(50000) == 0
+    assert limitador.adquirir(6000) == pytest.approx(60.0)
+
+def test_tokens_reais_acertam_o_orcamento(relogio):
+    limitador = _limitador(relogio)
+    limitador.adquirir(1000)
+    # A resposta consumiu 6000 tokens no total: os 5000 que faltavam são cobrados (saldo 0)
+    limitador.registrar_tokens_reais(1000, 6000)
+    assert limitador.adquirir(500) == pytest.approx(5.0)
+    # Total menor que o estimado devolve a diferença
+    limitador.adquirir(2000)
+    limitador.registrar_tokens_reais(2000, 1500)
+    assert limitador.balde_tokens.fichas == pytest.approx(500)
+    # Contagem ausente (SDK sem usage_metadata) não altera o saldo
+    limitador.registrar_tokens_reais(2000, None)
+    assert limitador.balde_tokens.fichas == pytest.approx(500)
+    assert limitador.adquirir(500) == 0
+
+def test_limite_atingido_suspende_e_reduz_o_ritmo(relogio):
+    limitador = _limitador(relogio)
+    limitador.adquirir(6000)
+    limitador.registrar_limite_atingido(retry_after=20)
+    assert limitador.fator == 0.5
+    # 429s na mesma janela contam como um único episódio
+    limitador.registrar_limite_atingido()
+    assert limitador.fator == 0.5
+    # Suspensão de 20s pela dica da API; nesse tempo a reposição (a 50%) já cobre 1000 tokens
+    assert limitador.adquirir(1000) == pytest.approx(20.0)
+    assert limitador.adquirir(1000) == pytest.approx(20.0)
+    relogio.agora += 10
+    limitador.registrar_limite_atingido()
+    assert limitador.fator == 0.25
+    for _ in range(20):
+        limitador.registrar_sucesso()
+    assert limitador.fator == 1.0
+
+def _resposta(total_tokens):
+    return SimpleNamespace(text="ok", usage_metadata=SimpleNamespace(prompt_token_count=10, total_token_count=total_tokens))
+
+def test_gerar_conteudo_repete_429_com_backoff_e_cobra_tokens_reais(relogio, monkeypatch):
+    limitador = _limitador(relogio)
+    respostas = [api_exceptions.TooManyRequests("Please retry in 7s"), _resposta(3000)]
+    prompts = []
+
+    class ModeloSimulado:
+        def generate_content(self, prompt, **opcoes):
+            prompts.append(prompt)
+            resposta = respostas.pop(0)
+            if isinstance(resposta, Exception):
+                raise resposta
+            return resposta
+
+    monkeypatch.setattr(ia_client, 'obter_rate_limiter', lambda: limitador)
+    monkeypatch.setattr(ia_client, 'obter_modelo_ia', lambda finalidade: ModeloSimulado())
+    monkeypatch.setattr(ia_client, 'opcoes_chamada_ia', lambda: {})
+    monkeypatch.setattr(ia_client.time, 'sleep', relogio.dormir)
+    monkeypatch.setattr(ia_client.random, 'uniform', lambda minimo, maximo: maximo)
+
+    resposta = ia_client.gerar_conteudo("x" * 400)
+
+    assert resposta.text == "ok" and len(prompts) == 2
+    # Backoff: o maior entre a base exponencial (2s na primeira tentativa) e a dica da API (7s)
+    assert relogio.esperas == [7.0]
+    assert limitador.fator == pytest.approx(0.55)
+    # O balde se encheu de novo durante o backoff; da chamada que deu certo fica cobrado o total medido, não a estimativa
+    assert limitador.balde_tokens.fichas == pytest.approx(6000 - 3000)
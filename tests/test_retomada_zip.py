@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import zipfile
+import pytest
+from docx import Document
+from app.database.db_manager import get_db
+from app.database.models import BatchModel, FileModel, ResultModel
+from app.services import processing_service
+from app.services.document_service import montar_caminho_membro_zip
+from app.services.processing_service import processar_lote
+
+MEMBROS = ['p/cv0.docx', 'p/cv1.docx', 'p/cv2.docx']
+
+def _docx(texto):
+    documento = Document()
+    documento.add_paragraph(texto)
+    conteudo = io.BytesIO()
+    documento.save(conteudo)
+    return conteudo.getvalue()
+
+@pytest.fixture
+def ia_simulada(monkeypatch):
+    """Extração de dados sem chamar a IA; registra os textos enviados."""
+    textos = []
+
+    def extrair_dados_com_ia(texto_cv):
+        textos.append(texto_cv)
+        return {'nome_completo': texto_cv.strip()}, "Dados extraídos com sucesso.", False
+
+    monkeypatch.setattr(processing_service, 'extrair_dados_com_ia', extrair_dados_com_ia)
+    monkeypatch.setattr(processing_service, 'extrair_dados_em_lote', lambda itens: ({}, "Extração agrupada indisponível.", False))
+    return textos
+
+@pytest.mark.parametrize('em_memoria', [True, False])
+def test_retomada_registra_so_os_membros_que_faltam(app, contexto, ia_simulada, em_memoria):
+    app.config.update(EXTRAIR_ZIP_EM_MEMORIA=em_memoria, CACHE_ANALISES_ATIVO=False)
+    batch_id = 'lote-retomado'
+    batch_folder = os.path.join(app.config['UPLOAD_FOLDER'], batch_id)
+    os.makedirs(batch_folder)
+    zip_path = os.path.join(batch_folder, 'cvs.zip')
+    with zipfile.ZipFile(zip_path, 'w') as arquivo_zip:
+        for i, membro in enumerate(MEMBROS):
+            arquivo_zip.writestr(membro, _docx(f"CV numero {i}"))
+
+    BatchModel.create(batch_id, status='processando', flags_json='{}')
+    FileModel.create(batch_id, 'cvs.zip', zip_path, 0)
+
+    # Execução anterior interrompida: 2 dos 3 membros registrados, e só o primeiro analisado
+    pasta_anterior = os.path.join(batch_folder, 'zip_extract_cvs.zip_antiga1')
+    file_ids = []
+    for i, membro in enumerate(MEMBROS[:2]):
+        if em_memoria:
+            caminho = montar_caminho_membro_zip(zip_path, membro)
+        else:
+            caminho = os.path.join(pasta_anterior, membro)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'wb') as arquivo:
+                arquivo.write(_docx(f"CV numero {i}"))
+        file_ids.append(FileModel.create(batch_id, os.path.basename(membro), caminho, 1))
+    ResultModel.create(file_ids[0], batch_id, 'Sucesso', data_json={'nome_completo': 'CV numero 0'}, texto_completo='CV numero 0')
+
+    eventos = list(processar_lote(batch_id))
+
+    assert eventos[-1]['type'] == 'batch_done'
+    arquivos = get_db().execute(
+        "SELECT file_id, original_name FROM files WHERE batch_id = ? AND is_extracted_from_zip = 1 ORDER BY file_id", (batch_id,)
+    ).fetchall()
+    assert [row['original_name'] for row in arquivos] == ['cv0.docx', 'cv1.docx', 'cv2.docx']
+    assert [row['file_id'] for row in arquivos][:2] == file_ids
+    resultados = get_db().execute(
+        "SELECT file_id, COUNT(*) AS n FROM results WHERE batch_id = ? GROUP BY file_id", (batch_id,)
+    ).fetchall()
+    assert {row['file_id']: row['n'] for row in resultados} == {row['file_id']: 1 for row in arquivos}
+    # O CV já analisado não volta para a IA
+    assert sorted(texto.strip() for texto in ia_simulada) == ['CV numero 1', 'CV numero 2']
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from app.database.models import BatchModel, FileModel, ResultModel
+from app.database.search_index import montar_consulta_fts, radical
+
+def _criar_resultado(batch_id, nome_arquivo, dados, texto):
+    file_id = FileModel.create(batch_id, nome_arquivo, f"/tmp/{nome_arquivo}")
+    return ResultModel.create(file_id, batch_id, 'Sucesso', data_json=dados, texto_completo=texto)
+
+def test_radical_aproxima_flexoes():
+    assert radical('desenvolvedor') == radical('desenvolvedora') == radical('desenvolvimento')
+    assert radical('gerencia') == radical('gerente')
+    assert radical('gestao') == radical('gestor')
+    # Termos curtos ou sem sufixo conhecido ficam como estão
+    assert radical('java') == 'java'
+    assert radical('python') == 'python'
+
+def test_montar_consulta_fts():
+    assert montar_consulta_fts('Gerência  "Python"') == '"gere"* "python"*'
+    assert montar_consulta_fts('  ') is None
+
+def test_busca_encontra_flexoes(contexto):
+    BatchModel.create('lote')
+    _criar_resultado('lote', 'ana.pdf', {'nome_completo': 'Ana'}, "Desenvolvedora Python")
+    _criar_resultado('lote', 'bruno.pdf', {'nome_completo': 'Bruno'}, "Gerente de projetos")
+
+    total, resultados = ResultModel.search(montar_consulta_fts('desenvolvedor'))
+    assert total == 1 and resultados[0]['nome'] == 'Ana'
+    total, resultados = ResultModel.search(montar_consulta_fts('gerência'))
+    assert total == 1 and resultados[0]['nome'] == 'Bruno'
+
+def test_busca_ordena_por_relevancia_e_pagina(contexto):
+    BatchModel.create('lote')
+    BatchModel.create('outro')
+    # Habilidades pesam mais que o texto; repetições no texto aumentam a relevância
+    _criar_resultado('lote', 'texto1.pdf', {'nome_completo': 'Texto Um'}, "Trabalhou com python. " + "Outras tarefas. " * 20)
+    _criar_resultado('lote', 'habilidade.pdf', {'nome_completo': 'Habilidade', 'habilidades_tecnicas': ['Python', 'SQL']}, "Analista.")
+    _criar_resultado('lote', 'texto3.pdf', {'nome_completo': 'Texto Tres'}, "Python, python e python. " + "Outras tarefas. " * 20)
+    _criar_resultado('outro', 'outro.pdf', {'nome_completo': 'Outro Lote', 'habilidades_tecnicas': ['Python']}, "Python.")
+    _criar_resultado('lote', 'sem.pdf', {'nome_completo': 'Sem Java'}, "Java.")
+
+    total, resultados = ResultModel.search(montar_consulta_fts('python'), 'lote', 2, 0)
+    assert total == 3
+    assert [r['nome'] for r in resultados] == ['Habilidade', 'Texto Tres']
+    assert resultados[0]['score'] >= resultados[1]['score']
+    total, resultados = ResultModel.search(montar_consulta_fts('python'), 'lote', 2, 2)
+    assert total == 3
+    assert [r['nome'] for r in resultados] == ['Texto Um']
+
+    total, resultados = ResultModel.search(montar_consulta_fts('python'))
+    assert total == 4
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import json
+import pytest
+from app.database.db_manager import close_connection, get_db
+from app.database.models import BatchModel
+from app.routes import api_routes
+
+class ExecutorSimulado:
+    def notificar(self):
+        pass
+
+@pytest.fixture
+def cliente(app, monkeypatch):
+    app.register_blueprint(api_routes.api_bp, url_prefix='/api')
+    app.teardown_appcontext(close_connection)
+    monkeypatch.setattr(api_routes, 'obter_job_runner', lambda: ExecutorSimulado())
+    return app.test_client()
+
+def _eventos(resposta):
+    return [json.loads(linha[len('data: '):]) for linha in resposta.get_data(as_text=True).splitlines() if linha.startswith('data: ')]
+
+def test_lote_inexistente(cliente):
+    assert _eventos(cliente.get('/api/stream-processing/nao-existe')) == [{'type': 'error', 'message': 'ID de lote inválido.'}]
+
+def test_lote_removido_durante_o_acompanhamento(app, cliente, monkeypatch):
+    with app.app_context():
+        BatchModel.create('lote', status='na_fila')
+    get_batch_info = BatchModel.get_batch_info
+
+    def remover_e_consultar(batch_id):
+        # A primeira consulta (início do acompanhamento) encontra o lote; depois ele é removido
+        info = get_batch_info(batch_id)
+        get_db().execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+        get_db().commit()
+        return info
+
+    monkeypatch.setattr(BatchModel, 'get_batch_info', staticmethod(remover_e_consultar))
+    resposta = cliente.get('/api/stream-processing/lote')
+    assert _eventos(resposta) == [{'type': 'error', 'message': 'Lote não encontrado.'}]
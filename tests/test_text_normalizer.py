@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from app.services.text_normalizer import normalizar_partes
+
+CABECALHO = "Ana Souza\nana.souza@email.com | (11) 98765-4321"
+
+def _paginas():
+    return [
+        f"{CABECALHO}\nResumo\nDesenvolvedora com experiência em desenvol-\nvimento web.\nPágina 1 de 3",
+        f"{CABECALHO}\nExperiência\nProjeto 1: API em Flask\n2",
+        f"{CABECALHO}\nFormação\nPós-graduação em dados, pós-\ngraduação concluída em 2020.\n- 3 -",
+    ]
+
+def test_mantem_uma_parte_por_pagina():
+    assert len(normalizar_partes(_paginas())) == 3
+
+def test_cabecalho_com_contato_e_mantido_uma_vez():
+    paginas = normalizar_partes(_paginas())
+    texto = "\n".join(paginas)
+    assert texto.count("ana.souza@email.com | (11) 98765-4321") == 1
+    assert texto.count("Ana Souza") == 1
+    assert paginas[0].startswith("Ana Souza\nana.souza@email.com")
+
+def test_remove_numeros_de_pagina():
+    paginas = normalizar_partes(_paginas())
+    assert "Página 1 de 3" not in paginas[0]
+    assert not paginas[1].endswith("2")
+    assert "- 3 -" not in paginas[2]
+    assert "Projeto 1: API em Flask" in paginas[1]
+
+def test_junta_hifenizacao():
+    paginas = normalizar_partes(_paginas())
+    assert "desenvolvimento\nweb." in paginas[0]
+    assert "pós-graduação\nconcluída" in paginas[2]
+
+def test_hifen_de_palavra_composta_com_maiuscula_e_mantido():
+    assert normalizar_partes(["Back-\nEnd e Front-\nEnd"], paginado=False) == ["Back-\nEnd e Front-\nEnd"]
+
+def test_docx_nao_remove_linhas_curtas_numericas():
+    assert normalizar_partes(["Ana Souza", "2", "Ana Souza"], paginado=False) == ["Ana Souza", "2", "Ana Souza"]
+
+def test_boilerplate_e_linhas_duplicadas():
+    assert normalizar_partes(["Currículo gerado por SiteX em 01/02\nPython\nPython\n\n\n\nSQL"], paginado=False) == ["Python\n\nSQL"]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import pytest
+from app.services.rate_limiter import estimar_tokens
+from app.services.token_budget import (AVISO_TEXTO_CORTADO, MARCADOR_TEXTO, OrcamentoPrompt, compactar_texto,
+                                       cortar_para_tokens, encaixar_no_prompt)
+
+TEXTO_LONGO = "\n".join(f"Linha {i}: experiência com Python, SQL e Flask em projetos de dados." for i in range(200))
+
+def test_compactar_texto():
+    texto = "Ana  Souza​ \r\n-----\n\n\n\nPython\t\tSQL  "
+    assert compactar_texto(texto) == "Ana Souza\n\nPython SQL"
+
+def test_texto_curto_nao_e_cortado():
+    assert cortar_para_tokens("Ana Souza", 100) == "Ana Souza"
+    assert cortar_para_tokens(None, 100) == ""
+
+@pytest.mark.parametrize("max_tokens", [50, 200, 1000])
+def test_cortar_para_tokens_respeita_o_limite(max_tokens):
+    cortado = cortar_para_tokens(TEXTO_LONGO, max_tokens)
+    assert estimar_tokens(cortado) <= max_tokens
+    assert cortado.endswith(AVISO_TEXTO_CORTADO)
+    assert TEXTO_LONGO.startswith(cortado[:-len(AVISO_TEXTO_CORTADO)])
+
+def test_limite_menor_que_o_aviso():
+    assert cortar_para_tokens(TEXTO_LONGO, 1) == ""
+
+def test_orcamento_desconta_partes_reservadas():
+    orcamento = OrcamentoPrompt(total_tokens=300).reservar("x" * 400)
+    encaixado = orcamento.encaixar(TEXTO_LONGO)
+    assert estimar_tokens(encaixado) <= 300 - estimar_tokens("x" * 400)
+    assert orcamento.usado <= orcamento.total
+
+def test_encaixar_no_prompt_substitui_o_marcador():
+    prompt = encaixar_no_prompt(f"Analise o CV:\n{MARCADOR_TEXTO}\nFim.", "Ana   Souza", max_tokens=100)
+    assert prompt == "Analise o CV:\nAna Souza\nFim."